@@ -1,9 +1,36 @@
-from flask import Flask, render_template, request, redirect, url_for, session
+from flask import (
+    Flask, Response, g, has_app_context, make_response, render_template, request, redirect,
+    url_for, session, stream_with_context,
+    before_render_template, template_rendered,
+)
 from babel.numbers import format_currency
-
-from datetime import date, timedelta
+from markupsafe import Markup
+from werkzeug.http import is_resource_modified
+import click
+
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait as esperar_futuros
+from datetime import date, datetime, timedelta, timezone
+from decimal import ROUND_HALF_EVEN, Decimal
+from functools import partial
+from itertools import chain, islice
+import bisect
+import contextvars
+import copy
+import csv
+import hashlib
+import heapq
+import io
 import os
 import json
+import re
+import sys
+import threading
+import time
+import unicodedata
+import zipfile
+
+import instantanea as columnar
 
 import firebase_admin
 from firebase_admin import credentials, firestore
@@ -40,9 +67,29 @@ CATEGORIAS_INGRESO = [
 
 
 # Función para formatear moneda COP
+#
+# Da lo mismo que format_currency(valor, 'COP', locale='es_CO') de Babel
+# ("$1.234,50", "-$1,00") sin interpretar el patrón del locale en cada
+# llamada: Decimal(str(valor)) redondeado a centavos con ROUND_HALF_EVEN,
+# miles con punto y decimales con coma, como hace Babel. Lo que no es un
+# int / float / Decimal finito (NaN, infinitos, textos) sigue yendo por Babel.
+CENTAVO = Decimal("0.01")
+
+
 def formatear_cop(valor):
     if valor is None:
         valor = 0
+    if type(valor) in (int, float, Decimal):
+        try:
+            numero = valor if type(valor) is Decimal else Decimal(str(valor))
+            if numero.is_finite():
+                signo = "-" if numero.is_signed() else ""
+                centavos = abs(numero).quantize(CENTAVO, rounding=ROUND_HALF_EVEN)
+                entero, decimales = f"{centavos:f}".split(".")
+                miles = f"{int(entero):,}".replace(",", ".")
+                return f"{signo}${miles},{decimales}"
+        except ArithmeticError:
+            pass  # más dígitos de los que aguanta Decimal: que decida Babel
     try:
         return format_currency(valor, 'COP', locale='es_CO')
     except Exception:
@@ -59,11 +106,18 @@ def obtener_saldo_inicial_dia(total_cuentas):
 
     saldo_inicial = total_cuentas  # por defecto, si es el primer día
 
-    # Buscar el saldo final de ayer
-    doc_ayer = db.collection("saldos_diarios").document(ayer.isoformat()).get()
-    if doc_ayer.exists:
-        datos_ayer = doc_ayer.to_dict()
-        saldo_inicial = datos_ayer.get("saldo_final", total_cuentas)
+    # Con el libro local, el saldo al cierre de ayer sale del índice de saldos
+    libro = libro_al_dia()
+    saldo_ayer = libro.saldos().saldo_al(ayer.isoformat()) if libro is not None else None
+
+    if saldo_ayer is not None:
+        saldo_inicial = saldo_ayer
+    else:
+        # Buscar el saldo final de ayer
+        doc_ayer = lector().documento(db.collection("saldos_diarios").document(ayer.isoformat()))
+        if doc_ayer is not None and doc_ayer.exists:
+            datos_ayer = doc_ayer.to_dict()
+            saldo_inicial = datos_ayer.get("saldo_final", total_cuentas)
 
     # Actualizar / crear el documento de hoy
     db.collection("saldos_diarios").document(hoy.isoformat()).set(
@@ -80,707 +134,3995 @@ def obtener_saldo_inicial_dia(total_cuentas):
 # ---- Inicializar Firebase (Render + local) ----
 firebase_cert = os.getenv("FIREBASE_CREDENTIALS")
 
-if not firebase_admin._apps:
-    try:
-        if firebase_cert:
-            # Viene como JSON en una variable de entorno (Render)
-            cred_info = json.loads(firebase_cert)
-            cred = credentials.Certificate(cred_info)
-            firebase_admin.initialize_app(cred)
-        elif os.path.exists("finanzas-deiner-firebase-adminsdk-fbsvc-9d70b13e78.json"):
-            # Modo local con archivo físico
-            cred = credentials.Certificate(
-                "finanzas-deiner-firebase-adminsdk-fbsvc-9d70b13e78.json"
+# FINANZAS_DB elige dónde se guardan los datos; todas las opciones hablan la
+# API de Firestore, así el resto de la app no cambia:
+#   memoria → en memoria (benchmarks / pruebas locales)
+#   sqlite  → archivo SQLite local con índices (FINANZAS_SQLITE, por defecto
+#             finanzas.sqlite3); los reportes se agrupan en SQL
+#   (vacío) → Firestore
+if os.getenv("FINANZAS_DB") == "memoria":
+    from firestore_memoria import ClienteMemoria, transactional as transaccional
+
+    db = ClienteMemoria()
+elif os.getenv("FINANZAS_DB") == "sqlite":
+    from firestore_sqlite import ClienteSQLite, transactional as transaccional
+
+    db = ClienteSQLite(os.getenv("FINANZAS_SQLITE", "finanzas.sqlite3"))
+else:
+    if not firebase_admin._apps:
+        try:
+            if firebase_cert:
+                # Viene como JSON en una variable de entorno (Render)
+                cred_info = json.loads(firebase_cert)
+                cred = credentials.Certificate(cred_info)
+                firebase_admin.initialize_app(cred)
+            elif os.path.exists("finanzas-deiner-firebase-adminsdk-fbsvc-9d70b13e78.json"):
+                # Modo local con archivo físico
+                cred = credentials.Certificate(
+                    "finanzas-deiner-firebase-adminsdk-fbsvc-9d70b13e78.json"
+                )
+                firebase_admin.initialize_app(cred)
+            else:
+                raise RuntimeError(
+                    "No encontré ni FIREBASE_CREDENTIALS ni el archivo de credenciales."
+                )
+        except Exception as e:
+            print("ERROR al inicializar Firebase:", e)
+            raise
+
+    db = firestore.client()
+    transaccional = firestore.transactional
+
+# ----------- MÉTRICAS POR RUTA (/metrics) -----------
+# Todo lo que pasa por `db` se mide: documentos leídos y escritos y el
+# tiempo esperando a Firestore. Con eso, cada request queda repartida en
+# Firestore / cálculo / plantilla (Jinja) y se publica en /metrics en
+# formato Prometheus (con sesión iniciada; la ruta está junto al login).
+
+# Llamadas que arman consultas o referencias: el resultado también se mide
+_CONSTRUCTORES = {
+    "collection", "collection_group", "document", "where", "order_by", "limit",
+    "limit_to_last", "offset", "select", "start_at", "start_after", "end_at",
+    "end_before", "sum", "count", "avg", "batch", "transaction",
+}
+_ESCRITURAS = {"set", "update", "delete", "create", "add"}
+
+# FINANZAS_PETICION_LENTA_MS: las requests más lentas que esto se registran
+# en el log con la lista de consultas (sin la variable, no se registra nada)
+PETICION_LENTA_MS = float(os.getenv("FINANZAS_PETICION_LENTA_MS", "0"))
+
+
+class MedicionPeticion:
+    """Lo que hizo una request: tiempos, documentos y las consultas en orden."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hilo = threading.get_ident()
+        self.inicio = time.perf_counter()
+        self.firestore = 0.0  # segundos que el hilo de la request esperó a Firestore
+        self.plantilla = 0.0
+        self._plantillas = []
+        self.lecturas = 0
+        self.escrituras = 0
+        self.consultas = []  # (origen, operación, documentos, segundos); ver _describir()
+
+    def anotar(self, origen, operacion, lecturas, escrituras, segundos):
+        with self._lock:
+            self.lecturas += lecturas
+            self.escrituras += escrituras
+            self.consultas.append((origen, operacion, lecturas or escrituras, segundos))
+        if threading.get_ident() == self.hilo:
+            self.firestore += segundos
+
+    def esperar(self, segundos):
+        """El hilo de la request esperó a consultas lanzadas en otros hilos (en_paralelo)."""
+        if threading.get_ident() == self.hilo:
+            self.firestore += segundos
+
+
+def medicion_actual():
+    if not has_app_context():
+        return None
+    return g.get("medicion")
+
+
+def _describir(origen):
+    """Texto de una consulta a partir de cómo se armó: transacciones.where(...).limit(5)."""
+    if isinstance(origen, str):
+        return origen
+    if isinstance(origen, FirestoreMedido):
+        origen = origen._origen
+    if origen is None:
+        return "db"
+    padre, nombre, args, kwargs = origen
+    if nombre == "collection":
+        if padre._origen is None:
+            return str(args[0])
+        return f"{_describir(padre._origen)}/{args[0]}"
+    if nombre == "document":
+        return f"{_describir(padre._origen)}/{args[0] if args else '(nuevo)'}"
+    partes = [repr(a)[:60] for a in args] + [f"{k}={v!r}"[:60] for k, v in kwargs.items()]
+    return f"{_describir(padre._origen)}.{nombre}({', '.join(partes)})"
+
+
+def _desenvolver(valor):
+    if isinstance(valor, FirestoreMedido):
+        return valor._objeto
+    if isinstance(valor, (list, tuple)):
+        return type(valor)(_desenvolver(v) for v in valor)
+    return valor
+
+
+class FirestoreMedido:
+    """
+    Envuelve el cliente de Firestore (y las colecciones, consultas,
+    referencias y lotes que salen de él) para contar documentos y medir
+    el tiempo de cada viaje. Lo que se le pasa a Firestore como argumento
+    se desenvuelve antes, así la librería solo ve sus propios objetos.
+    """
+
+    __slots__ = ("_objeto", "_origen", "_lote")
+
+    def __init__(self, objeto, origen=None, lote=False):
+        object.__setattr__(self, "_objeto", objeto)
+        object.__setattr__(self, "_origen", origen)
+        object.__setattr__(self, "_lote", lote)
+
+    def __getattr__(self, nombre):
+        valor = getattr(self._objeto, nombre)
+        if not callable(valor) or nombre.startswith("_"):
+            return valor
+
+        def llamar(*args, **kwargs):
+            return self._llamar(nombre, valor, args, kwargs)
+
+        return llamar
+
+    def __setattr__(self, nombre, valor):
+        setattr(self._objeto, nombre, valor)
+
+    def __len__(self):
+        return len(self._objeto)
+
+    def __repr__(self):
+        return f"<{_describir(self._origen)}>"
+
+    def _llamar(self, nombre, metodo, args, kwargs):
+        args = [_desenvolver(a) for a in args]
+        kwargs = {k: _desenvolver(v) for k, v in kwargs.items()}
+
+        if nombre in _CONSTRUCTORES:
+            resultado = metodo(*args, **kwargs)
+            return FirestoreMedido(
+                resultado, (self, nombre, args, kwargs), lote=nombre in ("batch", "transaction")
             )
-            firebase_admin.initialize_app(cred)
+        if nombre == "stream":
+            return self._flujo(nombre, metodo(*args, **kwargs), self)
+        if nombre == "get_all":
+            referencias = list(args[0]) if args else []
+            args[:1] = [referencias]
+            rutas = ", ".join(getattr(r, "path", "?") for r in referencias[:5])
+            origen = f"{rutas}{', …' if len(referencias) > 5 else ''} ({len(referencias)} referencias)"
+            return self._flujo(nombre, metodo(*args, **kwargs), origen)
+        if nombre in _ESCRITURAS and self._lote:
+            # En un lote o transacción no hay viaje: se manda en el commit
+            contar_documentos(0, 1)
+            medicion = medicion_actual()
+            if medicion is not None:
+                medicion.anotar(self, nombre, 0, 1, 0.0)
+            return metodo(*args, **kwargs)
+        if nombre not in ("get", "agrupar", "commit") and nombre not in _ESCRITURAS:
+            return metodo(*args, **kwargs)
+
+        inicio = time.perf_counter()
+        resultado = metodo(*args, **kwargs)
+        segundos = time.perf_counter() - inicio
+        if nombre in ("get", "agrupar"):
+            documentos = len(resultado) if isinstance(resultado, list) and resultado and hasattr(resultado[0], "to_dict") else 1
+            lecturas, escrituras = documentos, 0
         else:
-            raise RuntimeError(
-                "No encontré ni FIREBASE_CREDENTIALS ni el archivo de credenciales."
+            lecturas, escrituras = 0, 0 if nombre == "commit" else 1
+        contar_documentos(lecturas, escrituras)
+        medicion = medicion_actual()
+        if medicion is not None:
+            medicion.anotar(self, nombre, lecturas, escrituras, segundos)
+        return resultado
+
+    def _flujo(self, nombre, documentos, origen):
+        """stream()/get_all(): mide solo lo que tarda cada siguiente documento."""
+        medicion = medicion_actual()
+        leidos = 0
+        segundos = 0.0
+        iterador = iter(documentos)
+        try:
+            while True:
+                inicio = time.perf_counter()
+                try:
+                    doc = next(iterador)
+                except StopIteration:
+                    segundos += time.perf_counter() - inicio
+                    return
+                segundos += time.perf_counter() - inicio
+                leidos += 1
+                yield doc
+        finally:
+            lecturas = leidos if nombre == "get_all" else max(leidos, 1)
+            contar_documentos(lecturas, 0)
+            if medicion is not None:
+                medicion.anotar(origen, nombre, lecturas, 0, segundos)
+
+
+def medir_transaccional(transaccional_base):
+    """
+    El decorador de transacciones recibe la transacción sin envolver (es
+    de la librería); la función decorada la recibe envuelta, para contar
+    sus lecturas y escrituras.
+    """
+    def decorador(funcion):
+        interna = transaccional_base(
+            lambda transaction, *args, **kwargs: funcion(
+                FirestoreMedido(transaction, (db, "transaction", [], {}), lote=True), *args, **kwargs
             )
-    except Exception as e:
-        print("ERROR al inicializar Firebase:", e)
-        raise
+        )
+
+        def llamar(transaction, *args, **kwargs):
+            return interna(_desenvolver(transaction), *args, **kwargs)
+
+        llamar.__name__ = funcion.__name__
+        llamar.__doc__ = funcion.__doc__
+        return llamar
+
+    return decorador
+
+
+db = FirestoreMedido(db)
+transaccional = medir_transaccional(transaccional)
+
+
+class Histograma:
+    """Histograma de Prometheus con etiquetas (buckets acumulados al exportar)."""
+
+    def __init__(self, nombre, ayuda, limites):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.limites = limites
+        self._lock = threading.Lock()
+        self._series = {}  # etiquetas -> [conteos por bucket, suma, total]
+
+    def observar(self, valor, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [[0] * len(self.limites), 0.0, 0]
+            posicion = bisect.bisect_left(self.limites, valor)
+            if posicion < len(self.limites):
+                serie[0][posicion] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exportar(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            series = sorted((clave, [list(s[0]), s[1], s[2]]) for clave, s in self._series.items())
+        for clave, (conteos, suma, total) in series:
+            etiquetas = ",".join(f'{k}="{v}"' for k, v in clave)
+            acumulado = 0
+            for limite, conteo in zip(self.limites, conteos):
+                acumulado += conteo
+                lineas.append(f'{self.nombre}_bucket{{{etiquetas},le="{limite:g}"}} {acumulado}')
+            lineas.append(f'{self.nombre}_bucket{{{etiquetas},le="+Inf"}} {total}')
+            lineas.append(f"{self.nombre}_sum{{{etiquetas}}} {suma:.6g}")
+            lineas.append(f"{self.nombre}_count{{{etiquetas}}} {total}")
+        return lineas
+
+
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LIMITES_DOCUMENTOS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 100000)
+
+metrica_segundos = Histograma(
+    "finanzas_peticion_segundos",
+    "Duración de cada request por ruta, total y repartida en firestore / calculo / plantilla.",
+    LIMITES_SEGUNDOS,
+)
+metrica_lecturas = Histograma(
+    "finanzas_peticion_lecturas", "Documentos de Firestore leídos por request.", LIMITES_DOCUMENTOS
+)
+metrica_escrituras = Histograma(
+    "finanzas_peticion_escrituras", "Documentos de Firestore escritos por request.", LIMITES_DOCUMENTOS
+)
+_documentos_totales = {"lecturas": 0, "escrituras": 0}  # también fuera de requests
+_lock_documentos = threading.Lock()
+
+
+def contar_documentos(lecturas, escrituras):
+    with _lock_documentos:
+        _documentos_totales["lecturas"] += lecturas
+        _documentos_totales["escrituras"] += escrituras
+
+
+@app.before_request
+def iniciar_medicion():
+    g.medicion = MedicionPeticion()
+
+
+@before_render_template.connect_via(app)
+def _empieza_plantilla(sender, template, context, **extra):
+    medicion = medicion_actual()
+    if medicion is not None:
+        medicion._plantillas.append(time.perf_counter())
+
+
+@template_rendered.connect_via(app)
+def _termina_plantilla(sender, template, context, **extra):
+    medicion = medicion_actual()
+    if medicion is not None and medicion._plantillas:
+        inicio = medicion._plantillas.pop()
+        if not medicion._plantillas:  # las anidadas ya están dentro de la de afuera
+            medicion.plantilla += time.perf_counter() - inicio
+
+
+@app.teardown_request
+def registrar_medicion(error=None):
+    if g.pop("cuerpo_pendiente", False):
+        # Respuesta con stream_with_context: la request se cierra otra vez
+        # cuando termina de enviarse el cuerpo, y ahí se registra completa
+        return
+    medicion = g.pop("medicion", None)
+    if medicion is None or request.endpoint == "static":
+        return
+    total = time.perf_counter() - medicion.inicio
+    calculo = max(total - medicion.firestore - medicion.plantilla, 0.0)
+    ruta = request.endpoint or "sin_ruta"
+
+    for parte, segundos in (
+        ("total", total), ("firestore", medicion.firestore),
+        ("calculo", calculo), ("plantilla", medicion.plantilla),
+    ):
+        metrica_segundos.observar(segundos, ruta=ruta, parte=parte)
+    metrica_lecturas.observar(medicion.lecturas, ruta=ruta)
+    metrica_escrituras.observar(medicion.escrituras, ruta=ruta)
+
+    if PETICION_LENTA_MS and total * 1000 >= PETICION_LENTA_MS:
+        lineas = [
+            f"Request lenta {request.method} {request.full_path.rstrip('?')} ({ruta}): "
+            f"{total * 1000:.1f} ms = firestore {medicion.firestore * 1000:.1f} + "
+            f"cálculo {calculo * 1000:.1f} + plantilla {medicion.plantilla * 1000:.1f}; "
+            f"{medicion.lecturas} lecturas, {medicion.escrituras} escrituras"
+        ]
+        for origen, operacion, documentos, segundos in medicion.consultas:
+            lineas.append(
+                f"  {segundos * 1000:8.1f} ms {documentos:7d} docs  {operacion} {_describir(origen)}"
+            )
+        app.logger.warning("\n".join(lineas))
+
 
-db = firestore.client()
 # Referencia al documento donde llevamos el contador de transacciones
 contador_trans_ref = db.collection("config").document("transacciones")
 
 
-@firestore.transactional
-def obtener_siguiente_id_transaccion(transaction):
+@transaccional
+def reservar_bloque_ids(transaction, cantidad):
+    """
+    Reserva `cantidad` ids consecutivos en config/transacciones dentro de una
+    transacción de Firestore (para las importaciones, un bloque por lote).
+    Devuelve (primero, ultimo).
+
+    Las altas sueltas no reservan bloques: toman su id dentro de su propia
+    transacción (_guardar_alta), así los ids siguen el orden en que se
+    confirman y el mayor id es la transacción más reciente.
+    """
     snapshot = contador_trans_ref.get(transaction=transaction)
+    lector().contar(1)
 
     if snapshot.exists:
         actual = snapshot.get("contador") or 0
     else:
         actual = 0
 
-    nuevo = actual + 1
-    transaction.update(contador_trans_ref, {"contador": nuevo})
-    return nuevo
-
-@app.route("/login", methods=["GET", "POST"])
-def login():
-    error = None
-
-    if request.method == "POST":
-        usuario = request.form.get("usuario")
-        password = request.form.get("password")
-
-        # ------ CREDENCIALES ------
-        if usuario == "deiner" and password == "Deiner88@": 
-            session["logged"] = True
-            return redirect(url_for("home"))
-        else:
-            error = "Usuario o contraseña incorrectos"
+    nuevo = actual + cantidad
+    transaction.set(contador_trans_ref, {"contador": nuevo}, merge=True)
+    return actual + 1, nuevo
 
-    return render_template("login.html", error=error)
 
-from functools import wraps
+# ----------- CACHÉ DE LECTURAS (por proceso) -----------
 
-def login_requerido(f):
-    @wraps(f)
-    def wrapper(*args, **kwargs):
-        if not session.get("logged"):
-            return redirect(url_for("login"))
-        return f(*args, **kwargs)
-    return wrapper
 
-@app.route("/logout")
-def logout():
-    session.clear()
-    return redirect(url_for("login"))
+def _tamano(valor):
+    """Bytes aproximados de un valor, contando lo que hay dentro de listas, tuplas y dicts."""
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(_tamano(k) + _tamano(v) for k, v in valor.items())
+    if isinstance(valor, (list, tuple)):
+        return sys.getsizeof(valor) + sum(_tamano(v) for v in valor)
+    return sys.getsizeof(valor)
 
 
-@app.route("/")
-@login_requerido
-def home():
-    # -------- 1) SALDO GLOBAL ACTUAL --------
-    ult_docs = (
-        db.collection("transacciones")
-        .order_by("id_transaccion", direction=firestore.Query.DESCENDING)
-        .limit(1)
-        .stream()
-    )
+class CacheLectura:
+    """
+    Caché LRU por proceso (cada worker de gunicorn tiene la suya), con tope
+    de entradas y, opcionalmente, TTL y tope de memoria. Hay dos:
+
+      - cache_lecturas: lecturas pequeñas y repetidas de Firestore (cuentas,
+        última transacción, saldos_diarios, resumen_meses). Las escrituras
+        de este proceso la invalidan al momento; las de otros workers se ven
+        cuando vence el TTL.
+      - fragmentos_html: HTML ya renderizado de las tablas grandes, sin TTL
+        y con tope en bytes (ver CACHÉ DE FRAGMENTOS HTML).
+
+    Con copiar=True se guardan y devuelven copias, para que quien lee
+    pueda modificar lo que recibe.
+    """
 
-    total_global = 0
-    for d in ult_docs:
-        total_global = d.to_dict().get("saldo_final", 0)
+    def __init__(self, max_entradas=256, ttl=30, max_bytes=None, copiar=True):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.copiar = copiar
+        self.bytes = 0
+        self._datos = OrderedDict()  # clave -> (expira_en, valor, bytes)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self.invalidaciones = 0
+        self.version = 0  # sube con cada invalidar(), para LectorPeticion
+
+    def _copia(self, valor):
+        return copy.deepcopy(valor) if self.copiar else valor
+
+    def obtener(self, clave, cargar=None):
+        """
+        Devuelve el valor en caché o lo carga con `cargar()` y lo guarda; sin
+        `cargar`, None si no está.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is not None and (item[0] is None or item[0] > ahora):
+                self._datos.move_to_end(clave)
+                self.aciertos += 1
+                return self._copia(item[1])
+            self.fallos += 1
+
+        if cargar is None:
+            return None
+        valor = cargar()
+        self.poner(clave, valor)
+        return self._copia(valor)
+
+    def poner(self, clave, valor):
+        """Guarda el valor; con max_bytes, uno más grande que el tope no se guarda."""
+        tamano = _tamano(valor) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and tamano > self.max_bytes:
+            return
+        expira = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            anterior = self._datos.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= anterior[2]
+            self._datos[clave] = (expira, self._copia(valor), tamano)
+            self.bytes += tamano
+            while len(self._datos) > self.max_entradas or (
+                self.max_bytes is not None and self.bytes > self.max_bytes
+            ):
+                _, (_, _, liberados) = self._datos.popitem(last=False)
+                self.bytes -= liberados
+                self.expulsiones += 1
+
+    def invalidar(self, *claves):
+        """
+        Borra entradas de la caché. Cada argumento puede ser una clave exacta
+        (tupla) o el nombre de un grupo (str) para borrar todas sus claves.
+        """
+        grupos = {c for c in claves if isinstance(c, str)}
+        exactas = {c for c in claves if isinstance(c, tuple)}
+        with self._lock:
+            self.version += 1
+            for clave in list(self._datos):
+                if clave in exactas or clave[0] in grupos:
+                    self.bytes -= self._datos.pop(clave)[2]
+                    self.invalidaciones += 1
+
+    def vaciar(self):
+        """Borra todas las entradas."""
+        with self._lock:
+            self.version += 1
+            self._datos.clear()
+            self.bytes = 0
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.aciertos + self.fallos
+            datos = {
+                "pid": os.getpid(),
+                "entradas": len(self._datos),
+                "max_entradas": self.max_entradas,
+                "ttl": self.ttl,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / total, 3) if total else 0.0,
+                "expulsiones": self.expulsiones,
+                "invalidaciones": self.invalidaciones,
+            }
+            if self.max_bytes is not None:
+                datos["bytes"] = self.bytes
+                datos["max_bytes"] = self.max_bytes
+            return datos
 
-    # Si no hay transacciones aún → suma de saldos de las cuentas
-    if total_global == 0:
-        cuentas_docs_tmp = db.collection("cuentas").stream()
-        total_global = sum(c.to_dict().get("saldo_inicial", 0) for c in cuentas_docs_tmp)
 
-    # -------- 2) RESUMEN DEL DÍA --------
-    hoy_date = date.today()
-    hoy = hoy_date.isoformat()
+# Hilos compartidos para lanzar consultas independientes a la vez
+pool_consultas = ThreadPoolExecutor(
+    max_workers=int(os.getenv("FINANZAS_HILOS_CONSULTAS", "16")),
+    thread_name_prefix="consultas",
+)
 
-    trans_hoy = (
-        db.collection("transacciones")
-        .where("fecha", "==", hoy)
-        .stream()
-    )
+# Segundos que se espera a un grupo de consultas de en_paralelo()
+LIMITE_CONSULTAS = float(os.getenv("FINANZAS_LIMITE_CONSULTAS", "10"))
 
-    ingresos_hoy = 0.0
-    gastos_hoy = 0.0
 
-    for t in trans_hoy:
-        data = t.to_dict()
-        valor = float(data.get("valor", 0))
-        if valor > 0:
-            ingresos_hoy += valor
-        else:
-            gastos_hoy += abs(valor)
+class ConsultaDemorada(TimeoutError):
+    """Una consulta de en_paralelo() no terminó dentro del límite."""
 
-    diferencia_hoy = ingresos_hoy - gastos_hoy
 
-    # -------- 3) RESUMEN DEL MES ACTUAL --------
-    mes_actual = hoy[:7]  # YYYY-MM
+def _nombre_consulta(funcion, posicion):
+    """Nombre corto para Server-Timing: el de la función, o consultaN si es una lambda."""
+    while isinstance(funcion, partial):
+        funcion = funcion.func
+    nombre = getattr(funcion, "__name__", "")
+    if not nombre or nombre == "<lambda>":
+        return f"consulta{posicion}"
+    return nombre
 
-    trans_mes = db.collection("transacciones").stream()
 
-    ingresos_mes = 0.0
-    gastos_mes = 0.0
+def en_paralelo(*funciones, limite=None):
+    """
+    Ejecuta las funciones (sin argumentos) a la vez y devuelve sus resultados
+    en orden. Corren con el contexto de quien llama, así ven la misma
+    request (flask.g) y sus lecturas se cuentan en ella; lo que tarda cada
+    una queda anotado para la cabecera Server-Timing.
+
+    Si no terminan todas en `limite` segundos (LIMITE_CONSULTAS por
+    defecto) lanza ConsultaDemorada. Llamada desde un hilo del pool las
+    ejecuta en serie, para no quedarse esperando hilos que nunca se liberan.
+    """
+    lector_actual = lector()  # se crea aquí para que todos los hilos usen el mismo
 
-    for t in trans_mes:
-        data = t.to_dict()
-        fecha_t = data.get("fecha")
-        if not fecha_t:
-            continue
+    def cronometrada(funcion, nombre):
+        def ejecutar():
+            inicio = time.perf_counter()
+            try:
+                return funcion()
+            finally:
+                lector_actual.anotar_tiempo(nombre, (time.perf_counter() - inicio) * 1000)
+        return ejecutar
+
+    tareas = [cronometrada(f, _nombre_consulta(f, i)) for i, f in enumerate(funciones, start=1)]
+    if threading.current_thread().name.startswith("consultas"):
+        return [t() for t in tareas]
+
+    limite = LIMITE_CONSULTAS if limite is None else limite
+    inicio = time.perf_counter()
+    futuros = [pool_consultas.submit(contextvars.copy_context().run, t) for t in tareas]
+    _, pendientes = esperar_futuros(futuros, timeout=limite)
+    medicion = medicion_actual()
+    if medicion is not None:
+        medicion.esperar(time.perf_counter() - inicio)
+    if pendientes:
+        for futuro in pendientes:
+            futuro.cancel()
+        nombres = [
+            _nombre_consulta(f, i)
+            for i, (f, futuro) in enumerate(zip(funciones, futuros), start=1)
+            if futuro in pendientes
+        ]
+        raise ConsultaDemorada(f"Sin respuesta de Firestore en {limite:g} s: {', '.join(nombres)}")
+    return [f.result() for f in futuros]
+
+
+cache_lecturas = CacheLectura(
+    max_entradas=int(os.getenv("FINANZAS_CACHE_MAX", "256")),
+    ttl=float(os.getenv("FINANZAS_CACHE_TTL", "30")),
+)
+
+
+# ----------- LECTURAS POR REQUEST (flask.g) -----------
+
+
+class LectorPeticion:
+    """
+    Las lecturas de Firestore de una request. Una consulta con la misma
+    clave se hace una sola vez aunque varias partes de la request la pidan
+    (también a la vez, desde en_paralelo), los documentos sueltos se piden
+    juntos con get_all, y se cuentan los documentos leídos para la cabecera
+    X-Lecturas-Firestore.
+
+    Lo guardado se descarta cuando se invalida la caché de lecturas, es
+    decir, cuando alguien escribió.
+    """
 
-        if fecha_t.startswith(mes_actual):
-            valor = float(data.get("valor", 0))
-            if valor > 0:
-                ingresos_mes += valor
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._guardadas = {}  # clave -> (versión de la caché, Future)
+        self.lecturas = 0
+        self.consultas = 0
+        self.repetidas = 0
+        self.tiempos = []  # (nombre, ms) de lo que corrió en en_paralelo()
+
+    def anotar_tiempo(self, nombre, ms):
+        with self._lock:
+            self.tiempos.append((nombre, ms))
+
+    def contar(self, documentos):
+        """Anota una consulta que devolvió `documentos` (Firestore cobra al menos 1)."""
+        with self._lock:
+            self.lecturas += max(documentos, 1)
+            self.consultas += 1
+
+    def consulta(self, clave, cargar, copiar=True):
+        """
+        Resultado de cargar(), una sola vez por clave en la request. Con
+        copiar=True cada llamada recibe su propia copia, para poder modificarla.
+        """
+        version = cache_lecturas.version
+        with self._lock:
+            guardada = self._guardadas.get(clave)
+            propia = guardada is None or guardada[0] != version
+            if propia:
+                futuro = Future()
+                self._guardadas[clave] = (version, futuro)
             else:
-                gastos_mes += abs(valor)
+                futuro = guardada[1]
+                self.repetidas += 1
 
-    diferencia_mes = ingresos_mes - gastos_mes
+        if propia:
+            try:
+                futuro.set_result(cargar())
+            except Exception as e:
+                with self._lock:
+                    if self._guardadas.get(clave, (None, None))[1] is futuro:
+                        del self._guardadas[clave]
+                futuro.set_exception(e)
+                raise
+        valor = futuro.result()
+        return copy.deepcopy(valor) if copiar else valor
+
+    def recorrer(self, consulta, transaction=None):
+        """Los documentos de consulta.stream(), contándolos (sin guardar nada)."""
+        leidos = 0
+        try:
+            for doc in consulta.stream(transaction=transaction):
+                leidos += 1
+                yield doc
+        finally:
+            self.contar(leidos)
+
+    def documentos(self, referencias):
+        """
+        Snapshots de las referencias, en orden. Las que no se leyeron antes
+        en la request se piden todas juntas en un solo get_all.
+        """
+        referencias = list(referencias)
+        faltan = {}
+        for ref in referencias:
+            clave = ("documento", ref.path)
+            with self._lock:
+                guardada = self._guardadas.get(clave)
+                if guardada is None or guardada[0] != cache_lecturas.version:
+                    faltan.setdefault(ref.path, ref)
+
+        if faltan:
+            leidos = {d.reference.path: d for d in db.get_all(list(faltan.values()))}
+            self.contar(len(leidos))
+            version = cache_lecturas.version
+            with self._lock:
+                for path in faltan:
+                    futuro = Future()
+                    futuro.set_result(leidos.get(path))
+                    self._guardadas[("documento", path)] = (version, futuro)
+        else:
+            with self._lock:
+                self.repetidas += len(referencias)
+
+        with self._lock:
+            return [self._guardadas[("documento", ref.path)][1].result() for ref in referencias]
+
+    def documento(self, referencia):
+        return self.documentos([referencia])[0]
+
+    def en_transaccion(self, transaction, referencia):
+        """
+        Snapshot de `referencia` leído dentro de `transaction`, contado pero
+        sin guardarlo: si la transacción se reintenta, se vuelve a leer.
+        """
+        snapshot = referencia.get(transaction=transaction)
+        self.contar(1)
+        return snapshot
+
+    def documentos_en_transaccion(self, transaction, referencias):
+        """
+        Como en_transaccion() para varias referencias, en un solo get_all
+        dentro de `transaction`. Devuelve los snapshots en el orden pedido.
+        """
+        referencias = list(referencias)
+        leidos = {
+            d.reference.path: d for d in db.get_all(referencias, transaction=transaction)
+        }
+        self.contar(len(leidos))
+        return [leidos[ref.path] for ref in referencias]
+
+
+def lector():
+    """El LectorPeticion de la request actual (uno suelto fuera de Flask)."""
+    if not has_app_context():
+        return LectorPeticion()
+    if "lector" not in g:
+        g.lector = LectorPeticion()
+    return g.lector
+
+
+def leer_en_cache(clave, cargar):
+    """Lectura pequeña: una vez por request y, entre requests, desde la caché del proceso."""
+    return lector().consulta(clave, lambda: cache_lecturas.obtener(clave, cargar))
+
+
+@app.after_request
+def cabecera_lecturas(respuesta):
+    """
+    X-Lecturas-Firestore / X-Consultas-Firestore: lo que leyó esta request.
+    Server-Timing: lo que tardó cada consulta lanzada con en_paralelo().
 
-    # -------- 4) DATOS PARA GRÁFICA MENSUAL (INGRESOS VS GASTOS) --------
-    resumen_diario, _ = calcular_resumen_diario()
+    Las respuestas en streaming (exportaciones) leen mientras se envía el
+    cuerpo, después de esta función: no llevan estas cabeceras, que dirían
+    0. Lo que leen queda en /metrics y en el log de requests lentas.
+    """
+    if respuesta.is_streamed:
+        return respuesta
+    lector_actual = g.get("lector")
+    respuesta.headers["X-Lecturas-Firestore"] = str(lector_actual.lecturas if lector_actual else 0)
+    respuesta.headers["X-Consultas-Firestore"] = str(lector_actual.consultas if lector_actual else 0)
+    if lector_actual is not None and lector_actual.tiempos:
+        respuesta.headers["Server-Timing"] = ", ".join(
+            f"{nombre};dur={ms:.1f}" for nombre, ms in lector_actual.tiempos
+        )
+    return respuesta
 
-    resumen_mes_dict = {}
-    for r in resumen_diario:
-        mes = r["fecha"][:7]  # YYYY-MM
-        if mes not in resumen_mes_dict:
-            resumen_mes_dict[mes] = {"ingresos": 0.0, "gastos": 0.0}
-        resumen_mes_dict[mes]["ingresos"] += r["ingresos"]
-        resumen_mes_dict[mes]["gastos"] += r["gastos"]
 
-    meses_labels = sorted(resumen_mes_dict.keys())
-    ingresos_mes_chart = [resumen_mes_dict[m]["ingresos"] for m in meses_labels]
-    gastos_mes_chart = [resumen_mes_dict[m]["gastos"] for m in meses_labels]
+@app.errorhandler(ConsultaDemorada)
+def consulta_demorada(error):
+    app.logger.warning("%s (%s)", error, request.path)
+    return Response(
+        "Firestore está tardando en responder, intente de nuevo en unos segundos.",
+        status=504,
+        headers={"Retry-After": "5"},
+    )
 
-    meses_labels_json = json.dumps(meses_labels)
-    ingresos_mes_chart_json = json.dumps(ingresos_mes_chart)
-    gastos_mes_chart_json = json.dumps(gastos_mes_chart)
 
-    # -------- 5) GASTOS POR CATEGORÍA (MES ACTUAL) --------
-    from collections import defaultdict
-    gastos_por_categoria = defaultdict(float)
+def leer_cuentas():
+    """Todas las cuentas (con su id de documento)."""
+    if escucha_libro is not None and escucha_libro.listo.is_set():
+        escucha_libro.al_dia("cuentas")
+        return copy.deepcopy(escucha_libro.cuentas)
 
-    trans_mes_cat = db.collection("transacciones").stream()
-    for t in trans_mes_cat:
-        data = t.to_dict()
-        fecha_t = data.get("fecha")
-        if not fecha_t or not fecha_t.startswith(mes_actual):
-            continue
+    def cargar():
+        lista = []
+        for d in lector().recorrer(db.collection("cuentas")):
+            data = d.to_dict()
+            data["id"] = d.id
+            lista.append(data)
+        return lista
 
-        tipo_t = (data.get("tipo", "") or "").lower()
-        if tipo_t != "gasto":
-            continue
+    return leer_en_cache(("cuentas",), cargar)
 
-        categoria = data.get("categoria", "Sin categoría")
-        valor = abs(float(data.get("valor", 0)))
-        gastos_por_categoria[categoria] += valor
 
-    cat_labels = list(gastos_por_categoria.keys())
-    cat_values = list(gastos_por_categoria.values())
+def leer_ultimas_transacciones(cantidad=1):
+    """Las `cantidad` transacciones con mayor id_transaccion."""
+    def cargar():
+        docs = lector().recorrer(
+            db.collection("transacciones")
+            .order_by("id_transaccion", direction=firestore.Query.DESCENDING)
+            .limit(cantidad)
+        )
+        return [d.to_dict() for d in docs]
 
-    cat_labels_json = json.dumps(cat_labels)
-    cat_values_json = json.dumps(cat_values)
+    return leer_en_cache(("transacciones", cantidad), cargar)
 
-    # -------- 6) ÚLTIMAS TRANSACCIONES --------
-    ult_trans_docs = (
-        db.collection("transacciones")
-        .order_by("id_transaccion", direction=firestore.Query.DESCENDING)
-        .limit(5)
-        .stream()
-    )
 
-    ultimas_transacciones = []
-    for d in ult_trans_docs:
-        data = d.to_dict()
-        valor = float(data.get("valor", 0))
-        tipo_t = (data.get("tipo", "") or "").lower()
-        if tipo_t == "gasto":
-            data["valor_mostrado"] = -abs(valor)
-        else:
-            data["valor_mostrado"] = abs(valor)
-        ultimas_transacciones.append(data)
+def leer_saldo_actual():
+    """
+    saldo_final de la última transacción en orden (fecha, id_transaccion),
+    que es el saldo global actual (o None si no hay transacciones).
+    """
+    def cargar():
+        docs = lector().recorrer(
+            db.collection("transacciones")
+            .order_by("fecha", direction=firestore.Query.DESCENDING)
+            .order_by("id_transaccion", direction=firestore.Query.DESCENDING)
+            .limit(1)
+        )
+        return next((d.to_dict().get("saldo_final") for d in docs), None)
 
-    # -------- 7) SALDOS POR CUENTA --------
-    cuentas_docs = db.collection("cuentas").stream()
-    cuentas_dashboard = []
-    for c in cuentas_docs:
-        info = c.to_dict()
-        cuentas_dashboard.append({
-            "nombre": info.get("nombre", ""),
-            "saldo": info.get("saldo_inicial", 0),
-        })
+    return leer_en_cache(("transacciones", "saldo_actual"), cargar)
 
-       # -------- 8) SALDO FINAL ÚLTIMOS 30 DÍAS (SOLO DÍAS CON MOVIMIENTOS) --------
-    hace_30 = hoy_date - timedelta(days=30)
 
-    trans_ultimos_30 = (
-        db.collection("transacciones")
-        .where("fecha", ">=", hace_30.isoformat())
-        .order_by("fecha")
-        .order_by("id_transaccion")
-        .stream()
-    )
+def leer_saldo_diario(fecha):
+    """Documento de saldos_diarios de esa fecha (o None)."""
+    def cargar():
+        doc = lector().documento(db.collection("saldos_diarios").document(fecha))
+        return doc.to_dict() if doc is not None and doc.exists else None
 
-    # Para cada día, nos quedamos con el saldo_final de la ÚLTIMA transacción de ese día
-    saldos_por_dia = {}  # fecha -> saldo_final
+    return leer_en_cache(("saldos_diarios", fecha), cargar)
 
-    for d in trans_ultimos_30:
-        data = d.to_dict()
-        fecha_t = data.get("fecha")
-        if not fecha_t:
-            continue
 
-        saldo_final = data.get("saldo_final", 0)
-        # Como vamos en orden por fecha + id, lo que quede al final es el último saldo de ese día
-        saldos_por_dia[fecha_t] = saldo_final
+def leer_resumen_meses():
+    """Documentos de resumen_meses ordenados por mes."""
+    def cargar():
+        docs = lector().recorrer(db.collection("resumen_meses").order_by("mes"))
+        return [d.to_dict() for d in docs]
 
-    # Ordenamos las fechas de menor a mayor
-    fechas_linea = sorted(saldos_por_dia.keys())
-    valores_linea = [saldos_por_dia[f] for f in fechas_linea]
+    return leer_en_cache(("resumen_meses",), cargar)
 
-    # Convertimos a JSON para Chart.js
-    fechas_linea_json = json.dumps(fechas_linea)
-    valores_linea_json = json.dumps(valores_linea)
 
+# ----------- ÍNDICE DE SALDOS POR DÍA -----------
+#
+# El saldo al cierre de un día es el saldo inicial del libro (el de la
+# primera transacción en orden de fecha) más el flujo neto de todos los días
+# hasta ese. Con el flujo de cada día en un árbol de Fenwick las dos cosas
+# salen en O(log n), y una transacción nueva, aunque sea de una fecha vieja,
+# se suma también en O(log n) sin recorrer nada.
 
-    # -------- 9) RENDER --------
-    return render_template(
-        "home.html",
-        total_global=total_global,
-        ingresos_hoy=ingresos_hoy,
-        gastos_hoy=gastos_hoy,
-        diferencia_hoy=diferencia_hoy,
-        ingresos_mes=ingresos_mes,
-        gastos_mes=gastos_mes,
-        diferencia_mes=diferencia_mes,
-        meses_labels_json=meses_labels_json,
-        ingresos_mes_chart_json=ingresos_mes_chart_json,
-        gastos_mes_chart_json=gastos_mes_chart_json,
-        cat_labels_json=cat_labels_json,
-        cat_values_json=cat_values_json,
-        ultimas_transacciones=ultimas_transacciones,
-        cuentas_dashboard=cuentas_dashboard,
-        fechas_linea_json=fechas_linea_json,
-        valores_linea_json=valores_linea_json,
-    )
 
-@app.route("/historicos")
-@login_requerido
-def historicos():
-    return render_template("historicos.html")
+def _ordinal_dia(fecha_iso):
+    """Número de día de una fecha 'YYYY-MM-DD' (None si no es una fecha)."""
+    try:
+        return date.fromisoformat(fecha_iso).toordinal()
+    except (TypeError, ValueError):
+        return None
 
 
-@app.route("/cuentas", methods=["GET", "POST"])
-@login_requerido
-def cuentas():
-    error_msg = None
+def flujo_transaccion(data):
+    """Lo que una transacción mueve el saldo: + ingresos, - gastos (como el resumen diario)."""
+    valor = abs(float(data.get("valor", 0)))
+    return -valor if (data.get("tipo", "") or "").lower() == "gasto" else valor
 
-    # Crear cuenta
-    if request.method == "POST":
-        nombre = request.form.get("nombre", "").strip()
-        saldo_inicial_str = request.form.get("saldo_inicial", "0").strip()
 
-        try:
-            saldo_inicial = float(saldo_inicial_str or 0)
-        except ValueError:
-            saldo_inicial = 0
+class SumasPorDia:
+    """
+    Árbol de Fenwick con el monto neto de cada día. Cubre del primer al
+    último día con datos más HOLGURA días a cada lado; un día fuera de ese
+    rango lo reconstruye (en O(días)).
+    """
 
-        if not nombre:
-            error_msg = "El nombre de la cuenta es obligatorio."
-        else:
-            # Evitar duplicados
-            nombre_key = nombre.lower()
-            docs = db.collection("cuentas").stream()
-            nombres_existentes = [
-                (d.to_dict().get("nombre", "").strip().lower())
-                for d in docs
-            ]
+    HOLGURA = 366
 
-            if nombre_key in nombres_existentes:
-                error_msg = "Ya existe una cuenta con ese nombre."
-            else:
-                db.collection("cuentas").add({
-                    "nombre": nombre,
-                    "saldo_inicial": saldo_inicial,
-                })
-                return redirect(url_for("cuentas"))
+    def __init__(self, montos=None):
+        self._montos = defaultdict(float)  # ordinal del día -> monto
+        for fecha, monto in (montos or {}).items():
+            ordinal = _ordinal_dia(fecha)
+            if ordinal is not None:
+                self._montos[ordinal] += monto
+        self._reconstruir()
 
-    # --- Leer todas las cuentas ---
-    docs = db.collection("cuentas").stream()
-    lista = []
-    for d in docs:
-        data = d.to_dict()
-        data["id"] = d.id
-        lista.append(data)
+    def _reconstruir(self):
+        if self._montos:
+            self._inicio = min(self._montos) - self.HOLGURA
+            fin = max(self._montos) + self.HOLGURA
+        else:
+            self._inicio = fin = 0
+        arbol = [0.0] * (fin - self._inicio + 2)
+        for ordinal, monto in self._montos.items():
+            arbol[ordinal - self._inicio + 1] += monto
+        n = len(arbol) - 1
+        for i in range(1, n + 1):
+            j = i + (i & -i)
+            if j <= n:
+                arbol[j] += arbol[i]
+        self._arbol = arbol
+
+    def copia(self):
+        otra = SumasPorDia.__new__(SumasPorDia)
+        otra._montos = defaultdict(float, self._montos)
+        otra._inicio = self._inicio
+        otra._arbol = list(self._arbol)
+        return otra
+
+    def sumar(self, fecha_iso, monto):
+        ordinal = _ordinal_dia(fecha_iso)
+        if ordinal is None or not monto:
+            return
+        self._montos[ordinal] += monto
+        i = ordinal - self._inicio + 1
+        n = len(self._arbol) - 1
+        if not 1 <= i <= n:
+            self._reconstruir()
+            return
+        while i <= n:
+            self._arbol[i] += monto
+            i += i & -i
+
+    def _prefijo(self, ordinal):
+        """Suma de los días hasta `ordinal` inclusive."""
+        i = min(ordinal - self._inicio + 1, len(self._arbol) - 1)
+        total = 0.0
+        while i > 0:
+            total += self._arbol[i]
+            i -= i & -i
+        return total
+
+    def entre(self, desde_iso=None, hasta_iso=None):
+        """Suma de los días en [desde_iso, hasta_iso] (None = sin límite)."""
+        if hasta_iso:
+            total = self._prefijo(date.fromisoformat(hasta_iso).toordinal())
+        else:
+            total = self._prefijo(self._inicio + len(self._arbol))
+        if desde_iso:
+            total -= self._prefijo(date.fromisoformat(desde_iso).toordinal() - 1)
+        return total
 
-    # Total de cuentas (solo suma de saldos de cada cuenta)
-    total_cuentas = sum(c.get("saldo_inicial", 0) for c in lista)
 
-    # 2️⃣ OBTENER SALDO ACTUAL REAL desde la ÚLTIMA transacción
-    ult_docs = (
-        db.collection("transacciones")
-        .order_by("id_transaccion", direction=firestore.Query.DESCENDING)
-        .limit(1)
-        .stream()
-    )
+class IndiceSaldos:
+    """
+    Saldo al cierre de cualquier día y flujo neto entre dos fechas, global y
+    por cuenta. `saldo_inicial` es el de la primera transacción en orden
+    (fecha, id_transaccion), como en el resumen diario; None si no hay ninguna.
+    """
 
-    saldo_actual_real = total_cuentas  # por defecto si no hay transacciones
-    for d in ult_docs:
-        saldo_actual_real = d.to_dict().get("saldo_final", total_cuentas)
+    def __init__(self, saldo_inicial=None, montos=None, montos_cuentas=None):
+        self.saldo_inicial = saldo_inicial
+        self._global = SumasPorDia(montos)
+        self._cuentas = {c: SumasPorDia(m) for c, m in (montos_cuentas or {}).items()}
+        self._propias = set(self._cuentas)  # cuentas que se pueden modificar en el lugar
+
+    @classmethod
+    def desde_transacciones(cls, transacciones):
+        """Lo arma en una pasada por transacciones en orden (fecha, id_transaccion)."""
+        saldo_inicial = None
+        montos = defaultdict(float)
+        montos_cuentas = defaultdict(lambda: defaultdict(float))
+        for data in transacciones:
+            fecha = data.get("fecha")
+            if not fecha or not isinstance(fecha, str):
+                continue
+            if saldo_inicial is None:
+                saldo_inicial = float(data.get("saldo_inicial", 0))
+            flujo = flujo_transaccion(data)
+            montos[fecha] += flujo
+            montos_cuentas[data.get("cuenta", "")][fecha] += flujo
+        return cls(saldo_inicial, montos, montos_cuentas)
+
+    def copia(self):
+        """Copia para modificar sin tocar esta: las sumas por cuenta se copian al usarlas."""
+        otro = IndiceSaldos.__new__(IndiceSaldos)
+        otro.saldo_inicial = self.saldo_inicial
+        otro._global = self._global.copia()
+        otro._cuentas = dict(self._cuentas)
+        otro._propias = set()
+        return otro
+
+    def mover(self, data, signo=1):
+        """Suma (signo=1) o descuenta (signo=-1) una transacción."""
+        fecha = data.get("fecha")
+        monto = signo * flujo_transaccion(data)
+        self._global.sumar(fecha, monto)
+        cuenta = data.get("cuenta", "")
+        if cuenta not in self._propias:
+            previa = self._cuentas.get(cuenta)
+            self._cuentas[cuenta] = previa.copia() if previa else SumasPorDia()
+            self._propias.add(cuenta)
+        self._cuentas[cuenta].sumar(fecha, monto)
+
+    def flujo(self, desde_iso=None, hasta_iso=None, cuenta=None):
+        """Ingresos - gastos con fecha en [desde_iso, hasta_iso], de todas o de una cuenta."""
+        sumas = self._global if cuenta is None else self._cuentas.get(cuenta)
+        return sumas.entre(desde_iso, hasta_iso) if sumas is not None else 0.0
+
+    def saldo_al(self, fecha_iso=None):
+        """Saldo global al cierre de fecha_iso, o el actual (None si no hay transacciones)."""
+        if self.saldo_inicial is None:
+            return None
+        return self.saldo_inicial + self._global.entre(None, fecha_iso)
+
+    def saldo_cuenta_al(self, cuenta, fecha_iso, saldo_actual):
+        """Saldo de una cuenta al cierre de fecha_iso: el actual menos lo que entró después."""
+        siguiente = (date.fromisoformat(fecha_iso) + timedelta(days=1)).isoformat()
+        return saldo_actual - self.flujo(siguiente, None, cuenta)
+
+
+# ----------- SINCRONIZACIÓN INCREMENTAL DE TRANSACCIONES -----------
+#
+# Una copia local de `transacciones` (en memoria o la instantánea en disco)
+# se pone al día pidiendo solo lo que cambió desde la última vez. El
+# id_transaccion no sirve de marca: una importación reserva los ids de un
+# lote antes de escribirlo, así que mientras tanto un alta puede guardar un
+# id mayor antes que los del lote. Por eso se piden las transacciones con
+# actualizado_en posterior a la última sincronización: quien guarde o
+# modifique una transacción debe poner actualizado_en = marca_actual(). Las
+# guardadas antes de esto no lo tienen; `flask marcar-transacciones` se lo
+# pone (se corre una vez). La app no borra transacciones, así que no se
+# piden borradas; la escucha en vivo sí las ve (LibroLocal.aplicar).
+# En régimen estable la consulta vuelve vacía.
+
+# Tolerancia entre relojes de los procesos que escriben actualizado_en (y
+# para las escrituras que ponen la marca y tardan un poco en confirmarse)
+MARGEN_CAMBIOS_MS = 10_000
+
+
+def marca_actual():
+    """Hora en milisegundos, para actualizado_en."""
+    return int(time.time() * 1000)
+
+
+def leer_cambios(marca):
+    """
+    Cambios en transacciones desde `marca`. Devuelve (cambiadas, marca_nueva):
+    los dicts de las transacciones nuevas o editadas (puede repetir algunas
+    ya vistas, por el margen: aplicar dos veces el mismo documento no debe
+    cambiar nada). Con marca 0 (carga inicial) son todas, como iterador en
+    orden de id_transaccion.
+    marca_nueva se toma antes de consultar, para no perder lo que se escriba
+    mientras tanto.
+    """
+    marca_nueva = marca_actual()
+    if not marca:
+        todas = (
+            d.to_dict()
+            for d in lector().recorrer(db.collection("transacciones").order_by("id_transaccion"))
+        )
+        return todas, marca_nueva
 
-    # 1️⃣ SALDO INICIAL DEL DÍA (saldos_diarios)
-    #    Si es un día nuevo, el saldo inicial del día = saldo_actual_real
-    hoy = date.today().isoformat()
-    doc_hoy_ref = db.collection("saldos_diarios").document(hoy)
-    doc_hoy = doc_hoy_ref.get()
+    desde = marca - MARGEN_CAMBIOS_MS
+    cambiadas = [
+        d.to_dict()
+        for d in lector().recorrer(
+            db.collection("transacciones").where("actualizado_en", ">", desde)
+        )
+    ]
+    return cambiadas, marca_nueva
 
-    if doc_hoy.exists:
-        # Ya había saldo guardado hoy
-        saldo_inicial_dia = doc_hoy.to_dict().get("saldo_inicial", saldo_actual_real)
-    else:
-        # Día nuevo → el saldo inicial ES el saldo actual global
-        saldo_inicial_dia = saldo_actual_real
-        doc_hoy_ref.set({
-            "fecha": hoy,
-            "saldo_inicial": saldo_inicial_dia,
-            "saldo_final": saldo_inicial_dia,
-        })
 
-    # 👇 OJO: este return va alineado con el if, NO dentro del else
-    return render_template(
-        "cuentas.html",
-        cuentas=lista,
-        formatear_cop=formatear_cop,
-        total_cuentas=saldo_actual_real,
-        saldo_inicial_dia=saldo_inicial_dia,
-        error=error_msg,
+def marcar_transacciones():
+    """
+    Pone actualizado_en a las transacciones que no lo tienen (guardadas
+    antes de la sincronización incremental), para que las copias locales
+    vean sus cambios. Devuelve cuántas marcó.
+    """
+    marca = marca_actual()
+    return escribir_en_lotes(
+        ("update", d.reference, {"actualizado_en": marca})
+        for d in db.collection("transacciones").stream()
+        if "actualizado_en" not in d.to_dict()
     )
 
 
-@app.route("/cuentas/borrar/<id_doc>", methods=["POST"])
-def borrar_cuenta(id_doc):
-    db.collection("cuentas").document(id_doc).delete()
-    return redirect(url_for("cuentas"))
+@app.cli.command("marcar-transacciones")
+def marcar_transacciones_cmd():
+    """Pone actualizado_en a las transacciones viejas que no lo tienen."""
+    print(f"Transacciones marcadas: {marcar_transacciones()}.")
 
 
-@app.route("/cuentas/editar/<id_doc>", methods=["POST"])
-def editar_cuenta(id_doc):
+class LibroLocal:
     """
-    Actualiza el saldo_inicial (saldo actual) de una cuenta existente.
-    Acepta valores con formato tipo $1.234.567,89 o números crudos.
+    Copia en memoria de `transacciones` (una por worker) con cuatro índices:
+    el orden (fecha, id_transaccion), ese mismo orden por cuenta, los
+    totales de cada día (como resumen_dias) y los saldos por día
+    (IndiceSaldos). Se alimenta con
+    sincronizar(leer_cambios) o, con la escucha en vivo, con aplicar().
+
+    Los documentos no se modifican nunca en el lugar y los índices se
+    reemplazan todos juntos, así que quien lee nunca ve un cambio a medias.
     """
-    bruto = request.form.get("saldo_inicial", "0").strip()
-
-    # Quitar símbolo de peso, espacios y separadores de miles
-    limpio = (
-        bruto.replace("$", "")
-        .replace(" ", "")
-        .replace("\u00a0", "")  # espacio raro
-        .replace(".", "")  # puntos de miles
-    )
-    # Cambiar coma decimal por punto
-    limpio = limpio.replace(",", ".")
 
-    try:
-        nuevo_saldo = float(limpio or 0)
-    except ValueError:
-        nuevo_saldo = 0
+    # Con más cambios que estos se reordena todo en vez de insertar uno a uno
+    REORDENAR_DESDE = 256
 
-    db.collection("cuentas").document(id_doc).update({"saldo_inicial": nuevo_saldo})
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._por_id = {}
+        # "orden": (claves, docs) con claves (fecha, id_transaccion) ordenadas;
+        # "cuentas": cuenta -> (claves, docs); "dias": fecha -> totales;
+        # "saldos": IndiceSaldos
+        self._indices = {"orden": ([], []), "cuentas": {}, "dias": {}, "saldos": IndiceSaldos()}
+        self.marca = 0
 
-    return redirect(url_for("cuentas"))
+    @staticmethod
+    def _clave(data):
+        fecha = data.get("fecha")
+        if not fecha or not isinstance(fecha, str):
+            return None  # sin fecha no entra en ningún reporte
+        return (fecha, data.get("id_transaccion") or 0)
+
+    @staticmethod
+    def _totales_dia(docs):
+        totales = _totales_vacios()
+        for data in docs:
+            tipo_t = (data.get("tipo", "") or "").lower()
+            valor = float(data.get("valor", 0))
+            _sumar_delta(totales, _delta_transaccion(tipo_t, data.get("categoria"), valor))
+        return totales
+
+    # ----- escritura -----
+
+    def sincronizar(self, leer_cambios):
+        """Aplica leer_cambios() desde la última vez. Devuelve cuántas transacciones hay."""
+        with self._lock:
+            cambiadas, marca = leer_cambios(self.marca)
+            cambios = {}
+            for data in cambiadas:
+                cambios[data.get("id_transaccion") or 0] = data
+            self._aplicar(cambios)
+            self.marca = marca
+            return len(self._por_id)
+
+    def aplicar(self, cambios):
+        """cambios: {id_transaccion: documento, o None si se borró}."""
+        with self._lock:
+            self._aplicar(cambios)
+
+    def _aplicar(self, cambios):
+        if len(cambios) >= self.REORDENAR_DESDE:
+            self._reordenar(cambios)
+        elif cambios:
+            self._insertar(cambios)
+
+    def _reordenar(self, cambios):
+        for id_t, data in cambios.items():
+            if data is None:
+                self._por_id.pop(id_t, None)
+            else:
+                self._por_id[id_t] = data
+        pares = sorted(
+            ((self._clave(d), d) for d in self._por_id.values() if self._clave(d)),
+            key=lambda par: par[0],
+        )
 
+        cuentas = {}
+        dias = defaultdict(list)
+        for clave, data in pares:
+            claves_c, docs_c = cuentas.setdefault(data.get("cuenta", ""), ([], []))
+            claves_c.append(clave)
+            docs_c.append(data)
+            dias[clave[0]].append(data)
+
+        self._indices = {
+            "orden": ([c for c, _ in pares], [d for _, d in pares]),
+            "cuentas": cuentas,
+            "dias": {fecha: self._totales_dia(docs) for fecha, docs in dias.items()},
+            "saldos": IndiceSaldos.desde_transacciones(d for _, d in pares),
+        }
+
+    @staticmethod
+    def _quitar(claves, docs, clave):
+        i = bisect.bisect_left(claves, clave)
+        if i < len(claves) and claves[i] == clave:
+            del claves[i], docs[i]
+
+    @staticmethod
+    def _poner(claves, docs, clave, data):
+        i = bisect.bisect_right(claves, clave)
+        claves.insert(i, clave)
+        docs.insert(i, data)
+
+    def _insertar(self, cambios):
+        claves, docs = (list(lista) for lista in self._indices["orden"])
+        cuentas = dict(self._indices["cuentas"])
+        copiadas = set()
+        dias_tocados = set()
+        saldos = self._indices["saldos"].copia()
+
+        def de_cuenta(cuenta):
+            if cuenta not in copiadas:
+                claves_c, docs_c = cuentas.get(cuenta, ([], []))
+                cuentas[cuenta] = (list(claves_c), list(docs_c))
+                copiadas.add(cuenta)
+            return cuentas[cuenta]
+
+        for id_t, data in cambios.items():
+            anterior = self._por_id.pop(id_t, None)
+            if anterior is not None and self._clave(anterior):
+                clave = self._clave(anterior)
+                self._quitar(claves, docs, clave)
+                self._quitar(*de_cuenta(anterior.get("cuenta", "")), clave)
+                dias_tocados.add(clave[0])
+                saldos.mover(anterior, -1)
+            if data is not None:
+                self._por_id[id_t] = data
+                clave = self._clave(data)
+                if clave:
+                    self._poner(claves, docs, clave, data)
+                    self._poner(*de_cuenta(data.get("cuenta", "")), clave, data)
+                    dias_tocados.add(clave[0])
+                    saldos.mover(data)
+
+        dias = dict(self._indices["dias"])
+        for fecha in dias_tocados:
+            inicio = bisect.bisect_left(claves, (fecha,))
+            fin = bisect.bisect_right(claves, (fecha, float("inf")))
+            if inicio < fin:
+                dias[fecha] = self._totales_dia(docs[inicio:fin])
+            else:
+                dias.pop(fecha, None)
 
-@app.route("/transacciones", methods=["GET", "POST"])
-@login_requerido
-def transacciones():
-    error = None
+        saldos.saldo_inicial = float(docs[0].get("saldo_inicial", 0)) if docs else None
+        self._indices = {
+            "orden": (claves, docs), "cuentas": cuentas, "dias": dias, "saldos": saldos,
+        }
 
-    # 1. Determinar la FECHA DE TRABAJO
-    if request.method == "POST":
-        fecha_trabajo = request.form.get("fecha_trabajo") or date.today().isoformat()
-    else:
-        fecha_trabajo = request.args.get("fecha") or date.today().isoformat()
+    # ----- lectura (los documentos devueltos no se deben modificar) -----
 
-    # ------------------- POST: guardar transacción -------------------
-    if request.method == "POST":
-        # la fecha REAL de la transacción SIEMPRE será la fecha_trabajo
-        fecha = fecha_trabajo
-        descripcion = request.form.get("descripcion", "").strip()
-        valor_str = request.form.get("valor", "0").strip()
-        tipo = (request.form.get("tipo", "ingreso") or "").lower()
+    def en_orden(self, desde_iso=None, hasta_iso=None, cuenta=None):
+        """Transacciones con fecha en [desde_iso, hasta_iso], de todas o de una cuenta."""
+        indices = self._indices
+        if cuenta is None:
+            claves, docs = indices["orden"]
+        else:
+            claves, docs = indices["cuentas"].get(cuenta, ([], []))
+        inicio = bisect.bisect_left(claves, (desde_iso,)) if desde_iso else 0
+        fin = bisect.bisect_right(claves, (hasta_iso, float("inf"))) if hasta_iso else len(claves)
+        return docs[inicio:fin]
+
+    def saldos(self):
+        """El IndiceSaldos del libro (no se debe modificar)."""
+        return self._indices["saldos"]
+
+    def ultimas(self, cantidad):
+        """Las `cantidad` transacciones con mayor id_transaccion, de la más nueva a la más vieja."""
+        with self._lock:
+            return [self._por_id[i] for i in heapq.nlargest(cantidad, self._por_id)]
+
+    def resumen_diario(self):
+        """
+        Las filas de _resumen_diario_desde_transacciones() sacadas del índice
+        por día: el saldo se encadena desde el saldo_inicial de la primera
+        transacción.
+        """
+        indices = self._indices
+        docs = indices["orden"][1]
+        if not docs:
+            return []
+        saldo = float(docs[0].get("saldo_inicial", 0))
+        filas = []
+        for fecha, totales in sorted(indices["dias"].items()):
+            fila = {
+                "fecha": fecha,
+                "ingresos": totales["ingresos"],
+                "gastos": totales["gastos"],
+                "diferencia": totales["ingresos"] - totales["gastos"],
+                "saldo_inicial": saldo,
+                "saldo_final": None,
+                "cantidad": totales["cantidad"],
+                "ingresos_por_categoria": dict(totales["ingresos_por_categoria"]),
+                "gastos_por_categoria": dict(totales["gastos_por_categoria"]),
+            }
+            saldo += totales["ingresos"] - totales["gastos"]
+            fila["saldo_final"] = saldo
+            filas.append(fila)
+        return filas
 
-        cuenta = request.form.get("cuenta", "").strip()
-        categoria = request.form.get("categoria", "").strip()
+    def totales(self, desde_iso, hasta_iso):
+        """Totales del rango con la forma de totales_periodo(), sumando los días."""
+        totales = _totales_vacios()
+        for fecha, dia in sorted(self._indices["dias"].items()):
+            if desde_iso <= fecha <= hasta_iso:
+                _sumar_delta(totales, dia)
+        return totales
 
-        if not cuenta:
-            error = "Debes seleccionar una cuenta."
+    def __len__(self):
+        return len(self._por_id)
+
+
+# Segundos que una request espera la carga inicial de la escucha en vivo,
+# y el aviso de una escritura hecha por este mismo proceso
+ESPERA_ESCUCHA = float(os.getenv("FINANZAS_ESPERA_ESCUCHA", "20"))
+ESPERA_ESCRITURA = 2.0
+
+
+class EscuchaLibro:
+    """
+    Mantiene al día un LibroLocal y la lista de cuentas con on_snapshot sobre
+    `transacciones` y `cuentas`: Firestore empuja cada cambio a un hilo de
+    este worker y las requests leen de memoria sin consultar.
+
+    `listo` se activa cuando llegó la carga inicial de las dos colecciones.
+    Se arranca con la primera request, así cada worker de gunicorn tiene la
+    suya (los hilos no sobreviven al fork) y los comandos de la CLI no la abren.
+    """
+
+    COLECCIONES = ("transacciones", "cuentas")
+
+    def __init__(self, libro):
+        self.libro = libro
+        self.cuentas = []
+        self.listo = threading.Event()
+        self._lock = threading.Lock()
+        self._escuchas = []
+        self._ids = {}  # id de documento -> id_transaccion (para los borrados)
+        self._cargadas = set()
+        self._avisos = threading.Condition()
+        self._recibidos = {c: 0 for c in self.COLECCIONES}
+        self._pendientes = {}  # colección -> avisos recibidos cuando este proceso escribió
+        self._retrasos = deque(maxlen=1000)  # segundos entre una escritura y su aviso
+        self._inicio = None
+        self.duracion_carga = None
+        self.ultimo_aviso = None
+
+    def iniciar(self):
+        with self._lock:
+            if self._escuchas:
+                return
+            self._inicio = time.monotonic()
+            self._escuchas = [
+                db.collection("transacciones").on_snapshot(self._aviso_transacciones),
+                db.collection("cuentas").on_snapshot(self._aviso_cuentas),
+            ]
+
+    def detener(self):
+        with self._lock:
+            for escucha in self._escuchas:
+                escucha.unsubscribe()
+            self._escuchas = []
+
+    # ----- avisos de Firestore (en el hilo de la escucha) -----
+
+    def _aviso_transacciones(self, docs, cambios, read_time):
+        lote = {}
+        for cambio in cambios:
+            doc = cambio.document
+            anterior = self._ids.pop(doc.id, None)
+            if anterior is not None:
+                lote[anterior] = None
+            if cambio.type.name != "REMOVED":
+                data = doc.to_dict()
+                id_t = data.get("id_transaccion") or 0
+                self._ids[doc.id] = id_t
+                lote[id_t] = data
+        self.libro.aplicar(lote)
+        self._recibido("transacciones", cambios)
+
+    def _aviso_cuentas(self, docs, cambios, read_time):
+        cuentas = []
+        for d in docs:
+            data = d.to_dict()
+            data["id"] = d.id
+            cuentas.append(data)
+        self.cuentas = cuentas
+        self._recibido("cuentas", cambios)
+
+    def _recibido(self, coleccion, cambios):
+        if coleccion in self._cargadas:
+            ahora = datetime.now(timezone.utc)
+            for cambio in cambios:
+                escrito = cambio.document.update_time
+                if escrito is not None and cambio.type.name != "REMOVED":
+                    self._retrasos.append((ahora - escrito).total_seconds())
         else:
-            try:
-                valor = float(valor_str or 0)
-            except ValueError:
-                error = "El valor ingresado no es válido."
+            self._cargadas.add(coleccion)
+            if self._cargadas.issuperset(self.COLECCIONES):
+                self.duracion_carga = time.monotonic() - self._inicio
+                self.listo.set()
+
+        with self._avisos:
+            self._recibidos[coleccion] += 1
+            self.ultimo_aviso = time.time()
+            self._avisos.notify_all()
+
+    # ----- leer lo propio -----
+
+    def anotar_escritura(self, *colecciones):
+        """Este proceso acaba de escribir: la próxima lectura espera el aviso."""
+        with self._avisos:
+            for coleccion in colecciones:
+                self._pendientes[coleccion] = self._recibidos[coleccion]
+
+    def al_dia(self, coleccion, espera=ESPERA_ESCRITURA):
+        """
+        Si este proceso escribió en la colección, espera (a lo sumo `espera`
+        segundos) el siguiente aviso, para que quien escribe vea lo suyo.
+        """
+        with self._avisos:
+            pendiente = self._pendientes.pop(coleccion, None)
+            if pendiente is not None:
+                self._avisos.wait_for(lambda: self._recibidos[coleccion] > pendiente, espera)
+
+    def estadisticas(self):
+        retrasos = sorted(self._retrasos)
+
+        def percentil(p):
+            return round(retrasos[min(len(retrasos) - 1, int(p * len(retrasos)))] * 1000, 1)
+
+        return {
+            "pid": os.getpid(),
+            "listo": self.listo.is_set(),
+            "transacciones": len(self.libro),
+            "cuentas": len(self.cuentas),
+            "carga_inicial_s": round(self.duracion_carga, 3) if self.duracion_carga else None,
+            "avisos": dict(self._recibidos),
+            "ultimo_aviso_hace_s": (
+                round(time.time() - self.ultimo_aviso, 1) if self.ultimo_aviso else None
+            ),
+            "retraso_ms": {
+                "muestras": len(retrasos),
+                "p50": percentil(0.5) if retrasos else None,
+                "p95": percentil(0.95) if retrasos else None,
+                "max": round(retrasos[-1] * 1000, 1) if retrasos else None,
+            },
+        }
+
+
+# FINANZAS_LIBRO_LOCAL: cada worker guarda las transacciones en memoria y las
+# pone al día consultando los cambios (=1) o escuchándolos con on_snapshot (=vivo)
+MODO_LIBRO_LOCAL = os.getenv("FINANZAS_LIBRO_LOCAL", "")
+if MODO_LIBRO_LOCAL == "vivo" and os.getenv("FINANZAS_DB") == "sqlite":
+    print("FINANZAS_LIBRO_LOCAL=vivo necesita on_snapshot, que SQLite no tiene; "
+          "el libro local se pone al día consultando los cambios (=1).")
+    MODO_LIBRO_LOCAL = "1"
+libro_local = LibroLocal() if MODO_LIBRO_LOCAL in ("1", "vivo") else None
+escucha_libro = EscuchaLibro(libro_local) if MODO_LIBRO_LOCAL == "vivo" else None
+
+
+def anotar_escritura(*colecciones):
+    """Avisa a la escucha en vivo (si hay) que este proceso escribió en esas colecciones."""
+    if escucha_libro is not None:
+        escucha_libro.anotar_escritura(*colecciones)
+
+
+def libro_al_dia():
+    """
+    El libro local al día, o None si no está activo. Con la escucha en vivo
+    ya lo está (salvo el aviso de una escritura propia, que se espera); si
+    no, como la instantánea, se sincroniza a lo sumo una vez por TTL de la
+    caché y siempre después de una escritura de este proceso.
+    """
+    if libro_local is None:
+        return None
+    if escucha_libro is not None:
+        if not escucha_libro.listo.is_set():
+            return None
+        escucha_libro.al_dia("transacciones")
+        return libro_local
+    try:
+        cache_lecturas.obtener(
+            ("transacciones", "libro_local"),
+            lambda: libro_local.sincronizar(leer_cambios),
+        )
+    except Exception as e:
+        print("No se pudo sincronizar el libro local:", e)
+        return None
+    return libro_local
 
-        if not error:
-            # 1. Ajustar signo
-            if tipo.lower() == "gasto":
-                valor_ajustado = -abs(valor)
-            else:
-                valor_ajustado = abs(valor)
-
-                       # 2. Saldo en la cuenta (saldo_en_cuenta)
-            trans_docs = (
-                db.collection("transacciones")
-                .where("cuenta", "==", cuenta)
-                .order_by("id_transaccion")
-                .stream()
-            )
 
-            saldo_anterior_cuenta = None
-            for t in trans_docs:
-                data_t = t.to_dict()
-                saldo_anterior_cuenta = data_t.get("saldo_en_cuenta")
-
-            if saldo_anterior_cuenta is None:
-                cuenta_docs = (
-                    db.collection("cuentas")
-                    .where("nombre", "==", cuenta)
-                    .limit(1)
-                    .stream()
-                )
-                saldo_anterior_cuenta = 0
-                for c in cuenta_docs:
-                    datos_c = c.to_dict()
-                    saldo_anterior_cuenta = datos_c.get("saldo_inicial", 0)
+@app.before_request
+def esperar_carga_inicial():
+    """
+    Con la escucha en vivo el worker no atiende hasta tener la carga
+    inicial (salvo /listo y los estáticos): espera hasta ESPERA_ESCUCHA
+    segundos y si no, responde 503 para que el cliente reintente.
+    """
+    if escucha_libro is None or request.endpoint in ("listo", "static"):
+        return None
+    escucha_libro.iniciar()
+    if not escucha_libro.listo.wait(ESPERA_ESCUCHA):
+        return Response(
+            "Cargando las transacciones, intente de nuevo en unos segundos.",
+            status=503,
+            headers={"Retry-After": "5"},
+        )
+    return None
 
-            saldo_en_cuenta = saldo_anterior_cuenta + valor_ajustado
 
-            # 3. Saldo global (saldo_inicial / saldo_final)
-            #    OJO: aquí AÚN NO actualizamos la colección "cuentas"
-            #    para no contar dos veces la misma transacción.
-            saldo_inicial_global = None
+@app.route("/listo")
+def listo():
+    """Health check: 200 cuando este worker ya puede atender."""
+    if escucha_libro is None:
+        return {"listo": True}
+    escucha_libro.iniciar()
+    return escucha_libro.estadisticas(), 200 if escucha_libro.listo.is_set() else 503
 
-            ult_docs = (
-                db.collection("transacciones")
-                .order_by("id_transaccion", direction=firestore.Query.DESCENDING)
-                .limit(1)
-                .stream()
-            )
-            for t in ult_docs:
-                saldo_inicial_global = t.to_dict().get("saldo_final")
-
-            if saldo_inicial_global is None:
-                # No hay transacciones con saldo_final (versión vieja) →
-                # usamos la suma de saldos de cuentas ANTES de aplicar esta transacción.
-                cuentas_docs = db.collection("cuentas").stream()
-                saldo_inicial_global = sum(
-                    c.to_dict().get("saldo_inicial", 0) for c in cuentas_docs
-                )
 
-            saldo_final_global = saldo_inicial_global + valor_ajustado
+def transacciones_en_orden(desde_iso=None, hasta_iso=None):
+    """
+    Transacciones (dicts) en orden (fecha, id_transaccion), de la fecha
+    desde_iso a hasta_iso: del libro local si está activo (copias, se pueden
+    modificar), si no directo de Firestore.
+    """
+    libro = libro_al_dia()
+    if libro is not None:
+        return (dict(d) for d in libro.en_orden(desde_iso, hasta_iso))
 
-            # 3.b AHORA sí actualizamos el saldo de la cuenta en "cuentas"
-            cuentas_query = (
-                db.collection("cuentas")
-                .where("nombre", "==", cuenta)
-                .limit(1)
-                .stream()
-            )
-            for c_doc in cuentas_query:
-                c_doc.reference.update({"saldo_inicial": saldo_en_cuenta})
+    consulta = db.collection("transacciones")
+    if desde_iso:
+        consulta = consulta.where("fecha", ">=", desde_iso)
+    if hasta_iso:
+        consulta = consulta.where("fecha", "<=", hasta_iso)
+    docs = lector().recorrer(consulta.order_by("fecha").order_by("id_transaccion"))
+    return (d.to_dict() for d in docs)
 
 
-            # 4. Nuevo ID de transacción
-            config_ref = db.collection("config").document("transacciones")
-            config_doc = config_ref.get()
-            contador_actual = 0
-            if config_doc.exists:
-                data_conf = config_doc.to_dict()
-                contador_actual = data_conf.get("contador", 0)
+# Índice de saldos armado recorriendo las transacciones, cuando no hay libro local
+indice_recorrido = None
 
-            nuevo_id = contador_actual + 1
-            config_ref.set({"contador": nuevo_id}, merge=True)
 
-            # 5. Guardar transacción
-            trans = {
-                "id_transaccion": nuevo_id,
-                "fecha": fecha,
-                "descripcion": descripcion,
-                "valor": valor_ajustado,
-                "tipo": tipo,
-                "cuenta": cuenta,
-                "categoria": categoria,
-                "saldo_en_cuenta": saldo_en_cuenta,
-                "saldo_inicial": saldo_inicial_global,
-                "saldo_final": saldo_final_global,
-            }
-            db.collection("transacciones").add(trans)
+def indice_saldos():
+    """
+    IndiceSaldos al día: el del libro local si está activo; si no, uno armado
+    con una pasada por las transacciones, que se rehace a lo sumo una vez por
+    TTL de la caché y después de cada escritura de este proceso.
+    """
+    libro = libro_al_dia()
+    if libro is not None:
+        return libro.saldos()
 
-            # 6. Actualizar saldos_diarios de ESA fecha
-            doc_ref = db.collection("saldos_diarios").document(fecha)
-            doc = doc_ref.get()
-            datos = doc.to_dict() if doc.exists else {}
-            datos["fecha"] = fecha
-            datos.setdefault("saldo_inicial", saldo_inicial_global)
-            datos["saldo_final"] = saldo_final_global
-            doc_ref.set(datos, merge=True)
+    def construir():
+        global indice_recorrido
+        indice_recorrido = IndiceSaldos.desde_transacciones(transacciones_en_orden())
+        return True
 
-            # Volvemos a la misma fecha de trabajo
-            return redirect(url_for("transacciones", fecha=fecha_trabajo))
+    cache_lecturas.obtener(("transacciones", "indice_saldos"), construir)
+    return indice_recorrido
 
-       # ------------------- GET: mostrar SOLO la fecha de trabajo -------------------
 
-    # Cuentas para el combo
-    cuentas_docs = db.collection("cuentas").stream()
-    cuentas_lista = [d.to_dict() for d in cuentas_docs]
+# ----------- INSTANTÁNEA COLUMNAR (opcional, requiere numpy) -----------
 
-    # Transacciones SOLO de esa fecha de trabajo
-    trans_docs = (
-        db.collection("transacciones")
-        .where("fecha", "==", fecha_trabajo)
-        .order_by("id_transaccion")
-        .stream()
+instantanea = None
+if os.getenv("FINANZAS_INSTANTANEA"):
+    if columnar.DISPONIBLE:
+        instantanea = columnar.InstantaneaColumnar(os.getenv("FINANZAS_INSTANTANEA"))
+    else:
+        print("FINANZAS_INSTANTANEA requiere numpy; se usan las consultas normales.")
+
+
+def instantanea_al_dia():
+    """
+    La instantánea columnar puesta al día, o None si no está activa.
+    Se sincroniza a lo sumo una vez por TTL de la caché y siempre después
+    de una escritura de este proceso (que invalida el grupo "transacciones").
+    """
+    if instantanea is None:
+        return None
+    try:
+        cache_lecturas.obtener(
+            ("transacciones", "instantanea"),
+            lambda: instantanea.sincronizar(leer_cambios),
+        )
+    except Exception as e:
+        print("No se pudo sincronizar la instantánea:", e)
+        return None
+    return instantanea
+
+
+@app.cli.command("reconstruir-instantanea")
+def reconstruir_instantanea_cmd():
+    """Vuelve a cargar la instantánea columnar desde cero."""
+    if instantanea is None:
+        print("Defina FINANZAS_INSTANTANEA (con numpy instalado) para usar la instantánea.")
+        return
+    inicio = time.perf_counter()
+    filas = instantanea.reconstruir(leer_cambios)
+    print(
+        f"Instantánea reconstruida: {filas} transacciones "
+        f"en {time.perf_counter() - inicio:.1f} s."
     )
 
-    trans_lista = []
 
-    for d in trans_docs:
-        data = d.to_dict()
+@app.route("/login", methods=["GET", "POST"])
+def login():
+    error = None
 
-        # valor_mostrado: positivo para ingresos, negativo para gastos
+    if request.method == "POST":
+        usuario = request.form.get("usuario")
+        password = request.form.get("password")
+
+        # ------ CREDENCIALES ------
+        if usuario == "deiner" and password == "Deiner88@": 
+            session["logged"] = True
+            return redirect(url_for("home"))
+        else:
+            error = "Usuario o contraseña incorrectos"
+
+    return render_template("login.html", error=error)
+
+from functools import wraps
+
+def login_requerido(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if not session.get("logged"):
+            return redirect(url_for("login"))
+        return f(*args, **kwargs)
+    return wrapper
+
+@app.route("/logout")
+def logout():
+    session.clear()
+    return redirect(url_for("login"))
+
+
+@app.route("/metrics")
+@login_requerido
+def metricas():
+    """
+    Métricas en el formato de texto de Prometheus. Piden sesión como el
+    resto de la app: lecturas y tiempos por ruta no son públicos.
+    """
+    lineas = []
+    for histograma in (metrica_segundos, metrica_lecturas, metrica_escrituras):
+        lineas += histograma.exportar()
+    with _lock_documentos:
+        totales = dict(_documentos_totales)
+    lineas += [
+        "# HELP finanzas_firestore_documentos_total Documentos leídos y escritos en Firestore (con los de fondo).",
+        "# TYPE finanzas_firestore_documentos_total counter",
+        f'finanzas_firestore_documentos_total{{operacion="lectura"}} {totales["lecturas"]}',
+        f'finanzas_firestore_documentos_total{{operacion="escritura"}} {totales["escrituras"]}',
+    ]
+    return Response("\n".join(lineas) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+def calcular_dashboard(transacciones, hoy_date, cuentas_lista):
+    """
+    Motor de agregación del dashboard: recorre las transacciones UNA sola vez
+    (ordenadas por fecha + id_transaccion) y saca todas las cifras de home():
+      total global, resumen del día, resumen del mes, gráfica mensual,
+      gastos por categoría del mes, últimas 5 transacciones y la línea
+      de saldo de los últimos 30 días.
+    """
+    hoy = hoy_date.isoformat()
+    mes_actual = hoy[:7]  # YYYY-MM
+    hace_30 = (hoy_date - timedelta(days=30)).isoformat()
+
+    total_global = 0
+
+    ingresos_hoy = 0.0
+    gastos_hoy = 0.0
+    ingresos_mes = 0.0
+    gastos_mes = 0.0
+
+    resumen_mes_dict = {}
+    gastos_por_categoria = defaultdict(float)
+    ultimas = []  # heap (id_transaccion, orden, data) con las 5 más recientes
+    saldos_por_dia = {}  # fecha -> saldo_final
+
+    for orden, data in enumerate(transacciones):
+        fecha_t = data.get("fecha")
+        if not fecha_t:
+            continue
+
+        valor = float(data.get("valor", 0))
+        tipo_t = (data.get("tipo", "") or "").lower()
+        id_t = data.get("id_transaccion")
+
+        # 1) Saldo global = saldo_final de la última transacción en orden de fecha
+        total_global = data.get("saldo_final", 0)
+
+        # 2) y 3) Resumen del día y del mes (por signo del valor)
+        if fecha_t == hoy:
+            if valor > 0:
+                ingresos_hoy += valor
+            else:
+                gastos_hoy += abs(valor)
+
+        if fecha_t.startswith(mes_actual):
+            if valor > 0:
+                ingresos_mes += valor
+            else:
+                gastos_mes += abs(valor)
+
+        # 4) Gráfica mensual (por tipo, igual que calcular_resumen_diario)
+        mes = fecha_t[:7]
+        if mes not in resumen_mes_dict:
+            resumen_mes_dict[mes] = {"ingresos": 0.0, "gastos": 0.0}
+        if tipo_t == "gasto":
+            resumen_mes_dict[mes]["gastos"] += abs(valor)
+        else:
+            resumen_mes_dict[mes]["ingresos"] += abs(valor)
+
+        # 5) Gastos por categoría del mes actual
+        if tipo_t == "gasto" and fecha_t.startswith(mes_actual):
+            categoria = data.get("categoria", "Sin categoría")
+            gastos_por_categoria[categoria] += abs(valor)
+
+        # 6) Últimas transacciones (las 5 de mayor id)
+        if id_t is not None:
+            item = (id_t, orden, data)
+            if len(ultimas) < 5:
+                heapq.heappush(ultimas, item)
+            elif item > ultimas[0]:
+                heapq.heapreplace(ultimas, item)
+
+        # 8) Saldo final de cada día de los últimos 30 días
+        if fecha_t >= hace_30:
+            # Como vamos en orden por fecha + id, lo que quede al final es el último saldo de ese día
+            saldos_por_dia[fecha_t] = data.get("saldo_final", 0)
+
+    # Si no hay transacciones aún → suma de saldos de las cuentas
+    if total_global == 0:
+        total_global = sum(c.get("saldo_inicial", 0) for c in cuentas_lista)
+
+    ultimas_transacciones = []
+    for _, _, data in sorted(ultimas, reverse=True):
         valor = float(data.get("valor", 0))
         tipo_t = (data.get("tipo", "") or "").lower()
         if tipo_t == "gasto":
             data["valor_mostrado"] = -abs(valor)
         else:
             data["valor_mostrado"] = abs(valor)
+        ultimas_transacciones.append(data)
 
-        # saldo_global_mostrado: usar SIEMPRE el saldo_final guardado en la transacción
-        data["saldo_global_mostrado"] = data.get("saldo_final", 0)
+    meses_labels = sorted(resumen_mes_dict.keys())
+    fechas_linea = sorted(saldos_por_dia.keys())
 
-        trans_lista.append(data)
+    return {
+        "total_global": total_global,
+        "ingresos_hoy": ingresos_hoy,
+        "gastos_hoy": gastos_hoy,
+        "diferencia_hoy": ingresos_hoy - gastos_hoy,
+        "ingresos_mes": ingresos_mes,
+        "gastos_mes": gastos_mes,
+        "diferencia_mes": ingresos_mes - gastos_mes,
+        "meses_labels": meses_labels,
+        "ingresos_mes_chart": [resumen_mes_dict[m]["ingresos"] for m in meses_labels],
+        "gastos_mes_chart": [resumen_mes_dict[m]["gastos"] for m in meses_labels],
+        "cat_labels": list(gastos_por_categoria.keys()),
+        "cat_values": list(gastos_por_categoria.values()),
+        "ultimas_transacciones": ultimas_transacciones,
+        "fechas_linea": fechas_linea,
+        "valores_linea": [saldos_por_dia[f] for f in fechas_linea],
+    }
 
-    return render_template(
-        "transacciones.html",
-        cuentas=cuentas_lista,
-        transacciones=trans_lista,
-        formatear_cop=formatear_cop,
-        error=error,
-        categorias_gasto=CATEGORIAS_GASTO,
-        categorias_ingreso=CATEGORIAS_INGRESO,
-        fecha_trabajo=fecha_trabajo,
-    )
 
+def _armar_dashboard(hoy_date, cuentas_lista, meses, dia, saldos_30, ultimas, saldo_actual):
+    """
+    Cifras de home() a partir de las filas por mes y la de hoy (con la forma
+    de resumen_meses / resumen_dias), el saldo final de los últimos 30 días
+    con movimientos ({fecha: saldo}), las últimas transacciones (de la más
+    nueva a la más vieja) y el saldo global actual (o None).
+    """
+    mes_actual = hoy_date.isoformat()[:7]
 
+    # 1) Saldo global actual = saldo_final de la última transacción en orden de fecha
+    total_global = saldo_actual or 0
+    ultimas_transacciones = []
+    for data in ultimas:
+        valor = float(data.get("valor", 0))
+        tipo_t = (data.get("tipo", "") or "").lower()
+        if tipo_t == "gasto":
+            data["valor_mostrado"] = -abs(valor)
+        else:
+            data["valor_mostrado"] = abs(valor)
+        ultimas_transacciones.append(data)
 
-# ----------- VISTAS HISTÓRICAS: INGRESOS / GASTOS -----------
+    if total_global == 0:
+        total_global = sum(c.get("saldo_inicial", 0) for c in cuentas_lista)
+
+    # 3) y 5) Resumen y gastos por categoría del mes actual
+    mes = next((m for m in meses if m.get("mes") == mes_actual), _fila_resumen({}))
+    gastos_por_categoria = mes["gastos_por_categoria"]
+
+    fechas_linea = sorted(saldos_30.keys())
+
+    return {
+        "total_global": total_global,
+        "ingresos_hoy": dia["ingresos"],
+        "gastos_hoy": dia["gastos"],
+        "diferencia_hoy": dia["diferencia"],
+        "ingresos_mes": mes["ingresos"],
+        "gastos_mes": mes["gastos"],
+        "diferencia_mes": mes["diferencia"],
+        "meses_labels": [m["mes"] for m in meses],
+        "ingresos_mes_chart": [m["ingresos"] for m in meses],
+        "gastos_mes_chart": [m["gastos"] for m in meses],
+        "cat_labels": list(gastos_por_categoria.keys()),
+        "cat_values": list(gastos_por_categoria.values()),
+        "ultimas_transacciones": ultimas_transacciones,
+        "fechas_linea": fechas_linea,
+        "valores_linea": [saldos_30[f] for f in fechas_linea],
+    }
 
 
-@app.route("/ingresos")
-@login_requerido
-def ingresos_historicos():
-    docs = (
-        db.collection("transacciones")
-        .where("tipo", "==", "ingreso")
-        .order_by("fecha")
-        .order_by("id_transaccion")
-        .stream()
+def dashboard_desde_resumenes(hoy_date):
+    """
+    Mismas cifras que calcular_dashboard(), pero leyendo los resúmenes
+    materializados (resumen_dias / resumen_meses) en vez de las transacciones.
+    Las consultas no dependen unas de otras y salen todas a la vez, así el
+    tablero tarda lo que la más lenta. Devuelve None si los resúmenes aún
+    no se han construido.
+    """
+    hoy = hoy_date.isoformat()
+    hace_30 = (hoy_date - timedelta(days=30)).isoformat()
+
+    # 2) Resumen del día
+    def resumen_hoy():
+        return lector().documento(db.collection("resumen_dias").document(hoy))
+
+    # 8) Saldo final de los últimos 30 días con movimientos
+    def resumenes_30_dias():
+        return list(lector().recorrer(
+            db.collection("resumen_dias")
+            .where("fecha", ">=", hace_30)
+            .order_by("fecha")
+        ))
+
+    filas_meses, cuentas_lista, doc_hoy, dias_30, ultimas = en_paralelo(
+        leer_resumen_meses,
+        leer_cuentas,
+        resumen_hoy,
+        resumenes_30_dias,
+        partial(leer_ultimas_transacciones, 5),
     )
+    meses = [_fila_resumen(m) for m in filas_meses]
+    if not meses:
+        return None
 
-    ingresos = []
-    for d in docs:
+    dia = _fila_resumen(doc_hoy.to_dict()) if doc_hoy.exists else _fila_resumen({})
+    saldos_30 = {}
+    for d in dias_30:
         data = d.to_dict()
-        # Siempre valor positivo para mostrar
-        valor = abs(float(data.get("valor", 0)))
-        data["valor_mostrado"] = valor
-        ingresos.append(data)
+        saldos_30[data["fecha"]] = data.get("saldo_final", 0)
+
+    return _armar_dashboard(
+        hoy_date, cuentas_lista, meses, dia, saldos_30, ultimas,
+        meses[-1].get("saldo_final"),
+    )
 
+
+def dashboard_desde_libro(libro, hoy_date, cuentas_lista):
+    """dashboard_desde_resumenes() con los índices del libro local, sin leer Firestore."""
+    hoy = hoy_date.isoformat()
+    hace_30 = (hoy_date - timedelta(days=30)).isoformat()
+
+    dias = libro.resumen_diario()
+    dia = next((d for d in dias if d["fecha"] == hoy), _fila_resumen({}))
+
+    # 8) Saldo al cierre de cada día con movimientos, del índice de saldos
+    saldos = libro.saldos()
+    fechas_30 = {d["fecha"] for d in libro.en_orden(hace_30)}
+    saldos_30 = {f: saldos.saldo_al(f) for f in fechas_30 if _ordinal_dia(f) is not None}
+    ultimas = [dict(d) for d in libro.ultimas(5)]
+
+    return _armar_dashboard(
+        hoy_date, cuentas_lista, _agrupar_por_mes(dias), dia, saldos_30, ultimas,
+        saldos.saldo_al(),
+    )
+
+
+# ----------- TABLERO PRECALCULADO (config/dashboard_snapshot) -----------
+#
+# Todo lo que necesita home.html queda guardado en un solo documento, así
+# cargar "/" cuesta una lectura y un render. Cada alta de transacción le
+# suma su delta (tablero_con_transaccion) en la misma transacción en que se
+# guarda; las escrituras que no pueden (cuentas, importación, conciliación,
+# y la primera alta de un día nuevo, cuando cambian "hoy", el mes actual y la
+# ventana de 30 días) lo vuelven a calcular y guardar desde libro_modificado().
+# Las lecturas no escriben: si no hay tablero de hoy, o con ?refrescar=1,
+# GET / lo calcula sin guardarlo.
+# Un cálculo desde cero solo se guarda si la versión del libro no cambió
+# mientras se hacía: si no, pisaría el delta de un alta que entró entretanto.
+
+tablero_ref = db.collection("config").document("dashboard_snapshot")
+
+# Minutos desde el último cálculo completo tras los que home.html avisa que
+# las cifras pueden estar desactualizadas (p. ej. por cambios hechos fuera de la app)
+TABLERO_VIGENCIA_MIN = float(os.getenv("FINANZAS_TABLERO_VIGENCIA_MIN", "60"))
+
+# Campos de las últimas transacciones que muestra home.html
+CAMPOS_ULTIMAS = ("id_transaccion", "fecha", "descripcion", "tipo", "cuenta", "categoria", "valor_mostrado")
+
+
+def calcular_tablero(hoy_date):
+    """
+    Cifras de home() desde cero (libro local, resúmenes o, si aún no hay,
+    una pasada por las transacciones), con los saldos por cuenta, listas
+    para guardar en config/dashboard_snapshot.
+    """
+    libro = libro_al_dia()
+    if libro is not None:
+        datos = dashboard_desde_libro(libro, hoy_date, leer_cuentas())
+    else:
+        datos = dashboard_desde_resumenes(hoy_date)
+
+    # Ya leídas en esta request (LectorPeticion): no vuelve a Firestore
+    cuentas_lista = leer_cuentas()
+
+    if datos is None:
+        # Aún no hay resúmenes → una sola pasada por las transacciones
+        datos = calcular_dashboard(transacciones_en_orden(), hoy_date, cuentas_lista)
+
+    datos["ultimas_transacciones"] = [
+        {campo: t.get(campo) for campo in CAMPOS_ULTIMAS} for t in datos["ultimas_transacciones"]
+    ]
+    datos["cuentas_dashboard"] = [
+        {"nombre": info.get("nombre", ""), "saldo": info.get("saldo_inicial", 0)}
+        for info in cuentas_lista
+    ]
+    datos["hoy"] = hoy_date.isoformat()
+    datos["calculado_en"] = datos["actualizado_en"] = marca_actual()
+    return datos
+
+
+def leer_tablero(hoy_date, refrescar=False):
+    """
+    El tablero guardado (una lectura). Si no existe, es de otro día o se
+    pide `refrescar`, se calcula de nuevo (sin guardarlo: eso lo hacen las
+    escrituras, con rehacer_tablero()).
+    """
+    if not refrescar:
+        doc = lector().documento(tablero_ref)
+        if doc is not None and doc.exists:
+            datos = doc.to_dict()
+            if datos.get("hoy") == hoy_date.isoformat():
+                return datos
+    return calcular_tablero(hoy_date)
+
+
+# Veces que rehacer_tablero() vuelve a calcular si entra otra escritura mientras tanto
+INTENTOS_TABLERO = 3
+
+
+def rehacer_tablero():
+    """
+    Calcula el tablero de hoy desde cero y lo guarda. Devuelve los datos
+    guardados, o None si en cada intento entró otra escritura (que deja el
+    tablero al día por su cuenta) o si hay un re-encadenado pendiente: con
+    los saldos a medio corregir saldría mal, lo rehace reencadenar() al
+    terminar.
+    """
+    if leer_reencadenado_pendiente() is not None:
+        return None
+    hoy_date = date.today()
+    for _ in range(INTENTOS_TABLERO):
+        # La versión se lee antes de calcular, y sin las cachés del proceso
+        # para que el cálculo vea por lo menos lo que había en esa versión
+        version = version_de(version_libro_ref.get())
+        lector().contar(1)
+        cache_lecturas.invalidar("transacciones", "cuentas", "resumen_meses", "saldos_diarios")
+        datos = calcular_tablero(hoy_date)
+        if guardar_tablero(db.transaction(), datos, version):
+            return datos
+    return None
+
+
+@transaccional
+def guardar_tablero(transaction, datos, version):
+    """
+    Guarda el tablero recién calculado si la versión del libro sigue siendo
+    `version` (la que había antes de calcularlo). Si entró una escritura
+    entretanto no se guarda. Devuelve si se guardó.
+    """
+    if version_de(lector().en_transaccion(transaction, version_libro_ref)) != version:
+        return False
+    transaction.set(tablero_ref, datos)
+    return True
+
+
+def tablero_con_transaccion(datos, trans):
+    """
+    Suma al tablero guardado `datos` una transacción recién dada de alta
+    (mismas cuentas que los resúmenes: por tipo, en valor absoluto).
+    Devuelve `datos`, modificado.
+    """
+    fecha, valor = trans["fecha"], trans["valor"]
+    delta = _delta_transaccion(trans["tipo"], trans["categoria"], valor)
+    hoy_date = date.fromisoformat(datos["hoy"])
+
+    # 1) Saldo global: todo lo que va después de la nueva se corre en `valor`
+    datos["total_global"] += valor
+
+    # 2) y 3) Resumen del día y del mes actual, con sus gastos por categoría
+    if fecha == datos["hoy"]:
+        datos["ingresos_hoy"] += delta["ingresos"]
+        datos["gastos_hoy"] += delta["gastos"]
+        datos["diferencia_hoy"] = datos["ingresos_hoy"] - datos["gastos_hoy"]
+    if fecha[:7] == datos["hoy"][:7]:
+        datos["ingresos_mes"] += delta["ingresos"]
+        datos["gastos_mes"] += delta["gastos"]
+        datos["diferencia_mes"] = datos["ingresos_mes"] - datos["gastos_mes"]
+        for categoria, monto in delta["gastos_por_categoria"].items():
+            if categoria in datos["cat_labels"]:
+                datos["cat_values"][datos["cat_labels"].index(categoria)] += monto
+            else:
+                datos["cat_labels"].append(categoria)
+                datos["cat_values"].append(monto)
+
+    # 4) Gráfica mensual
+    mes = fecha[:7]
+    if mes not in datos["meses_labels"]:
+        posicion = bisect.bisect(datos["meses_labels"], mes)
+        datos["meses_labels"].insert(posicion, mes)
+        datos["ingresos_mes_chart"].insert(posicion, 0.0)
+        datos["gastos_mes_chart"].insert(posicion, 0.0)
+    posicion = datos["meses_labels"].index(mes)
+    datos["ingresos_mes_chart"][posicion] += delta["ingresos"]
+    datos["gastos_mes_chart"][posicion] += delta["gastos"]
+
+    # 6) Últimas transacciones (las 5 de mayor id; otro worker puede tener ids menores)
+    nueva = {campo: trans.get(campo) for campo in CAMPOS_ULTIMAS}
+    nueva["valor_mostrado"] = -abs(valor) if trans["tipo"] == "gasto" else abs(valor)
+    ultimas = datos["ultimas_transacciones"] + [nueva]
+    ultimas.sort(key=lambda t: t.get("id_transaccion") or 0, reverse=True)
+    datos["ultimas_transacciones"] = ultimas[:5]
+
+    # 8) Línea de saldo: el cierre de ese día y de los siguientes se corre en
+    #    `valor`; si el día no tenía movimientos, cierra en el saldo de la nueva
+    fechas, valores = datos["fechas_linea"], datos["valores_linea"]
+    for i, f in enumerate(fechas):
+        if f >= fecha:
+            valores[i] += valor
+    if fecha not in fechas and fecha >= (hoy_date - timedelta(days=30)).isoformat():
+        posicion = bisect.bisect(fechas, fecha)
+        fechas.insert(posicion, fecha)
+        valores.insert(posicion, trans["saldo_final"])
+
+    # Saldo de la cuenta
+    for c in datos["cuentas_dashboard"]:
+        if c["nombre"] == trans["cuenta"]:
+            c["saldo"] = trans["saldo_en_cuenta"]
+
+    datos["actualizado_en"] = marca_actual()
+    return datos
+
+
+def operacion_tablero(snapshot, trans):
+    """
+    Operación de escribir_en_lotes() que aplica tablero_con_transaccion() al
+    tablero guardado (`snapshot`, leído en la misma transacción que el
+    alta), o None si no hay tablero de hoy. Si no se puede sumar, lo borra.
+    En los dos últimos casos quien da el alta lo rehace (libro_modificado).
+    """
+    if not snapshot.exists:
+        return None
+    datos = snapshot.to_dict()
+    if datos.get("hoy") != date.today().isoformat():
+        return None  # cambio de día
+    try:
+        return ("set", tablero_ref, tablero_con_transaccion(datos, trans))
+    except Exception as e:
+        print("No se pudo poner al día el tablero:", e)
+        return ("delete", tablero_ref, None)
+
+
+@app.route("/")
+@login_requerido
+def home():
+    datos = leer_tablero(date.today(), refrescar=request.args.get("refrescar") == "1")
+
+    ahora = marca_actual()
+    minutos = (ahora - datos["actualizado_en"]) // 60_000
+
+    # -------- RENDER --------
     return render_template(
-        "ingresos.html",
-        ingresos=ingresos,
-        formatear_cop=formatear_cop,
+        "home.html",
+        total_global=datos["total_global"],
+        ingresos_hoy=datos["ingresos_hoy"],
+        gastos_hoy=datos["gastos_hoy"],
+        diferencia_hoy=datos["diferencia_hoy"],
+        ingresos_mes=datos["ingresos_mes"],
+        gastos_mes=datos["gastos_mes"],
+        diferencia_mes=datos["diferencia_mes"],
+        meses_labels_json=json.dumps(datos["meses_labels"]),
+        ingresos_mes_chart_json=json.dumps(datos["ingresos_mes_chart"]),
+        gastos_mes_chart_json=json.dumps(datos["gastos_mes_chart"]),
+        cat_labels_json=json.dumps(datos["cat_labels"]),
+        cat_values_json=json.dumps(datos["cat_values"]),
+        ultimas_transacciones=datos["ultimas_transacciones"],
+        cuentas_dashboard=datos["cuentas_dashboard"],
+        fechas_linea_json=json.dumps(datos["fechas_linea"]),
+        valores_linea_json=json.dumps(datos["valores_linea"]),
+        tablero_minutos=minutos,
+        tablero_desactualizado=ahora - datos["calculado_en"] > TABLERO_VIGENCIA_MIN * 60_000,
     )
 
+@app.route("/historicos")
+@login_requerido
+def historicos():
+    return render_template("historicos.html", cuentas=leer_cuentas())
+
+
+# Puntos como máximo de una serie de /saldos/historico (10 años por día)
+MAX_PUNTOS_HISTORICO = 3660
+
+
+def fechas_serie(desde, hasta, paso):
+    """Fechas (ISO) de desde a hasta cada día, semana o fin de mes; hasta siempre va."""
+    fechas = []
+    actual = desde
+    while actual < hasta and len(fechas) <= MAX_PUNTOS_HISTORICO:
+        if paso == "dia":
+            fechas.append(actual.isoformat())
+            actual += timedelta(days=1)
+        elif paso == "semana":
+            fechas.append(actual.isoformat())
+            actual += timedelta(days=7)
+        else:
+            siguiente_mes = (actual.replace(day=1) + timedelta(days=32)).replace(day=1)
+            fin_mes = siguiente_mes - timedelta(days=1)
+            if fin_mes < hasta:
+                fechas.append(fin_mes.isoformat())
+            actual = siguiente_mes
+    fechas.append(hasta.isoformat())
+    return fechas
+
+
+@app.route("/saldos/historico")
+@login_requerido
+def saldos_historico():
+    """
+    Serie del saldo al cierre de cada día (paso=dia), semana o mes entre
+    desde y hasta, global o de una cuenta, para la gráfica de históricos.
+    Cada punto sale del índice de saldos en O(log n), sin recorrer el rango.
+    """
+    hoy = date.today()
+    try:
+        hasta = date.fromisoformat(request.args.get("hasta") or hoy.isoformat())
+        desde = date.fromisoformat(
+            request.args.get("desde") or (hasta - timedelta(days=90)).isoformat()
+        )
+    except ValueError:
+        return {"error": "Las fechas deben tener el formato AAAA-MM-DD."}, 400
+
+    paso = request.args.get("paso", "dia")
+    cuenta = request.args.get("cuenta") or None
+    if paso not in ("dia", "semana", "mes"):
+        return {"error": "paso debe ser dia, semana o mes."}, 400
+    if desde > hasta:
+        return {"error": "La fecha desde es posterior a la fecha hasta."}, 400
+
+    fechas = fechas_serie(desde, hasta, paso)
+    if len(fechas) > MAX_PUNTOS_HISTORICO:
+        return {"error": "Demasiados puntos, use un paso más largo."}, 400
+
+    cuentas_lista = leer_cuentas()
+    indice = indice_saldos()
+    if cuenta is None:
+        if indice.saldo_inicial is None:
+            # Aún no hay transacciones → suma de saldos de las cuentas
+            total = sum(c.get("saldo_inicial", 0) for c in cuentas_lista)
+            saldos = [total for _ in fechas]
+        else:
+            saldos = [indice.saldo_al(f) for f in fechas]
+    else:
+        datos_c = next((c for c in cuentas_lista if c.get("nombre") == cuenta), None)
+        if datos_c is None:
+            return {"error": "No existe esa cuenta."}, 404
+        saldo_actual = float(datos_c.get("saldo_inicial", 0))
+        saldos = [indice.saldo_cuenta_al(cuenta, f, saldo_actual) for f in fechas]
+
+    return {"cuenta": cuenta, "paso": paso, "fechas": fechas, "saldos": saldos}
+
+
+@app.route("/cuentas", methods=["GET", "POST"])
+@login_requerido
+def cuentas():
+    error_msg = None
+
+    # Crear cuenta
+    if request.method == "POST":
+        nombre = request.form.get("nombre", "").strip()
+        saldo_inicial_str = request.form.get("saldo_inicial", "0").strip()
+
+        try:
+            saldo_inicial = float(saldo_inicial_str or 0)
+        except ValueError:
+            saldo_inicial = 0
+
+        if not nombre:
+            error_msg = "El nombre de la cuenta es obligatorio."
+        else:
+            # Evitar duplicados
+            nombre_key = nombre.lower()
+            docs = lector().recorrer(db.collection("cuentas"))
+            nombres_existentes = [
+                (d.to_dict().get("nombre", "").strip().lower())
+                for d in docs
+            ]
+
+            if nombre_key in nombres_existentes:
+                error_msg = "Ya existe una cuenta con ese nombre."
+            else:
+                db.collection("cuentas").add({
+                    "nombre": nombre,
+                    "saldo_inicial": saldo_inicial,
+                })
+                libro_modificado("cuentas")
+                return redirect(url_for("cuentas"))
+
+    # --- Leer todas las cuentas ---
+    lista = leer_cuentas()
+
+    # Total de cuentas (solo suma de saldos de cada cuenta)
+    total_cuentas = sum(c.get("saldo_inicial", 0) for c in lista)
+
+    # 2️⃣ OBTENER SALDO ACTUAL REAL desde la ÚLTIMA transacción (en orden de fecha)
+    saldo_actual_real = leer_saldo_actual()
+    if saldo_actual_real is None:
+        saldo_actual_real = total_cuentas  # por defecto si no hay transacciones
+
+    # 1️⃣ SALDO INICIAL DEL DÍA (saldos_diarios)
+    #    Si es un día nuevo, el saldo inicial del día = saldo_actual_real
+    hoy = date.today().isoformat()
+    datos_hoy = leer_saldo_diario(hoy)
+
+    if datos_hoy is not None:
+        # Ya había saldo guardado hoy
+        saldo_inicial_dia = datos_hoy.get("saldo_inicial", saldo_actual_real)
+    else:
+        # Día nuevo → el saldo inicial ES el saldo actual global
+        saldo_inicial_dia = saldo_actual_real
+        datos_hoy = {
+            "fecha": hoy,
+            "saldo_inicial": saldo_inicial_dia,
+            "saldo_final": saldo_inicial_dia,
+        }
+        db.collection("saldos_diarios").document(hoy).set(datos_hoy)
+        cache_lecturas.poner(("saldos_diarios", hoy), datos_hoy)
+
+    # 👇 OJO: este return va alineado con el if, NO dentro del else
+    return render_template(
+        "cuentas.html",
+        cuentas=lista,
+        formatear_cop=formatear_cop,
+        total_cuentas=saldo_actual_real,
+        saldo_inicial_dia=saldo_inicial_dia,
+        error=error_msg,
+    )
+
+
+@app.route("/cuentas/borrar/<id_doc>", methods=["POST"])
+@login_requerido
+def borrar_cuenta(id_doc):
+    db.collection("cuentas").document(id_doc).delete()
+    libro_modificado("cuentas")
+    return redirect(url_for("cuentas"))
+
+
+@app.route("/cuentas/editar/<id_doc>", methods=["POST"])
+@login_requerido
+def editar_cuenta(id_doc):
+    """
+    Actualiza el saldo_inicial (saldo actual) de una cuenta existente.
+    Acepta valores con formato tipo $1.234.567,89 o números crudos.
+    """
+    bruto = request.form.get("saldo_inicial", "0").strip()
+
+    # Quitar símbolo de peso, espacios y separadores de miles
+    limpio = (
+        bruto.replace("$", "")
+        .replace(" ", "")
+        .replace("\u00a0", "")  # espacio raro
+        .replace(".", "")  # puntos de miles
+    )
+    # Cambiar coma decimal por punto
+    limpio = limpio.replace(",", ".")
+
+    try:
+        nuevo_saldo = float(limpio or 0)
+    except ValueError:
+        nuevo_saldo = 0
+
+    db.collection("cuentas").document(id_doc).update({"saldo_inicial": nuevo_saldo})
+    libro_modificado("cuentas")
+
+    return redirect(url_for("cuentas"))
+
+
+# ----------- SALDO POR CUENTA -----------
+
+
+def buscar_cuenta(nombre):
+    """Documento de la cuenta con ese nombre (o None), una lectura por request."""
+    consulta = db.collection("cuentas").where("nombre", "==", nombre).limit(1)
+    return lector().consulta(
+        ("cuenta", nombre), lambda: next(iter(lector().recorrer(consulta)), None), copiar=False
+    )
+
+
+def saldo_anterior_de_cuenta(nombre, cuenta_doc):
+    """
+    Saldo de la cuenta antes de una transacción nueva.
+
+    Sale del documento de la cuenta (saldo_en_cuenta / ultimo_id_transaccion),
+    así no importa cuánto historial tenga. Las cuentas que todavía no tienen
+    esos campos (datos de antes) se calculan una vez desde su historial.
+    """
+    datos_c = cuenta_doc.to_dict() if cuenta_doc is not None else {}
+    if "ultimo_id_transaccion" in datos_c:
+        return datos_c.get("saldo_en_cuenta", 0)
+
+    trans_docs = lector().recorrer(
+        db.collection("transacciones")
+        .where("cuenta", "==", nombre)
+        .order_by("id_transaccion")
+    )
+    saldo_anterior = None
+    for t in trans_docs:
+        saldo_anterior = t.to_dict().get("saldo_en_cuenta")
+
+    if saldo_anterior is None:
+        saldo_anterior = datos_c.get("saldo_inicial", 0)
+
+    return saldo_anterior
+
+
+def conciliar_cuentas(corregir=False):
+    """
+    Reproduce TODAS las transacciones en orden de id_transaccion y compara,
+    para cada cuenta, el saldo_en_cuenta / ultimo_id_transaccion guardados en
+    la cuenta con los de la última transacción. También cuenta los "saltos":
+    transacciones cuyo saldo_en_cuenta no es el anterior + valor.
+
+    Con corregir=True guarda los valores reproducidos en las cuentas
+    que no cuadran.
+    """
+    reproduccion = {}  # cuenta -> {"saldo", "ultimo_id", "saltos"}
+    docs = db.collection("transacciones").order_by("id_transaccion").stream()
+    for d in docs:
+        data = d.to_dict()
+        estado = reproduccion.setdefault(
+            data.get("cuenta", ""), {"saldo": None, "ultimo_id": None, "saltos": 0}
+        )
+        saldo = data.get("saldo_en_cuenta")
+        valor = float(data.get("valor", 0))
+        if estado["saldo"] is not None and saldo is not None:
+            if abs(estado["saldo"] + valor - saldo) > 0.005:
+                estado["saltos"] += 1
+        if saldo is not None:
+            estado["saldo"] = saldo
+        estado["ultimo_id"] = data.get("id_transaccion")
+
+    resultados = []
+    correcciones = []
+    for c in db.collection("cuentas").stream():
+        datos_c = c.to_dict()
+        nombre = datos_c.get("nombre", "")
+        esperado = reproduccion.get(nombre)
+        if esperado is None or esperado["saldo"] is None:
+            continue
+
+        guardado = datos_c.get("saldo_en_cuenta")
+        ok = (
+            guardado is not None
+            and abs(guardado - esperado["saldo"]) <= 0.005
+            and datos_c.get("ultimo_id_transaccion") == esperado["ultimo_id"]
+        )
+        resultados.append({
+            "cuenta": nombre,
+            "guardado": guardado,
+            "calculado": esperado["saldo"],
+            "ultimo_id": esperado["ultimo_id"],
+            "saltos": esperado["saltos"],
+            "ok": ok,
+        })
+        if corregir and not ok:
+            correcciones.append(("update", c.reference, {
+                "saldo_en_cuenta": esperado["saldo"],
+                "ultimo_id_transaccion": esperado["ultimo_id"],
+            }))
+
+    if correcciones:
+        escribir_en_lotes(correcciones)
+        libro_modificado("cuentas")
+
+    return resultados
+
+
+@app.cli.command("conciliar-cuentas")
+@click.option("--corregir", is_flag=True, help="Guarda el saldo reproducido en las cuentas que no cuadran.")
+def conciliar_cuentas_cmd(corregir):
+    """Verifica el saldo guardado de cada cuenta contra el historial completo."""
+    resultados = conciliar_cuentas(corregir=corregir)
+    descuadradas = 0
+    for r in resultados:
+        estado = "OK" if r["ok"] else ("CORREGIDA" if corregir else "DESCUADRE")
+        if not r["ok"]:
+            descuadradas += 1
+        print(
+            f"{estado:10} {r['cuenta']:25} guardado={r['guardado']} "
+            f"calculado={r['calculado']} ultimo_id={r['ultimo_id']} saltos={r['saltos']}"
+        )
+    if descuadradas and not corregir:
+        raise SystemExit(1)
+
+
+@transaccional
+def _guardar_alta(transaction, trans, cuenta_ref, visto=None):
+    """
+    Guarda `trans` (una transacción nueva, sin saldos) en una sola
+    transacción de Firestore, así dos altas a la vez no parten de los mismos
+    saldos. Dentro de ella se lee todo lo que depende de lo ya guardado: la
+    versión del libro, la cuenta, las vecinas en orden de (fecha, id),
+    saldos_diarios, resumen_dias y resumen_meses de su día y mes, el
+    tablero y el re-encadenado pendiente; y se escriben la transacción con
+    sus saldos, la cuenta, esos tres documentos, el tablero y la versión.
+
+    Una cantidad fija de documentos sin importar la fecha: si es atrasada,
+    lo que va después (transacciones, saldos_diarios y resúmenes) queda
+    marcado en config/reencadenar dentro de la misma transacción, y lo
+    corrige reencadenar(). `visto` es el pendiente que se leyó antes (ver
+    marcar_reencadenado).
+
+    Completa id_transaccion, los saldos y actualizado_en de `trans`.
+    Devuelve (si quedó un re-encadenado pendiente, si el tablero guardado
+    quedó al día con el delta).
+    """
+    fecha, valor = trans["fecha"], trans["valor"]
+    saldo_dia_ref = db.collection("saldos_diarios").document(fecha)
+    resumen_dia_ref = db.collection("resumen_dias").document(fecha)
+    resumen_mes_ref = db.collection("resumen_meses").document(fecha[:7])
+
+    # El objeto Transaction no es seguro entre hilos: todo se lee desde este,
+    # primero los documentos en un solo get_all y después las consultas.
+    # Todas las altas leen y suben config/version_libro: con eso Firestore
+    # las hace esperar (o reintentar) una detrás de otra
+    referencias = [
+        contador_trans_ref, version_libro_ref, saldo_dia_ref, resumen_dia_ref,
+        resumen_mes_ref, tablero_ref, reencadenar_ref,
+    ]
+    if cuenta_ref is not None:
+        referencias.append(cuenta_ref)
+    (contador_doc, _, saldo_dia_doc, resumen_dia_doc, resumen_mes_doc, tablero_doc,
+     reencadenar_doc, *cuenta) = lector().documentos_en_transaccion(transaction, referencias)
+    cuenta_doc = cuenta[0] if cuenta and cuenta[0].exists else None
+
+    # El id sale del contador en esta misma transacción: como las altas ya
+    # van en fila por version_libro no suma contención, y los ids quedan en
+    # el orden en que se confirman (el mayor es el más reciente)
+    contador = (contador_doc.get("contador") or 0) if contador_doc.exists else 0
+    trans["id_transaccion"] = contador + 1
+
+    anterior, siguiente = (
+        leer() for leer in vecinas_en_cadena(fecha, trans["id_transaccion"], transaction)
+    )
+
+    # Saldo en la cuenta (saldo_en_cuenta), guardado en la propia cuenta
+    saldo_en_cuenta = saldo_anterior_de_cuenta(trans["cuenta"], cuenta_doc) + valor
+
+    # Saldo global (saldo_inicial / saldo_final): sigue a la transacción
+    # anterior en orden de fecha; si va antes de todas, toma el saldo de
+    # apertura de la que era la primera
+    saldo_inicial_global = None
+    if anterior is not None:
+        saldo_inicial_global = anterior.get("saldo_final")
+    elif siguiente is not None:
+        saldo_inicial_global = siguiente.get("saldo_inicial")
+
+    if saldo_inicial_global is None:
+        # No hay transacciones con saldo_final (versión vieja) →
+        # usamos la suma de saldos de cuentas ANTES de aplicar esta transacción.
+        cuentas_docs = lector().recorrer(db.collection("cuentas"), transaction)
+        saldo_inicial_global = sum(
+            c.to_dict().get("saldo_inicial", 0) for c in cuentas_docs
+        )
+
+    saldo_final_global = saldo_inicial_global + valor
+    trans["saldo_en_cuenta"] = saldo_en_cuenta
+    trans["saldo_inicial"] = saldo_inicial_global
+    trans["saldo_final"] = saldo_final_global
+    trans["actualizado_en"] = marca_actual()  # para las copias locales
+
+    operaciones = [
+        ("set", db.collection("transacciones").document(), trans),
+        ("merge", contador_trans_ref, {"contador": trans["id_transaccion"]}),
+    ]
+
+    if cuenta_doc is not None:
+        operaciones.append(("update", cuenta_ref, {
+            "saldo_inicial": saldo_en_cuenta,
+            "saldo_en_cuenta": saldo_en_cuenta,
+            "ultimo_id_transaccion": trans["id_transaccion"],
+        }))
+
+    datos_dia = saldo_dia_doc.to_dict() if saldo_dia_doc.exists else {}
+    datos_dia["fecha"] = fecha
+    datos_dia.setdefault("saldo_inicial", saldo_inicial_global)
+    datos_dia["saldo_final"] = saldo_final_global
+    operaciones.append(("merge", saldo_dia_ref, datos_dia))
+    operaciones.append(operacion_version())
+    tablero = operacion_tablero(tablero_doc, trans)
+    if tablero is not None:
+        operaciones.append(tablero)
+    tablero_al_dia = tablero is not None and tablero[0] == "set"
+
+    # La transacción nueva es la última de su día, así que en los resúmenes
+    # de su día y su mes solo cambia el cierre (o se crean abriendo con su
+    # saldo_inicial); los siguientes los corre el re-encadenado
+    delta = _delta_transaccion(trans["tipo"], trans["categoria"], valor)
+    for nombre, campo, doc in (
+        ("resumen_dias", "fecha", resumen_dia_doc),
+        ("resumen_meses", "mes", resumen_mes_doc),
+    ):
+        operaciones += _operaciones_resumen(
+            nombre, campo, ([], [doc] if doc.exists else []), {doc.id: delta}, saldo_inicial_global
+        )
+
+    actual = reencadenar_doc.to_dict() if reencadenar_doc.exists else None
+    pendiente = siguiente is not None or actual is not None
+    if pendiente:
+        operaciones.append(("set", reencadenar_ref, punto_reencadenado(
+            actual, trans["fecha"], trans["id_transaccion"], saldo_final_global, visto=visto
+        )))
+
+    for operacion in operaciones:
+        escribir_operacion(transaction, *operacion)
+    return pendiente, tablero_al_dia
+
+
+def registrar_transaccion(fecha, descripcion, valor, tipo, cuenta, categoria):
+    """
+    Guarda una transacción nueva (`valor` ya con signo).
+
+    Primero mira si hay un re-encadenado pendiente; después las lecturas y
+    las escrituras (la transacción, el saldo de la cuenta, saldos_diarios,
+    resumen_dias, resumen_meses, el tablero, la versión del libro y el
+    punto pendiente) van en una sola transacción de Firestore
+    (_guardar_alta). Si la fecha es atrasada, después se re-encadena lo que
+    va detrás. Devuelve el documento guardado.
+    """
+    # Se lee antes que la transacción anterior: si no hay nada pendiente,
+    # el saldo_final de esa ya está corregido
+    pendiente, cuenta_doc = en_paralelo(
+        leer_reencadenado_pendiente,
+        lambda: buscar_cuenta(cuenta),
+    )
+
+    trans = {
+        # El id y los saldos los pone _guardar_alta()
+        "id_transaccion": None,
+        "fecha": fecha,
+        "descripcion": descripcion,
+        "valor": valor,
+        "tipo": tipo,
+        "cuenta": cuenta,
+        "categoria": categoria,
+        "saldo_en_cuenta": None,
+        "saldo_inicial": None,
+        "saldo_final": None,
+    }
+
+    # 1. Id, saldos y escrituras, en una transacción
+    reencadenar_pendiente, tablero_al_dia = _guardar_alta(
+        db.transaction(), trans, cuenta_doc.reference if cuenta_doc is not None else None,
+        visto=pendiente,
+    )
+    libro_modificado(
+        "transacciones", *(["cuentas"] if cuenta_doc is not None else []),
+        version_subida=True, tablero_al_dia=tablero_al_dia,
+    )
+
+    # 2. Fecha atrasada (o un re-encadenado a medias): corregir lo que va después
+    if reencadenar_pendiente:
+        continuar_reencadenado()
+    return trans
+
+
+def valor_con_signo(tipo, valor):
+    """Los gastos se guardan en negativo y los ingresos en positivo."""
+    if tipo.lower() == "gasto":
+        return -abs(valor)
+    return abs(valor)
+
+
+@app.route("/transacciones", methods=["GET", "POST"])
+@login_requerido
+def transacciones():
+    error = None
+
+    # 1. Determinar la FECHA DE TRABAJO
+    if request.method == "POST":
+        fecha_trabajo = request.form.get("fecha_trabajo") or date.today().isoformat()
+    else:
+        fecha_trabajo = request.args.get("fecha") or date.today().isoformat()
+
+    # ------------------- POST: guardar transacción -------------------
+    if request.method == "POST":
+        # la fecha REAL de la transacción SIEMPRE será la fecha_trabajo
+        fecha = fecha_trabajo
+        descripcion = request.form.get("descripcion", "").strip()
+        valor_str = request.form.get("valor", "0").strip()
+        tipo = (request.form.get("tipo", "ingreso") or "").lower()
+
+        cuenta = request.form.get("cuenta", "").strip()
+        categoria = request.form.get("categoria", "").strip()
+
+        if not cuenta:
+            error = "Debes seleccionar una cuenta."
+        else:
+            try:
+                valor = float(valor_str or 0)
+            except ValueError:
+                error = "El valor ingresado no es válido."
+
+        if not error:
+            # 1. Ajustar signo
+            valor_ajustado = valor_con_signo(tipo, valor)
+
+            # 2. Guardar (saldos, id, transacción, cuenta y resúmenes)
+            registrar_transaccion(fecha, descripcion, valor_ajustado, tipo, cuenta, categoria)
+
+            # Volvemos a la misma fecha de trabajo
+            return redirect(url_for("transacciones", fecha=fecha_trabajo))
+
+       # ------------------- GET: mostrar SOLO la fecha de trabajo -------------------
+
+    # Cuentas para el combo
+    cuentas_lista = leer_cuentas()
+
+    # Transacciones SOLO de esa fecha de trabajo
+    trans_docs = lector().recorrer(
+        db.collection("transacciones")
+        .where("fecha", "==", fecha_trabajo)
+        .order_by("id_transaccion")
+    )
+
+    trans_lista = []
+
+    for d in trans_docs:
+        data = d.to_dict()
+
+        # valor_mostrado: positivo para ingresos, negativo para gastos
+        valor = float(data.get("valor", 0))
+        tipo_t = (data.get("tipo", "") or "").lower()
+        if tipo_t == "gasto":
+            data["valor_mostrado"] = -abs(valor)
+        else:
+            data["valor_mostrado"] = abs(valor)
+
+        # saldo_global_mostrado: usar SIEMPRE el saldo_final guardado en la transacción
+        data["saldo_global_mostrado"] = data.get("saldo_final", 0)
+
+        trans_lista.append(data)
+
+    return render_template(
+        "transacciones.html",
+        cuentas=cuentas_lista,
+        transacciones=trans_lista,
+        formatear_cop=formatear_cop,
+        error=error,
+        categorias_gasto=CATEGORIAS_GASTO,
+        categorias_ingreso=CATEGORIAS_INGRESO,
+        fecha_trabajo=fecha_trabajo,
+    )
+
+
+
+# ----------- RE-ENCADENADO DE SALDOS (altas con fecha atrasada) -----------
+#
+# saldo_inicial / saldo_final de las transacciones siguen el orden (fecha,
+# id_transaccion), el mismo del resumen diario y la gráfica de saldo. Una
+# alta con fecha atrasada (o una importación con fechas viejas) corre todo
+# lo que va después, y también los saldos de saldos_diarios, resumen_dias y
+# resumen_meses de los días y meses siguientes: eso se corrige desde ese
+# punto en ventanas de
+# VENTANA_REENCADENAR transacciones, cada una con una lectura paginada y un
+# lote de escrituras (que pone actualizado_en, para las copias locales).
+#
+# El punto desde donde falta queda en config/reencadenar como
+# {fecha, id_transaccion, saldo, apertura, cambios}: la última transacción
+# que ya cuadra, su saldo_final, el saldo con que abrió ese día (si se sabe)
+# y un contador que sube con cada alta mientras haya algo pendiente. Una
+# alta lo anota en su propia transacción (_guardar_alta). Las
+# primeras ventanas corren en la misma request y el resto en segundo plano;
+# si el proceso se cae, se retoma con `flask reencadenar`.
+
+# Transacciones por ventana (deja lugar en el lote para los saldos_diarios)
+VENTANA_REENCADENAR = 400
+# Ventanas que se corren dentro de la request antes de seguir en segundo plano
+VENTANAS_SINCRONAS = int(os.getenv("FINANZAS_VENTANAS_REENCADENAR", "4"))
+
+reencadenar_ref = db.collection("config").document("reencadenar")
+hilo_reencadenar = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reencadenar")
+_lock_reencadenar = threading.Lock()
+
+
+def vecinas_en_cadena(fecha, id_transaccion, transaction=None):
+    """
+    Lecturas (funciones, para en_paralelo) de la transacción anterior y la
+    siguiente a (fecha, id_transaccion) en orden de fecha; cada una devuelve
+    un dict o None. Con `transaction` se leen dentro de ella.
+    """
+    cursor = {"fecha": fecha, "id_transaccion": id_transaccion}
+    trans = db.collection("transacciones")
+
+    def primera(consulta):
+        return next(
+            (d.to_dict() for d in lector().recorrer(consulta.limit(1), transaction)), None
+        )
+
+    return (
+        lambda: primera(
+            trans.where("fecha", "<=", fecha)
+            .order_by("fecha", direction=firestore.Query.DESCENDING)
+            .order_by("id_transaccion", direction=firestore.Query.DESCENDING)
+            .start_after(cursor)
+        ),
+        lambda: primera(
+            trans.where("fecha", ">=", fecha)
+            .order_by("fecha")
+            .order_by("id_transaccion")
+            .start_after(cursor)
+        ),
+    )
+
+
+def leer_reencadenado_pendiente():
+    """El punto pendiente de config/reencadenar (o None)."""
+    # Sin guardarlo en la request: el re-encadenado de fondo lo puede mover
+    doc = reencadenar_ref.get()
+    lector().contar(1)
+    return doc.to_dict() if doc.exists else None
+
+
+def punto_reencadenado(actual, fecha, id_transaccion, saldo, apertura=None, visto=None):
+    """
+    El punto que queda en config/reencadenar al anotar que hay que
+    re-encadenar después de (fecha, id_transaccion), que cuadra con
+    saldo_final `saldo`. Se queda el punto más temprano entre ese, el que ya
+    estaba (`actual`) y `visto` (el pendiente que se leyó antes de calcular
+    `saldo`: si el re-encadenado terminó entretanto, ese saldo pudo salir
+    de un valor viejo). Siempre sube `cambios`, para que una ventana que
+    leyó antes de esta alta no dé el tramo por terminado.
+    """
+    nuevo = {
+        "fecha": fecha,
+        "id_transaccion": id_transaccion,
+        "saldo": saldo,
+        "apertura": apertura,
+    }
+    for punto in (actual, visto):
+        if punto is not None and (
+            (punto["fecha"], punto["id_transaccion"]) <= (nuevo["fecha"], nuevo["id_transaccion"])
+        ):
+            nuevo = dict(punto)
+    nuevo["cambios"] = (actual or {}).get("cambios", 0) + 1
+    return nuevo
+
+
+@transaccional
+def marcar_reencadenado(transaction, fecha, id_transaccion, saldo, apertura=None, visto=None):
+    """Guarda punto_reencadenado() en config/reencadenar."""
+    snapshot = reencadenar_ref.get(transaction=transaction)
+    lector().contar(1)
+    actual = snapshot.to_dict() if snapshot.exists else None
+    transaction.set(reencadenar_ref, punto_reencadenado(
+        actual, fecha, id_transaccion, saldo, apertura=apertura, visto=visto
+    ))
+
+
+@transaccional
+def _avanzar_reencadenado(transaction, esperado, siguiente):
+    """Mueve el punto pendiente a `siguiente` (None = terminado) si sigue siendo `esperado`."""
+    snapshot = reencadenar_ref.get(transaction=transaction)
+    lector().contar(1)
+    if not snapshot.exists or snapshot.to_dict() != esperado:
+        return False
+    if siguiente is None:
+        transaction.delete(reencadenar_ref)
+    else:
+        transaction.set(reencadenar_ref, dict(siguiente, cambios=esperado.get("cambios", 0)))
+    return True
+
+
+def _reencadenar_ventana(pendiente):
+    """
+    Corrige las VENTANA_REENCADENAR transacciones que siguen al punto
+    pendiente y los saldos de saldos_diarios, resumen_dias y resumen_meses
+    de los días y meses que quedaron completos.
+    Devuelve (punto siguiente, o None si llegó al final; corregidas).
+    """
+    docs = list(lector().recorrer(
+        db.collection("transacciones")
+        .where("fecha", ">=", pendiente["fecha"])
+        .order_by("fecha")
+        .order_by("id_transaccion")
+        .start_after({"fecha": pendiente["fecha"], "id_transaccion": pendiente["id_transaccion"]})
+        .limit(VENTANA_REENCADENAR)
+    ))
+    final = len(docs) < VENTANA_REENCADENAR
+
+    saldo = pendiente["saldo"]
+    fecha_actual = pendiente["fecha"]
+    cierres = {fecha_actual: saldo}  # fecha -> saldo después de su última transacción leída
+    aperturas = {fecha_actual: pendiente.get("apertura")}  # fecha -> saldo antes de la primera
+    marca = marca_actual()
+    operaciones = []
+
+    for d in docs:
+        data = d.to_dict()
+        fecha = data.get("fecha")
+        if fecha != fecha_actual:
+            fecha_actual = fecha
+            aperturas[fecha] = saldo
+        saldo_final = saldo + float(data.get("valor", 0))
+        if data.get("saldo_inicial") != saldo or data.get("saldo_final") != saldo_final:
+            operaciones.append(("update", d.reference, {
+                "saldo_inicial": saldo,
+                "saldo_final": saldo_final,
+                "actualizado_en": marca,
+            }))
+        saldo = saldo_final
+        cierres[fecha] = saldo
+    corregidas = len(operaciones)
+
+    # saldos_diarios y resumen_dias (con los mismos saldos): el último día
+    # leído puede seguir en la próxima ventana
+    fechas = sorted(cierres)
+    for nombre in ("saldos_diarios", "resumen_dias"):
+        consulta = db.collection(nombre).where("fecha", ">=", pendiente["fecha"])
+        if not final:
+            consulta = consulta.where("fecha", "<", fecha_actual)
+        for d in lector().recorrer(consulta):
+            datos = d.to_dict()
+            fecha = datos.get("fecha", d.id)
+            cierre = cierres[fechas[bisect.bisect_right(fechas, fecha) - 1]]
+            apertura = aperturas[fecha] if fecha in aperturas else cierre  # día sin movimientos
+            cambios = {}
+            if datos.get("saldo_final") != cierre:
+                cambios["saldo_final"] = cierre
+            if apertura is not None and datos.get("saldo_inicial") != apertura:
+                cambios["saldo_inicial"] = apertura
+            if cambios:
+                operaciones.append(("update", d.reference, cambios))
+
+    # resumen_meses: abre con la apertura de su primer día, si ese día está
+    # en esta ventana, y cierra con el cierre del último, si el mes terminó
+    mes_pendiente = pendiente["fecha"][:7]
+    meses = {}  # mes -> [apertura o None, cierre]
+    for fecha in fechas:
+        if not fecha:
+            continue
+        if fecha[:7] not in meses:
+            meses[fecha[:7]] = [aperturas.get(fecha) if fecha[:7] > mes_pendiente else None, None]
+        meses[fecha[:7]][1] = cierres[fecha]
+    consulta = db.collection("resumen_meses").where("mes", ">=", mes_pendiente)
+    for d in lector().recorrer(consulta.where("mes", "<=", fecha_actual[:7])):
+        datos = d.to_dict()
+        mes = datos.get("mes", d.id)
+        if mes not in meses:
+            continue
+        apertura, cierre = meses[mes]
+        cambios = {}
+        if (final or mes < fecha_actual[:7]) and datos.get("saldo_final") != cierre:
+            cambios["saldo_final"] = cierre
+        if apertura is not None and datos.get("saldo_inicial") != apertura:
+            cambios["saldo_inicial"] = apertura
+        if cambios:
+            operaciones.append(("update", d.reference, cambios))
+
+    if operaciones:
+        operaciones.append(operacion_version())
+        escribir_en_lotes(operaciones)
+        # El tablero ya tiene los saldos corridos: el alta le sumó su valor
+        libro_modificado("transacciones", version_subida=True, tablero_al_dia=True)
+
+    if final:
+        return None, corregidas
+    ultimo = docs[-1].to_dict()
+    return {
+        "fecha": ultimo.get("fecha"),
+        "id_transaccion": ultimo.get("id_transaccion"),
+        "saldo": saldo,
+        "apertura": aperturas[fecha_actual],
+    }, corregidas
+
+
+def reencadenar(max_ventanas=None, esperar=True):
+    """
+    Re-encadena desde el punto pendiente, a lo sumo `max_ventanas` ventanas
+    (None = hasta el final). Con esperar=False no hace nada si otro hilo de
+    este proceso ya está en eso. Devuelve (transacciones corregidas, terminado).
+    """
+    if not _lock_reencadenar.acquire(blocking=esperar):
+        return 0, False
+    try:
+        corregidas = 0
+        ventanas = 0
+        pendiente = leer_reencadenado_pendiente()
+        while pendiente is not None:
+            if max_ventanas is not None and ventanas >= max_ventanas:
+                return corregidas, False
+            siguiente, n = _reencadenar_ventana(pendiente)
+            corregidas += n
+            ventanas += 1
+            if _avanzar_reencadenado(db.transaction(), pendiente, siguiente):
+                pendiente = None if siguiente is None else dict(
+                    siguiente, cambios=pendiente.get("cambios", 0)
+                )
+            else:
+                # Entró una alta mientras tanto: se sigue desde donde quedó el punto
+                pendiente = leer_reencadenado_pendiente()
+        if ventanas:
+            # Mientras estuvo pendiente no se rehízo el tablero (rehacer_tablero)
+            tablero = tablero_ref.get()
+            lector().contar(1)
+            if not tablero.exists or tablero.get("hoy") != date.today().isoformat():
+                rehacer_tablero()
+        return corregidas, True
+    finally:
+        _lock_reencadenar.release()
+
+
+def _reencadenar_en_segundo_plano():
+    try:
+        reencadenar()
+    except Exception as e:
+        print("No se pudo terminar de re-encadenar los saldos:", e)
+
+
+def continuar_reencadenado():
+    """Corre VENTANAS_SINCRONAS ventanas del pendiente y deja el resto en segundo plano."""
+    _, terminado = reencadenar(VENTANAS_SINCRONAS, esperar=False)
+    if not terminado:
+        hilo_reencadenar.submit(_reencadenar_en_segundo_plano)
+
+
+def reencadenar_desde(fecha, id_transaccion, saldo, visto=None):
+    """
+    Re-encadena lo que va después de (fecha, id_transaccion): marca el punto
+    y sigue con continuar_reencadenado().
+    """
+    marcar_reencadenado(db.transaction(), fecha, id_transaccion, saldo, visto=visto)
+    continuar_reencadenado()
+
+
+@app.cli.command("reencadenar")
+@click.option("--desde", default=None, help="Re-encadena todo desde esta fecha (AAAA-MM-DD).")
+def reencadenar_cmd(desde):
+    """Termina el re-encadenado pendiente, o rehace los saldos desde una fecha."""
+    if desde:
+        anterior, siguiente = (f() for f in vecinas_en_cadena(desde, 0))
+        if anterior is not None:
+            marcar_reencadenado(
+                db.transaction(), anterior["fecha"], anterior["id_transaccion"],
+                anterior.get("saldo_final", 0),
+            )
+        elif siguiente is not None:
+            marcar_reencadenado(db.transaction(), "", 0, siguiente.get("saldo_inicial", 0))
+    inicio = time.perf_counter()
+    corregidas, _ = reencadenar()
+    print(f"Re-encadenado: {corregidas} transacciones corregidas en {time.perf_counter() - inicio:.1f} s.")
+
+
+# ----------- IMPORTACIÓN MASIVA (CSV / OFX) -----------
+
+# Categoría que se usa cuando el archivo no trae una (p. ej. los OFX)
+CATEGORIA_GASTO_DEFECTO = "Contingencias y gastos miscelaneos"
+CATEGORIA_INGRESO_DEFECTO = "Otros ingresos"
+
+# Cuántos errores de filas rechazadas se guardan para mostrar
+MAX_ERRORES_IMPORTACION = 100
+
+
+def validar_categoria(tipo, categoria):
+    """Mensaje de error si la categoría no corresponde al tipo, o None."""
+    permitidas = CATEGORIAS_GASTO if tipo == "gasto" else CATEGORIAS_INGRESO
+    if categoria not in permitidas:
+        return f"La categoría '{categoria}' no es válida para un {tipo}."
+    return None
+
+
+def interpretar_monto(bruto):
+    """
+    Convierte montos como '1.234.567,89', '$ 1,234.50', '-50000' o '12,5'
+    en float. Si hay punto y coma, el último que aparece es el decimal.
+    """
+    limpio = (bruto or "").replace("$", "").replace(" ", "").replace("\u00a0", "")
+    if "," in limpio and "." in limpio:
+        if limpio.rfind(",") > limpio.rfind("."):
+            limpio = limpio.replace(".", "").replace(",", ".")
+        else:
+            limpio = limpio.replace(",", "")
+    elif "," in limpio:
+        limpio = limpio.replace(",", ".")
+    elif re.fullmatch(r"-?\d{1,3}(\.\d{3})+", limpio):
+        # 1.234.567 → puntos de miles
+        limpio = limpio.replace(".", "")
+    return float(limpio)
+
+
+def interpretar_fecha(bruta):
+    """Acepta YYYY-MM-DD, DD/MM/YYYY y YYYYMMDD (OFX); devuelve YYYY-MM-DD."""
+    bruta = (bruta or "").strip()
+    for formato in ("%Y-%m-%d", "%d/%m/%Y", "%Y%m%d"):
+        try:
+            return datetime.strptime(bruta[:10] if formato != "%Y%m%d" else bruta[:8], formato).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"Fecha no válida: '{bruta}'.")
+
+
+def _nombre_columna(nombre):
+    """'Descripción ' → 'descripcion'."""
+    sin_tildes = unicodedata.normalize("NFKD", nombre or "").encode("ascii", "ignore").decode()
+    return sin_tildes.strip().lower()
+
+
+def leer_csv(lineas):
+    """
+    Recorre un CSV (separado por coma o punto y coma) sin cargarlo entero.
+    Columnas: fecha, descripcion, valor y opcionalmente tipo, cuenta, categoria.
+    Genera (numero_de_linea, fila).
+    """
+    lineas = iter(lineas)
+    primera = next(lineas, "")
+    separador = ";" if primera.count(";") > primera.count(",") else ","
+    lector = csv.reader(chain([primera], lineas), delimiter=separador)
+
+    columnas = [_nombre_columna(c) for c in next(lector, [])]
+    for numero, valores in enumerate(lector, start=2):
+        if not any(v.strip() for v in valores):
+            continue
+        yield numero, {c: v.strip() for c, v in zip(columnas, valores)}
+
+
+def leer_ofx(lineas):
+    """
+    Recorre un extracto OFX (SGML o XML) sin cargarlo entero.
+    Genera (numero_de_linea, fila) por cada <STMTTRN>.
+    """
+    actual = None
+    inicio = 0
+    for numero, linea in enumerate(lineas, start=1):
+        for etiqueta, valor in re.findall(r"<(/?[A-Za-z0-9.]+)>([^<\r\n]*)", linea):
+            etiqueta = etiqueta.upper()
+            if etiqueta == "STMTTRN":
+                actual = {}
+                inicio = numero
+            elif etiqueta == "/STMTTRN" and actual is not None:
+                yield inicio, {
+                    "fecha": actual.get("DTPOSTED", ""),
+                    "valor": actual.get("TRNAMT", ""),
+                    "descripcion": actual.get("NAME") or actual.get("MEMO", ""),
+                }
+                actual = None
+            elif actual is not None and not etiqueta.startswith("/"):
+                actual[etiqueta] = valor.strip()
+
+
+def normalizar_fila(fila, cuenta_defecto, cuentas_validas):
+    """
+    Valida una fila importada y la deja como la guardaría el formulario.
+    Lanza ValueError con el motivo si no sirve.
+    """
+    fecha = interpretar_fecha(fila.get("fecha"))
+    try:
+        valor = interpretar_monto(fila.get("valor"))
+    except ValueError:
+        raise ValueError(f"Valor no válido: '{fila.get('valor', '')}'.")
+
+    tipo = (fila.get("tipo") or "").lower()
+    if not tipo:
+        tipo = "gasto" if valor < 0 else "ingreso"
+    if tipo not in ("gasto", "ingreso"):
+        raise ValueError(f"Tipo no válido: '{tipo}'.")
+
+    categoria = fila.get("categoria") or (
+        CATEGORIA_GASTO_DEFECTO if tipo == "gasto" else CATEGORIA_INGRESO_DEFECTO
+    )
+    error = validar_categoria(tipo, categoria)
+    if error:
+        raise ValueError(error)
+
+    cuenta = fila.get("cuenta") or cuenta_defecto
+    if not cuenta:
+        raise ValueError("La fila no tiene cuenta y no se eligió una por defecto.")
+    if cuenta not in cuentas_validas:
+        raise ValueError(f"La cuenta '{cuenta}' no existe.")
+
+    return {
+        "fecha": fecha,
+        "descripcion": fila.get("descripcion", ""),
+        "valor": valor_con_signo(tipo, valor),
+        "tipo": tipo,
+        "cuenta": cuenta,
+        "categoria": categoria,
+    }
+
+
+def _en_bloques(iterable, tamano):
+    iterador = iter(iterable)
+    while True:
+        bloque = list(islice(iterador, tamano))
+        if not bloque:
+            return
+        yield bloque
+
+
+def importar_transacciones(filas, cuenta_defecto=""):
+    """
+    Importa las filas de leer_csv() / leer_ofx() en el orden del archivo.
+
+    Encadena id_transaccion, saldo_en_cuenta, saldo_inicial y saldo_final en
+    memoria a continuación de la última transacción, y escribe las
+    transacciones en lotes de LOTE_MAXIMO. Las cuentas, saldos_diarios y
+    resúmenes se actualizan una sola vez al final con lo que alcanzó a
+    guardarse; si el archivo trae fechas anteriores a lo ya registrado (o
+    desordenadas), después se re-encadena desde la más vieja.
+    La memoria depende de los días tocados, no del número de filas.
+    """
+    cuentas_docs = {}
+    for d in lector().recorrer(db.collection("cuentas")):
+        cuentas_docs[d.to_dict().get("nombre", "")] = d
+
+    pendiente = leer_reencadenado_pendiente()
+    ultima, primera = (
+        next((d.to_dict() for d in lector().recorrer(consulta.limit(1))), None)
+        for consulta in (
+            db.collection("transacciones")
+            .order_by("fecha", direction=firestore.Query.DESCENDING)
+            .order_by("id_transaccion", direction=firestore.Query.DESCENDING),
+            db.collection("transacciones").order_by("fecha").order_by("id_transaccion"),
+        )
+    )
+    saldo_global = ultima.get("saldo_final") if ultima is not None else None
+    if saldo_global is None:
+        saldo_global = sum(d.to_dict().get("saldo_inicial", 0) for d in cuentas_docs.values())
+    saldo_global_antes = saldo_global
+    # Con saldo_apertura se re-encadena si alguna fila queda fuera de orden
+    saldo_apertura = primera.get("saldo_inicial") if primera is not None else saldo_global
+    ultima_fecha = ultima.get("fecha", "") if ultima is not None else ""
+    en_orden = True
+
+    saldos_cuenta = {}  # cuenta -> saldo_en_cuenta
+    ultimo_id_cuenta = {}  # cuenta -> id_transaccion
+    saldos_dia = {}  # fecha -> {"saldo_inicial", "saldo_final"}
+    deltas_dia = {}
+    deltas_mes = {}
+    resultado = {"importadas": 0, "rechazadas": 0, "errores": []}
+
+    def validas():
+        for linea, fila in filas:
+            try:
+                yield normalizar_fila(fila, cuenta_defecto, cuentas_docs)
+            except ValueError as e:
+                resultado["rechazadas"] += 1
+                if len(resultado["errores"]) < MAX_ERRORES_IMPORTACION:
+                    resultado["errores"].append((linea, str(e)))
+
+    try:
+        for bloque in _en_bloques(validas(), LOTE_MAXIMO):
+            primero, _ = reservar_bloque_ids(db.transaction(), len(bloque))
+            ids = range(primero, primero + len(bloque))
+
+            # Se calcula sobre copias y solo se confirma si el lote se guardó
+            saldo = saldo_global
+            saldos = dict(saldos_cuenta)
+            operaciones = []
+            marca = marca_actual()
+            for t, nuevo_id in zip(bloque, ids):
+                en_orden = en_orden and t["fecha"] >= ultima_fecha
+                ultima_fecha = max(ultima_fecha, t["fecha"])
+                cuenta = t["cuenta"]
+                if cuenta not in saldos:
+                    saldos[cuenta] = saldo_anterior_de_cuenta(cuenta, cuentas_docs[cuenta])
+                saldos[cuenta] += t["valor"]
+
+                t["id_transaccion"] = nuevo_id
+                t["saldo_en_cuenta"] = saldos[cuenta]
+                t["saldo_inicial"] = saldo
+                saldo += t["valor"]
+                t["saldo_final"] = saldo
+                t["actualizado_en"] = marca  # para las copias locales
+                operaciones.append(("set", db.collection("transacciones").document(), t))
+
+            escribir_en_lotes(operaciones)
+
+            saldo_global = saldo
+            saldos_cuenta = saldos
+            for t in bloque:
+                ultimo_id_cuenta[t["cuenta"]] = t["id_transaccion"]
+                dia = saldos_dia.setdefault(t["fecha"], {"saldo_inicial": t["saldo_inicial"]})
+                dia["saldo_final"] = t["saldo_final"]
+                delta = _delta_transaccion(t["tipo"], t["categoria"], t["valor"])
+                _sumar_delta(deltas_dia.setdefault(t["fecha"], {}), delta)
+                _sumar_delta(deltas_mes.setdefault(t["fecha"][:7], {}), delta)
+            resultado["importadas"] += len(bloque)
+    finally:
+        if resultado["importadas"]:
+            reencadenar = not en_orden or pendiente is not None
+            _cerrar_importacion(
+                cuentas_docs, saldos_cuenta, ultimo_id_cuenta, saldos_dia,
+                deltas_dia, deltas_mes, saldo_global_antes, reencadenar,
+            )
+            if reencadenar:
+                _reencadenar_importacion(min(saldos_dia), saldo_apertura, pendiente)
+                libro_modificado("transacciones", version_subida=True)
+
+    return resultado
+
+
+def _reencadenar_importacion(desde, saldo_apertura, visto):
+    """Re-encadena desde la transacción anterior al día `desde`."""
+    anterior = vecinas_en_cadena(desde, 0)[0]()
+    if anterior is not None:
+        reencadenar_desde(
+            anterior["fecha"], anterior["id_transaccion"], anterior.get("saldo_final", 0), visto
+        )
+    else:
+        reencadenar_desde("", 0, saldo_apertura, visto)
+
+
+def _cerrar_importacion(cuentas_docs, saldos_cuenta, ultimo_id_cuenta, saldos_dia,
+                        deltas_dia, deltas_mes, saldo_global_antes, reencadenar=False):
+    """
+    Actualiza cuentas, saldos_diarios y resúmenes después de una importación.
+    Con `reencadenar` el tablero no se rehace aquí sino después del re-encadenado.
+    """
+    refs_dia = [db.collection("saldos_diarios").document(f) for f in sorted(saldos_dia)]
+    lecturas = en_paralelo(
+        lambda: lector().documentos(refs_dia),
+        *_lecturas_resumen("resumen_dias", "fecha", min(deltas_dia)),
+        *_lecturas_resumen("resumen_meses", "mes", min(deltas_mes)),
+    )
+    docs_dia, lectura_dia, lectura_mes = lecturas[0], lecturas[1:3], lecturas[3:5]
+
+    operaciones = []
+    for cuenta, ultimo_id in ultimo_id_cuenta.items():
+        operaciones.append(("update", cuentas_docs[cuenta].reference, {
+            "saldo_inicial": saldos_cuenta[cuenta],
+            "saldo_en_cuenta": saldos_cuenta[cuenta],
+            "ultimo_id_transaccion": ultimo_id,
+        }))
+
+    for doc in docs_dia:
+        datos = doc.to_dict() if doc.exists else {}
+        datos["fecha"] = doc.id
+        datos.setdefault("saldo_inicial", saldos_dia[doc.id]["saldo_inicial"])
+        datos["saldo_final"] = saldos_dia[doc.id]["saldo_final"]
+        operaciones.append(("merge", doc.reference, datos))
+
+    operaciones += _operaciones_resumen(
+        "resumen_dias", "fecha", lectura_dia, deltas_dia, saldo_global_antes
+    )
+    operaciones += _operaciones_resumen(
+        "resumen_meses", "mes", lectura_mes, deltas_mes, saldo_global_antes
+    )
+
+    operaciones.append(operacion_version())
+    escribir_en_lotes(operaciones)
+    libro_modificado("transacciones", "cuentas", version_subida=True, tablero_al_dia=reencadenar)
+
+
+def _leer_archivo(lineas, nombre_archivo):
+    if nombre_archivo.lower().endswith((".ofx", ".qfx")):
+        return leer_ofx(lineas)
+    return leer_csv(lineas)
+
+
+@app.route("/transacciones/importar", methods=["POST"])
+@login_requerido
+def importar():
+    archivo = request.files.get("archivo")
+    if not archivo or not archivo.filename:
+        return redirect(url_for("transacciones"))
+
+    # Se lee en streaming: werkzeug deja los archivos grandes en disco
+    lineas = io.TextIOWrapper(archivo.stream, encoding="utf-8-sig", errors="replace", newline="")
+    resultado = importar_transacciones(
+        _leer_archivo(lineas, archivo.filename),
+        request.form.get("cuenta", "").strip(),
+    )
+
+    primer_error = ""
+    if resultado["errores"]:
+        linea, motivo = resultado["errores"][0]
+        primer_error = f"Línea {linea}: {motivo}"
+
+    return redirect(url_for(
+        "transacciones",
+        importadas=resultado["importadas"],
+        rechazadas=resultado["rechazadas"],
+        primer_error=primer_error or None,
+    ))
+
+
+@app.cli.command("importar-transacciones")
+@click.argument("archivo", type=click.Path(exists=True, dir_okay=False))
+@click.option("--cuenta", default="", help="Cuenta para las filas que no traen una.")
+def importar_transacciones_cmd(archivo, cuenta):
+    """Importa un extracto CSV u OFX."""
+    inicio = time.perf_counter()
+    with open(archivo, encoding="utf-8-sig", errors="replace", newline="") as f:
+        resultado = importar_transacciones(_leer_archivo(f, archivo), cuenta)
+    segundos = time.perf_counter() - inicio
+
+    print(
+        f"Importadas: {resultado['importadas']}  Rechazadas: {resultado['rechazadas']}  "
+        f"({segundos:.1f} s)"
+    )
+    for linea, motivo in resultado["errores"]:
+        print(f"  línea {linea}: {motivo}")
+
+
+# ----------- VISTAS HISTÓRICAS: INGRESOS / GASTOS -----------
+
+
+TAMANOS_PAGINA = (25, 50, 100, 200)
+TAMANO_PAGINA_DEFECTO = 50
+
+
+class CursorInvalido(ValueError):
+    """El cursor de paginación de la URL no tiene la forma 'fecha_id'."""
+
+
+@app.errorhandler(CursorInvalido)
+def cursor_invalido(error):
+    return Response(f"Cursor de paginación inválido: {error}", status=400)
+
+
+def _cursor(data):
+    """
+    Cursor de una fila para los enlaces de paginación: 'fecha_id'. None (sin
+    enlace) si a la fila le falta la fecha o el id, que no sirve de cursor.
+    """
+    fecha, id_t = data.get("fecha"), data.get("id_transaccion")
+    if not isinstance(fecha, str) or not isinstance(id_t, int) or isinstance(id_t, bool):
+        return None
+    return f"{fecha}_{id_t}"
+
+
+def _leer_cursor(texto):
+    """
+    '2024-05-01_123' → {"fecha": "2024-05-01", "id_transaccion": 123}; None
+    si no hay cursor. Si no tiene esa forma lanza CursorInvalido (400).
+    """
+    if not texto:
+        return None
+    fecha, _, id_texto = texto.rpartition("_")
+    try:
+        date.fromisoformat(fecha)
+        id_t = int(id_texto)
+    except ValueError:
+        raise CursorInvalido(texto) from None
+    return {"fecha": fecha, "id_transaccion": id_t}
+
+
+def pagina_transacciones(tipo, tamano, despues=None, antes=None):
+    """
+    Una página de transacciones de un tipo, en orden (fecha, id_transaccion),
+    con start_after sobre el cursor (paginación por llave, sin offset):
+    - despues: la página que sigue al cursor
+    - antes: la página que va antes del cursor
+    - sin cursor: la última página (lo más reciente)
+    Se pide una fila de más para saber si hay otra página en esa dirección.
+
+    Devuelve (filas, cursor_anterior, cursor_siguiente); None si no hay página.
+    """
+    base = db.collection("transacciones").where("tipo", "==", tipo)
+    if despues:
+        consulta = base.order_by("fecha").order_by("id_transaccion").start_after(despues)
+    else:
+        consulta = (
+            base.order_by("fecha", direction=firestore.Query.DESCENDING)
+            .order_by("id_transaccion", direction=firestore.Query.DESCENDING)
+        )
+        if antes:
+            consulta = consulta.start_after(antes)
+
+    filas = [d.to_dict() for d in lector().recorrer(consulta.limit(tamano + 1))]
+    hay_mas = len(filas) > tamano
+    filas = filas[:tamano]
+    if not filas:
+        return [], None, None
+
+    if despues:
+        return filas, _cursor(filas[0]), _cursor(filas[-1]) if hay_mas else None
+
+    filas.reverse()
+    return filas, _cursor(filas[0]) if hay_mas else None, _cursor(filas[-1]) if antes else None
+
+
+def _pagina_historica(tipo, tamano, despues, antes):
+    """Filas de la página ya renderizadas y sus cursores: (html, (anterior, siguiente))."""
+    filas, anterior, siguiente = pagina_transacciones(tipo, tamano, despues=despues, antes=antes)
+
+    for data in filas:
+        # Siempre valor positivo para mostrar
+        data["valor_mostrado"] = abs(float(data.get("valor", 0)))
+
+    return renderizar_fragmento("_filas_historicas.html", transacciones=filas), (anterior, siguiente)
+
+
+def _vista_historica(tipo):
+    """
+    Página de /ingresos o /gastos y el total histórico (de los resúmenes).
+    Las filas salen de la caché de fragmentos mientras no cambie el libro.
+    """
+    tamano = request.args.get("por_pagina", type=int)
+    if tamano not in TAMANOS_PAGINA:
+        tamano = TAMANO_PAGINA_DEFECTO
+
+    despues = _leer_cursor(request.args.get("despues"))
+    antes = _leer_cursor(request.args.get("antes"))
+
+    clave = (
+        "historica", leer_version_libro(), tipo, tamano,
+        request.args.get("despues"), request.args.get("antes"),
+    )
+    guardado = fragmentos_html.obtener(clave)
+    if guardado is not None:
+        filas, (anterior, siguiente) = guardado
+        _, totales = calcular_resumen_mensual()
+    else:
+        (filas, (anterior, siguiente)), (_, totales) = en_paralelo(
+            lambda: _pagina_historica(tipo, tamano, despues, antes),
+            calcular_resumen_mensual,
+        )
+        fragmentos_html.poner(clave, (filas, (anterior, siguiente)))
+
+    return {
+        "filas": filas,
+        "total": totales["ingresos" if tipo == "ingreso" else "gastos"],
+        "cursor_anterior": anterior,
+        "cursor_siguiente": siguiente,
+        "por_pagina": tamano,
+        "tamanos_pagina": TAMANOS_PAGINA,
+        "formatear_cop": formatear_cop,
+    }
+
+
+@app.route("/ingresos")
+@login_requerido
+def ingresos_historicos():
+    contexto = _vista_historica("ingreso")
+    return render_template("ingresos.html", ingresos=contexto.pop("filas"), **contexto)
+
+
+@app.route("/gastos")
+@login_requerido
+def gastos_historicos():
+    contexto = _vista_historica("gasto")
+    return render_template("gastos.html", gastos=contexto.pop("filas"), **contexto)
+
+
+# ----------- CACHÉ HTTP (ETag / Last-Modified por versión del libro) -----------
+#
+# Los reportes no cambian hasta la próxima escritura (o el cambio de día).
+# config/version_libro sube con cada escritura de transacciones o cuentas;
+# se lee por la caché de lecturas, así un GET condicional que sigue vigente
+# se contesta 304 sin leer Firestore ni renderizar. Las escrituras de otros
+# workers se ven cuando vence el TTL de la caché.
+
+version_libro_ref = db.collection("config").document("version_libro")
+
+
+def operacion_version():
+    """Operación de escribir_en_lotes() que sube la versión del libro."""
+    return ("merge", version_libro_ref, {
+        "version": firestore.Increment(1),
+        "modificado_en": marca_actual(),
+    })
+
+
+def version_de(snapshot):
+    """La versión del libro en un snapshot de config/version_libro (0 si no existe)."""
+    return (snapshot.to_dict() or {}).get("version", 0) if snapshot.exists else 0
+
+
+# ----------- DESPUÉS DE CADA ESCRITURA -----------
+
+# Grupos de la caché de lecturas que cambian al escribir en cada colección
+# ("resumenes": resumen_dias y resumen_meses)
+CACHE_POR_COLECCION = {
+    "transacciones": ("transacciones", "saldos_diarios", "resumen_meses"),
+    "cuentas": ("cuentas",),
+    "resumenes": ("resumen_meses",),
+}
+
+
+def libro_modificado(*colecciones, version_subida=False, tablero_al_dia=False):
+    """
+    Lo que va después de toda escritura en `colecciones`, para que ninguna
+    se olvide de una parte:
+      - sube config/version_libro (ETag, fragmentos), salvo que la escritura
+        ya lo hiciera en su lote o transacción (`version_subida`);
+      - invalida la caché de lecturas del proceso;
+      - avisa a la escucha en vivo que este proceso escribió;
+      - rehace el tablero guardado, salvo que la escritura ya le haya sumado
+        su delta (`tablero_al_dia`).
+    """
+    if not version_subida:
+        escribir_en_lotes([operacion_version()])
+    grupos = sorted({g for c in colecciones for g in CACHE_POR_COLECCION[c]})
+    cache_lecturas.invalidar("version_libro", *grupos)
+    anotar_escritura(*(c for c in colecciones if c in EscuchaLibro.COLECCIONES))
+    if not tablero_al_dia:
+        rehacer_tablero()
+
+
+@transaccional
+def sembrar_version_libro(transaction):
+    """
+    Crea config/version_libro si no existe, con la hora en ms como versión:
+    si la base se vacía y se vuelve a cargar (o se escribe por fuera de la
+    app), la versión nueva no repite una vieja y las cachés por versión
+    (ETag, fragmentos) no sirven datos de antes. Devuelve (version, modificado_en).
+    """
+    snapshot = lector().en_transaccion(transaction, version_libro_ref)
+    if snapshot.exists:
+        datos = snapshot.to_dict()
+        return datos.get("version", 0), datos.get("modificado_en", 0)
+    marca = marca_actual()
+    transaction.set(version_libro_ref, {"version": marca, "modificado_en": marca})
+    return marca, marca
+
+
+def leer_version_libro():
+    """(version, modificado_en en ms) del libro; si no existe se crea."""
+    def cargar():
+        doc = version_libro_ref.get()
+        lector().contar(1)
+        if not doc.exists:
+            return sembrar_version_libro(db.transaction())
+        datos = doc.to_dict()
+        return datos.get("version", 0), datos.get("modificado_en", 0)
+
+    return tuple(leer_en_cache(("version_libro",), cargar))
+
+
+def con_etag(vista):
+    """
+    ETag (versión del libro + fecha de hoy + ruta y parámetros) y
+    Last-Modified para una vista de reporte. Si el cliente ya tiene esa
+    versión se contesta 304 antes de llamar a la vista.
+    """
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        version, modificado_en = leer_version_libro()
+        hoy = date.today()
+        clave = f"{version}|{hoy.isoformat()}|{request.full_path}"
+        etag = hashlib.sha1(clave.encode("utf-8")).hexdigest()[:20]
+        # A medianoche cambia "hoy" aunque nadie escriba
+        medianoche = datetime.combine(hoy, datetime.min.time()).astimezone(timezone.utc)
+        modificado = max(
+            datetime.fromtimestamp(modificado_en // 1000, timezone.utc), medianoche
+        )
+
+        if is_resource_modified(request.environ, etag=etag, last_modified=modificado):
+            respuesta = make_response(vista(*args, **kwargs))
+        else:
+            respuesta = Response(status=304)
+        respuesta.set_etag(etag)
+        respuesta.last_modified = modificado
+        respuesta.cache_control.private = True
+        respuesta.cache_control.no_cache = True
+        return respuesta
+    return envoltura
+
+
+# ----------- CACHÉ DE FRAGMENTOS HTML (cuerpos de tablas grandes) -----------
+#
+# Las filas de /analisis, /ingresos y /gastos ya renderizadas (con el
+# formato de moneda de cada celda) y los datos chicos que las acompañan,
+# en una CacheLectura con tope en bytes. Las claves llevan la versión del
+# libro: después de una escritura las entradas viejas ya no se piden y
+# salen por LRU, así que no necesita TTL ni invalidación. Lo guardado no se
+# modifica (Markup y resúmenes que solo se leen), así que tampoco copias.
+
+fragmentos_html = CacheLectura(
+    max_entradas=4096,
+    ttl=None,
+    max_bytes=int(float(os.getenv("FINANZAS_FRAGMENTOS_MB", "32")) * 1024 * 1024),
+    copiar=False,
+)
+
+
+def renderizar_fragmento(plantilla, **contexto):
+    """Renderiza un fragmento para incrustarlo tal cual en otra plantilla."""
+    return Markup(render_template(plantilla, **contexto).strip())
+
+
+# ----------- RESUMEN DIARIO Y MENSUAL -----------
+
+
+def _resumen_diario_desde_transacciones():
+    """
+    Reconstruye el resumen diario recorriendo TODAS las transacciones.
+    Devuelve una lista de días con:
+      fecha, ingresos, gastos, diferencia, saldo_inicial, saldo_final,
+      cantidad, ingresos_por_categoria, gastos_por_categoria
+
+    Se basa en los campos saldo_inicial y saldo_final guardados en cada
+    transacción, para que no dependa del valor actual de las cuentas.
+    """
+    resumen = []
+    fecha_actual = None
+    saldo_corriente = None
+
+    for data in transacciones_en_orden():
+        fecha = data.get("fecha")
+        if not fecha:
+            continue
+
+        valor = float(data.get("valor", 0))
+        tipo_t = (data.get("tipo", "") or "").lower()
+        categoria = data.get("categoria") or "Sin categoría"
+
+        # Para la primera transacción usamos su saldo_inicial almacenado
+        if saldo_corriente is None:
+            saldo_corriente = float(data.get("saldo_inicial", 0))
+
+        if fecha != fecha_actual:
+            # cerramos día anterior
+            if fecha_actual is not None:
+                resumen[-1]["saldo_final"] = saldo_corriente
+
+            fecha_actual = fecha
+            resumen.append(
+                {
+                    "fecha": fecha,
+                    "ingresos": 0.0,
+                    "gastos": 0.0,
+                    "diferencia": 0.0,
+                    "saldo_inicial": saldo_corriente,
+                    "saldo_final": None,
+                    "cantidad": 0,
+                    "ingresos_por_categoria": {},
+                    "gastos_por_categoria": {},
+                }
+            )
+
+        dia = resumen[-1]
+        dia["cantidad"] += 1
+        if tipo_t == "gasto":
+            dia["gastos"] += abs(valor)
+            por_cat = dia["gastos_por_categoria"]
+            saldo_corriente += -abs(valor)
+        else:
+            dia["ingresos"] += abs(valor)
+            por_cat = dia["ingresos_por_categoria"]
+            saldo_corriente += abs(valor)
+        por_cat[categoria] = por_cat.get(categoria, 0.0) + abs(valor)
+
+    # Cerrar último día
+    if resumen:
+        resumen[-1]["saldo_final"] = saldo_corriente
+        for r in resumen:
+            r["diferencia"] = r["ingresos"] - r["gastos"]
+
+    return resumen
+
+
+def _resumen_diario_agrupado():
+    """
+    Con la base SQLite: lo mismo que _resumen_diario_desde_transacciones()
+    con un GROUP BY fecha, tipo, categoría y la primera transacción (por su
+    saldo_inicial), en vez de traer todas las filas a Python.
+    """
+    filas = db.agrupar(
+        "transacciones", ("fecha", "tipo", "categoria"), "valor",
+        [("fecha", ">", "")], absoluto=True,
+    )
+    lector().contar(1)
+    primera = list(lector().recorrer(
+        db.collection("transacciones").order_by("fecha").order_by("id_transaccion").limit(1)
+    ))
+    if not filas or not primera:
+        return []
+
+    dias = {}
+    for fecha, tipo, categoria, suma, cantidad in filas:
+        dia = dias.setdefault(fecha, {
+            "fecha": fecha,
+            "ingresos": 0.0,
+            "gastos": 0.0,
+            "diferencia": 0.0,
+            "saldo_inicial": None,
+            "saldo_final": None,
+            "cantidad": 0,
+            "ingresos_por_categoria": {},
+            "gastos_por_categoria": {},
+        })
+        campo = "gastos" if (tipo or "").lower() == "gasto" else "ingresos"
+        categoria = categoria or "Sin categoría"
+        dia[campo] += suma
+        dia["cantidad"] += cantidad
+        por_cat = dia[f"{campo}_por_categoria"]
+        por_cat[categoria] = por_cat.get(categoria, 0.0) + suma
+
+    resumen = [dias[f] for f in sorted(dias)]
+    saldo = float(primera[0].to_dict().get("saldo_inicial", 0))
+    for dia in resumen:
+        dia["diferencia"] = dia["ingresos"] - dia["gastos"]
+        dia["saldo_inicial"] = saldo
+        saldo += dia["diferencia"]
+        dia["saldo_final"] = saldo
+    return resumen
+
+
+def _fila_resumen(data):
+    """Normaliza un documento de resumen_dias / resumen_meses."""
+    fila = dict(data)
+    fila["ingresos"] = float(data.get("ingresos", 0))
+    fila["gastos"] = float(data.get("gastos", 0))
+    fila["diferencia"] = fila["ingresos"] - fila["gastos"]
+    fila.setdefault("ingresos_por_categoria", {})
+    fila.setdefault("gastos_por_categoria", {})
+    return fila
+
+
+def _agrupar_por_mes(resumen_diario):
+    """Agrupa las filas del resumen diario por mes YYYY-MM."""
+    resumen_mes = {}
+    for r in resumen_diario:
+        clave_mes = r["fecha"][:7]  # 'YYYY-MM'
+        if clave_mes not in resumen_mes:
+            resumen_mes[clave_mes] = {
+                "mes": clave_mes,
+                "ingresos": 0.0,
+                "gastos": 0.0,
+                "diferencia": 0.0,
+                "saldo_inicial": r["saldo_inicial"],
+                "saldo_final": r["saldo_final"],
+                "cantidad": 0,
+                "ingresos_por_categoria": {},
+                "gastos_por_categoria": {},
+            }
+        datos = resumen_mes[clave_mes]
+        datos["ingresos"] += r["ingresos"]
+        datos["gastos"] += r["gastos"]
+        datos["saldo_final"] = r["saldo_final"]
+        datos["cantidad"] += r.get("cantidad", 0)
+        for campo in ("ingresos_por_categoria", "gastos_por_categoria"):
+            for cat, v in r.get(campo, {}).items():
+                datos[campo][cat] = datos[campo].get(cat, 0.0) + v
+
+    filas = []
+    for mes, datos in sorted(resumen_mes.items()):
+        datos["diferencia"] = datos["ingresos"] - datos["gastos"]
+        filas.append(datos)
+    return filas
+
+
+def calcular_resumen_diario():
+    """
+    Devuelve una lista de días con:
+      fecha, ingresos, gastos, diferencia, saldo_inicial, saldo_final
+    más los totales.
+
+    Con el libro local activo sale de su índice por día; con la base SQLite,
+    de un GROUP BY; si no, de los resúmenes materializados (resumen_dias) y,
+    si todavía no se han construido, recorriendo las transacciones.
+    """
+    libro = libro_al_dia()
+    if libro is not None:
+        resumen = libro.resumen_diario()
+    elif hasattr(db, "agrupar"):
+        resumen = _resumen_diario_agrupado()
+    else:
+        docs = lector().recorrer(db.collection("resumen_dias").order_by("fecha"))
+        resumen = [_fila_resumen(d.to_dict()) for d in docs]
+
+    if not resumen:
+        resumen = _resumen_diario_desde_transacciones()
+
+    totales = {
+        "ingresos": sum(r["ingresos"] for r in resumen),
+        "gastos": sum(r["gastos"] for r in resumen),
+        "diferencia": sum(r["diferencia"] for r in resumen),
+    }
+
+    return resumen, totales
+
+
+def calcular_resumen_mensual():
+    """
+    Igual que calcular_resumen_diario pero por mes: de la instantánea
+    columnar o del libro local si están activos, con la base SQLite de un
+    GROUP BY, si no de resumen_meses.
+    """
+    columnas = instantanea_al_dia()
+    libro = libro_al_dia() if columnas is None else None
+    if columnas is not None:
+        filas = columnas.resumen_mensual()
+    elif libro is not None:
+        filas = _agrupar_por_mes(libro.resumen_diario())
+    elif hasattr(db, "agrupar"):
+        filas = _agrupar_por_mes(_resumen_diario_agrupado())
+    else:
+        filas = [_fila_resumen(m) for m in leer_resumen_meses()]
+
+    if not filas:
+        filas = _agrupar_por_mes(_resumen_diario_desde_transacciones())
+
+    totales = {
+        "ingresos": sum(f["ingresos"] for f in filas),
+        "gastos": sum(f["gastos"] for f in filas),
+        "diferencia": sum(f["diferencia"] for f in filas),
+    }
+
+    return filas, totales
 
-@app.route("/gastos")
-@login_requerido
-def gastos_historicos():
-    docs = (
-        db.collection("transacciones")
-        .where("tipo", "==", "gasto")
-        .order_by("fecha")
-        .order_by("id_transaccion")
-        .stream()
-    )
 
-    gastos = []
-    for d in docs:
-        data = d.to_dict()
-        valor = abs(float(data.get("valor", 0)))
-        data["valor_mostrado"] = valor
-        gastos.append(data)
+# ----------- RESÚMENES MATERIALIZADOS (resumen_dias / resumen_meses) -----------
 
-    return render_template(
-        "gastos.html",
-        gastos=gastos,
-        formatear_cop=formatear_cop,
-    )
+# Firestore no deja más de 500 operaciones por lote
+LOTE_MAXIMO = 500
 
 
-# ----------- RESUMEN DIARIO Y MENSUAL -----------
+def escribir_operacion(escritor, metodo, ref, datos):
+    """Pone una operación de escribir_en_lotes() en un lote o una transacción."""
+    if metodo == "set":
+        escritor.set(ref, datos)
+    elif metodo == "merge":
+        escritor.set(ref, datos, merge=True)
+    elif metodo == "update":
+        escritor.update(ref, datos)
+    else:
+        escritor.delete(ref)
 
 
-def calcular_resumen_diario():
+def escribir_en_lotes(operaciones):
     """
-    Devuelve una lista de días con:
-      fecha, ingresos, gastos, diferencia, saldo_inicial, saldo_final
-    más los totales.
+    Aplica una secuencia de operaciones ("set" | "merge" | "update" | "delete",
+    ref, datos) en lotes de LOTE_MAXIMO. Devuelve cuántas operaciones se
+    escribieron.
+    """
+    lote = db.batch()
+    pendientes = 0
+    total = 0
 
-    Se basa en los campos saldo_inicial y saldo_final guardados en cada
-    transacción, para que no dependa del valor actual de las cuentas.
+    for metodo, ref, datos in operaciones:
+        escribir_operacion(lote, metodo, ref, datos)
+        pendientes += 1
+        total += 1
+
+        if pendientes == LOTE_MAXIMO:
+            lote.commit()
+            lote = db.batch()
+            pendientes = 0
+
+    if pendientes:
+        lote.commit()
+
+    return total
+
+
+def _lecturas_resumen(nombre, campo, desde):
     """
-    docs = (
-        db.collection("transacciones")
-        .order_by("fecha")
-        .order_by("id_transaccion")
-        .stream()
+    Lecturas que necesita _operaciones_resumen(), como funciones para poder
+    lanzarlas en paralelo: el último resumen antes de `desde` (su saldo_final
+    es el saldo de apertura) y todos los resúmenes desde `desde` en adelante.
+    """
+    coleccion = db.collection(nombre)
+    return (
+        lambda: [
+            d.to_dict()
+            for d in lector().recorrer(
+                coleccion.where(campo, "<", desde)
+                .order_by(campo, direction=firestore.Query.DESCENDING)
+                .limit(1)
+            )
+        ],
+        lambda: list(lector().recorrer(coleccion.where(campo, ">=", desde).order_by(campo))),
     )
 
-    resumen = []
-    fecha_actual = None
-    saldo_corriente = None
 
-    for d in docs:
-        data = d.to_dict()
-        fecha = data.get("fecha")
-        if not fecha:
-            continue
+def _delta_transaccion(tipo, categoria, valor):
+    """Lo que una transacción le suma a un resumen."""
+    monto = abs(valor)
+    categoria = categoria or "Sin categoría"
+    if tipo == "gasto":
+        return {"ingresos": 0.0, "gastos": monto, "cantidad": 1,
+                "ingresos_por_categoria": {}, "gastos_por_categoria": {categoria: monto}}
+    return {"ingresos": monto, "gastos": 0.0, "cantidad": 1,
+            "ingresos_por_categoria": {categoria: monto}, "gastos_por_categoria": {}}
 
-        valor = float(data.get("valor", 0))
-        tipo_t = (data.get("tipo", "") or "").lower()
 
-        # Para la primera transacción usamos su saldo_inicial almacenado
-        if saldo_corriente is None:
-            saldo_corriente = float(data.get("saldo_inicial", 0))
+def _sumar_delta(total, delta):
+    """Acumula un delta de resumen sobre otro (para cargas masivas)."""
+    for campo in ("ingresos", "gastos", "cantidad"):
+        total[campo] = total.get(campo, 0) + delta[campo]
+    for campo_cat in ("ingresos_por_categoria", "gastos_por_categoria"):
+        por_cat = total.setdefault(campo_cat, {})
+        for cat, v in delta[campo_cat].items():
+            por_cat[cat] = por_cat.get(cat, 0.0) + v
+    return total
 
-        if fecha != fecha_actual:
-            # cerramos día anterior
-            if fecha_actual is not None:
-                resumen[-1]["saldo_final"] = saldo_corriente
 
-            fecha_actual = fecha
-            resumen.append(
-                {
-                    "fecha": fecha,
-                    "ingresos": 0.0,
-                    "gastos": 0.0,
-                    "diferencia": 0.0,
-                    "saldo_inicial": saldo_corriente,
-                    "saldo_final": None,
-                }
-            )
+def _operaciones_resumen(nombre, campo, lectura, deltas, saldo_inicial_defecto):
+    """
+    Operaciones para sumar `deltas` ({clave: delta con ingresos, gastos,
+    cantidad y sumas por categoría}) a los resúmenes de `nombre`.
+    `lectura` es el resultado de _lecturas_resumen() desde la menor clave.
 
-        if tipo_t == "gasto":
-            resumen[-1]["gastos"] += abs(valor)
-            saldo_corriente += -abs(valor)
+    Los saldos se corren en orden: cada resumen existente arranca con lo que
+    sumaron los deltas anteriores, y uno nuevo arranca en el cierre del
+    anterior (o en la apertura del siguiente si va antes del primero).
+    """
+    anteriores, existentes = lectura
+    existentes = {d.id: d for d in existentes}
+    claves = sorted(set(deltas) | set(existentes))
+
+    operaciones = []
+    corrimiento = 0.0  # neto acumulado de los deltas ya recorridos
+    saldo_previo = anteriores[0].get("saldo_final") if anteriores else None
+
+    for clave in claves:
+        delta = deltas.get(clave)
+        neto = delta["ingresos"] - delta["gastos"] if delta else 0.0
+        doc = existentes.get(clave)
+
+        if doc is not None:
+            datos = doc.to_dict()
+            if corrimiento or neto:
+                cambios = {
+                    "saldo_inicial": firestore.Increment(corrimiento),
+                    "saldo_final": firestore.Increment(corrimiento + neto),
+                }
+            else:
+                cambios = {}
+            saldo_previo = datos.get("saldo_final", 0) + corrimiento + neto
         else:
-            resumen[-1]["ingresos"] += abs(valor)
-            saldo_corriente += abs(valor)
+            if saldo_previo is None:
+                siguiente = next(
+                    (existentes[c] for c in claves if c > clave and c in existentes), None
+                )
+                saldo_previo = (
+                    siguiente.to_dict().get("saldo_inicial", saldo_inicial_defecto)
+                    if siguiente is not None
+                    else saldo_inicial_defecto
+                )
+            cambios = {
+                campo: clave,
+                "saldo_inicial": saldo_previo,
+                "saldo_final": saldo_previo + neto,
+            }
+            saldo_previo += neto
+
+        if delta:
+            cambios[campo] = clave
+            cambios["cantidad"] = firestore.Increment(delta["cantidad"])
+            cambios["ingresos"] = firestore.Increment(delta["ingresos"])
+            cambios["gastos"] = firestore.Increment(delta["gastos"])
+            for campo_cat in ("ingresos_por_categoria", "gastos_por_categoria"):
+                if delta[campo_cat]:
+                    cambios[campo_cat] = {
+                        cat: firestore.Increment(v) for cat, v in delta[campo_cat].items()
+                    }
+
+        if cambios:
+            operaciones.append(("merge", db.collection(nombre).document(clave), cambios))
+        corrimiento += neto
+
+    return operaciones
+
+
+def reconstruir_resumenes():
+    """Borra y vuelve a generar resumen_dias y resumen_meses desde cero."""
+    dias = _resumen_diario_desde_transacciones()
+    meses = _agrupar_por_mes(dias)
+
+    def operaciones():
+        # Borrar los resúmenes que ya no tienen transacciones
+        vigentes = {
+            "resumen_dias": {r["fecha"] for r in dias},
+            "resumen_meses": {r["mes"] for r in meses},
+        }
+        for nombre, claves in vigentes.items():
+            for d in db.collection(nombre).stream():
+                if d.id not in claves:
+                    yield ("delete", d.reference, None)
+
+        campos = (
+            "ingresos", "gastos", "saldo_inicial", "saldo_final", "cantidad",
+            "ingresos_por_categoria", "gastos_por_categoria",
+        )
+        for r in dias:
+            datos = {c: r[c] for c in campos}
+            datos["fecha"] = r["fecha"]
+            yield ("set", db.collection("resumen_dias").document(r["fecha"]), datos)
+        for r in meses:
+            datos = {c: r[c] for c in campos}
+            datos["mes"] = r["mes"]
+            yield ("set", db.collection("resumen_meses").document(r["mes"]), datos)
 
-    # Cerrar último día
-    if resumen:
-        resumen[-1]["saldo_final"] = saldo_corriente
-        for r in resumen:
-            r["diferencia"] = r["ingresos"] - r["gastos"]
+    escribir_en_lotes(operaciones())
+    libro_modificado("resumenes")
+    return len(dias), len(meses)
 
-    totales = {
-        "ingresos": sum(r["ingresos"] for r in resumen),
-        "gastos": sum(r["gastos"] for r in resumen),
-        "diferencia": sum(r["diferencia"] for r in resumen),
-    }
 
-    return resumen, totales
+@app.cli.command("reconstruir-resumenes")
+def reconstruir_resumenes_cmd():
+    """Regenera resumen_dias y resumen_meses desde las transacciones."""
+    dias, meses = reconstruir_resumenes()
+    print(f"Resúmenes reconstruidos: {dias} días, {meses} meses.")
+
 
 def calcular_rango_fechas(periodo, fecha_desde_str=None, fecha_hasta_str=None):
     """
@@ -836,24 +4178,17 @@ def calcular_rango_fechas(periodo, fecha_desde_str=None, fecha_hasta_str=None):
     return desde.isoformat(), hoy.isoformat()
 
 
-def filtrar_y_resumir(transacciones, tipo, desde_iso, hasta_iso, categorias_sel):
+def filtrar_transacciones(transacciones, tipo, desde_iso, hasta_iso, categorias_sel):
     """
-    Filtra la lista de transacciones (lista de dicts) por:
-    - tipo: 'ingreso', 'gasto' o 'todos'
-    - rango de fechas [desde_iso, hasta_iso]
-    - categorías seleccionadas (lista)
-
-    Devuelve (lista_filtrada, resumen_dict)
+    Generador con el filtro de filtrar_y_resumir(): deja pasar las
+    transacciones (dicts) que cumplen tipo / rango de fechas / categorías y
+    les agrega valor_mostrado. No acumula nada, sirve para exportar.
     """
     desde_iso = desde_iso or "0000-01-01"
     hasta_iso = hasta_iso or "9999-12-31"
 
     categorias_sel = categorias_sel or []
 
-    filtradas = []
-    total_ingresos = 0.0
-    total_gastos = 0.0
-
     for data in transacciones:
         fecha = data.get("fecha")
         if not fecha:
@@ -875,14 +4210,36 @@ def filtrar_y_resumir(transacciones, tipo, desde_iso, hasta_iso, categorias_sel)
         valor = float(data.get("valor", 0))
         if tipo_t == "gasto":
             data["valor_mostrado"] = -abs(valor)
-            total_gastos += abs(valor)
         else:
             data["valor_mostrado"] = abs(valor)
-            if valor > 0:
-                total_ingresos += valor
+
+        yield data
+
+
+def filtrar_y_resumir(transacciones, tipo, desde_iso, hasta_iso, categorias_sel):
+    """
+    Filtra la lista de transacciones (lista de dicts) por:
+    - tipo: 'ingreso', 'gasto' o 'todos'
+    - rango de fechas [desde_iso, hasta_iso]
+    - categorías seleccionadas (lista)
+
+    Devuelve (lista_filtrada, resumen_dict)
+    """
+    filtradas = []
+    total_ingresos = 0.0
+    total_gastos = 0.0
+
+    for data in filtrar_transacciones(transacciones, tipo, desde_iso, hasta_iso, categorias_sel):
+        valor = float(data.get("valor", 0))
+        if (data.get("tipo", "") or "").lower() == "gasto":
+            total_gastos += abs(valor)
+        elif valor > 0:
+            total_ingresos += valor
 
         filtradas.append(data)
 
+    desde_iso = desde_iso or "0000-01-01"
+    hasta_iso = hasta_iso or "9999-12-31"
     diferencia = total_ingresos - total_gastos
 
     resumen = {
@@ -896,8 +4253,111 @@ def filtrar_y_resumir(transacciones, tipo, desde_iso, hasta_iso, categorias_sel)
 
     return filtradas, resumen
 
+# ----------- CONSULTAS POR FILTRO (análisis / exportación) -----------
+
+# Firestore acepta como máximo 30 valores en un filtro "in"
+MAX_VALORES_IN = 30
+
+
+def planear_consultas(tipo, desde_iso, hasta_iso, categorias_sel):
+    """
+    Traduce el filtro de filtrar_y_resumir() a consultas de Firestore que
+    solo leen la ventana pedida: tipo con ==, fechas como rango y categorías
+    con "in" (partidas en grupos de MAX_VALORES_IN). Las consultas no se
+    traslapan, así que juntas devuelven cada transacción una sola vez.
+    Los índices que necesitan están en firestore.indexes.json.
+    """
+    base = db.collection("transacciones")
+    if tipo in ("ingreso", "gasto"):
+        base = base.where("tipo", "==", tipo)
+    if desde_iso:
+        base = base.where("fecha", ">=", desde_iso)
+    if hasta_iso:
+        base = base.where("fecha", "<=", hasta_iso)
+
+    if not categorias_sel:
+        return [base]
+    categorias = list(dict.fromkeys(categorias_sel))
+    return [
+        base.where("categoria", "in", categorias[i:i + MAX_VALORES_IN])
+        for i in range(0, len(categorias), MAX_VALORES_IN)
+    ]
+
+
+def _clave_orden(data):
+    return (data.get("fecha"), data.get("id_transaccion"))
+
+
+def recorrer_paginas(consulta, tamano_pagina):
+    """
+    Recorre una consulta en orden (fecha, id_transaccion) por páginas,
+    continuando cada una con start_after desde la última fila.
+    """
+    consulta = consulta.order_by("fecha").order_by("id_transaccion").limit(tamano_pagina)
+    ultima = None
+    while True:
+        pagina = consulta if ultima is None else consulta.start_after(ultima)
+        filas = 0
+        for d in lector().recorrer(pagina):
+            data = d.to_dict()
+            filas += 1
+            ultima = {"fecha": data.get("fecha"), "id_transaccion": data.get("id_transaccion")}
+            yield data
+        if filas < tamano_pagina:
+            return
+
+
+def consultar_transacciones(tipo, desde_iso, hasta_iso, categorias_sel, tamano_pagina=None):
+    """
+    Transacciones del filtro en orden (fecha, id_transaccion), mezclando las
+    consultas de planear_consultas(). Con tamano_pagina cada consulta se lee
+    por páginas (para exportar); si no, de una vez. Con el libro local
+    activo se filtra en memoria.
+    """
+    libro = libro_al_dia()
+    if libro is not None:
+        categorias = set(categorias_sel or [])
+        return (
+            dict(d)
+            for d in libro.en_orden(desde_iso, hasta_iso)
+            if (tipo not in ("ingreso", "gasto") or d.get("tipo") == tipo)
+            and (not categorias or d.get("categoria") in categorias)
+        )
+
+    flujos = []
+    for consulta in planear_consultas(tipo, desde_iso, hasta_iso, categorias_sel):
+        if tamano_pagina:
+            flujos.append(recorrer_paginas(consulta, tamano_pagina))
+        else:
+            docs = lector().recorrer(consulta.order_by("fecha").order_by("id_transaccion"))
+            flujos.append(d.to_dict() for d in docs)
+
+    if len(flujos) == 1:
+        return flujos[0]
+    return heapq.merge(*flujos, key=_clave_orden)
+
+
+def analizar_periodo(tipo, desde_iso, hasta_iso, categorias_sel):
+    """
+    filtrar_y_resumir() del periodo: vectorizado sobre la instantánea
+    columnar si está activa, si no leyendo solo las transacciones del periodo.
+    """
+    columnas = instantanea_al_dia()
+    if columnas is not None:
+        try:
+            return columnas.filtrar_y_resumir(tipo, desde_iso, hasta_iso, categorias_sel)
+        except ValueError:
+            pass  # fechas que no son YYYY-MM-DD: se filtra como texto abajo
+
+    return filtrar_y_resumir(
+        consultar_transacciones(tipo, desde_iso, hasta_iso, categorias_sel),
+        tipo, desde_iso, hasta_iso, categorias_sel,
+    )
+
+
 @app.route("/resumen-diario")
 @login_requerido
+@con_etag
 def resumen_diario():
     resumen, totales = calcular_resumen_diario()
     return render_template(
@@ -910,36 +4370,9 @@ def resumen_diario():
 
 @app.route("/resumen-mensual")
 @login_requerido
+@con_etag
 def resumen_mensual():
-    resumen_diario, _ = calcular_resumen_diario()
-
-    # Agrupar por mes YYYY-MM
-    resumen_mes = {}
-    for r in resumen_diario:
-        clave_mes = r["fecha"][:7]  # 'YYYY-MM'
-        if clave_mes not in resumen_mes:
-            resumen_mes[clave_mes] = {
-                "mes": clave_mes,
-                "ingresos": 0.0,
-                "gastos": 0.0,
-                "diferencia": 0.0,
-                "saldo_inicial": r["saldo_inicial"],
-                "saldo_final": r["saldo_final"],
-            }
-        resumen_mes[clave_mes]["ingresos"] += r["ingresos"]
-        resumen_mes[clave_mes]["gastos"] += r["gastos"]
-        resumen_mes[clave_mes]["saldo_final"] = r["saldo_final"]
-
-    filas = []
-    for mes, datos in sorted(resumen_mes.items()):
-        datos["diferencia"] = datos["ingresos"] - datos["gastos"]
-        filas.append(datos)
-
-    totales = {
-        "ingresos": sum(f["ingresos"] for f in filas),
-        "gastos": sum(f["gastos"] for f in filas),
-        "diferencia": sum(f["diferencia"] for f in filas),
-    }
+    filas, totales = calcular_resumen_mensual()
 
     return render_template(
         "resumen_mensual.html",
@@ -950,6 +4383,7 @@ def resumen_mensual():
 
 @app.route("/analisis", methods=["GET"])
 @login_requerido
+@con_etag
 def analisis():
     # -------- Parámetros del formulario (GET) --------
     tipo = request.args.get("tipo", "todos")  # 'ingreso', 'gasto', 'todos'
@@ -964,34 +4398,49 @@ def analisis():
 
     categorias_sel = request.args.getlist("categorias")
 
-    # -------- Cargar TODAS las transacciones una sola vez --------
-    docs = (
-        db.collection("transacciones")
-        .order_by("fecha")
-        .order_by("id_transaccion")
-        .stream()
-    )
-    todas = [d.to_dict() for d in docs]
-
     # -------- Periodo principal --------
     desde_iso, hasta_iso = calcular_rango_fechas(periodo, fecha_desde, fecha_hasta)
-    trans_principal, resumen_principal = filtrar_y_resumir(
-        todas, tipo, desde_iso, hasta_iso, categorias_sel
-    )
+    periodos = [(desde_iso, hasta_iso)]
 
     # -------- Periodo de comparación (opcional) --------
-    trans_comp = []
     resumen_comp = None
 
     if periodo_comp or (fecha_desde_comp and fecha_hasta_comp):
-        desde_comp_iso, hasta_comp_iso = calcular_rango_fechas(
+        periodos.append(calcular_rango_fechas(
             periodo_comp or "personalizado",
             fecha_desde_comp,
             fecha_hasta_comp,
+        ))
+
+    # -------- Filas ya renderizadas de la caché de fragmentos --------
+    version = leer_version_libro()
+    claves = [
+        ("analisis", version, tipo, desde, hasta, tuple(categorias_sel))
+        for desde, hasta in periodos
+    ]
+    resultados = [fragmentos_html.obtener(clave) for clave in claves]
+
+    # -------- Los que faltan consultan solo su ventana, en paralelo --------
+    faltan = [i for i, guardado in enumerate(resultados) if guardado is None]
+    calculados = en_paralelo(*[
+        lambda desde=periodos[i][0], hasta=periodos[i][1]: analizar_periodo(
+            tipo, desde, hasta, categorias_sel
         )
-        trans_comp, resumen_comp = filtrar_y_resumir(
-            todas, tipo, desde_comp_iso, hasta_comp_iso, categorias_sel
-        )
+        for i in faltan
+    ])
+    vacios = [
+        "No hay movimientos en este período con esos filtros.",
+        "No hay movimientos en el período de comparación.",
+    ]
+    for i, (trans, resumen) in zip(faltan, calculados):
+        html = renderizar_fragmento("_filas_analisis.html", transacciones=trans, vacio=vacios[i])
+        fragmentos_html.poner(claves[i], (html, resumen))
+        resultados[i] = (html, resumen)
+
+    filas_principal, resumen_principal = resultados[0]
+    filas_comp = ""
+    if len(resultados) > 1:
+        filas_comp, resumen_comp = resultados[1]
 
     # Lista de categorías para el multiselect
     categorias_todas = CATEGORIAS_INGRESO + CATEGORIAS_GASTO
@@ -1007,59 +4456,200 @@ def analisis():
         fecha_hasta_comp=fecha_hasta_comp or "",
         categorias_todas=categorias_todas,
         categorias_seleccionadas=categorias_sel,
-        trans_principal=trans_principal,
+        filas_principal=filas_principal,
         resumen_principal=resumen_principal,
-        trans_comp=trans_comp,
+        filas_comp=filas_comp,
         resumen_comp=resumen_comp,
         formatear_cop=formatear_cop,
     )
 
-@app.route("/reporte-general", methods=["GET"])
-@login_requerido
-def reporte_general():
-    # 1) Parámetros del filtro
-    periodo = request.args.get("periodo", "este_mes")
-    fecha_desde = request.args.get("fecha_desde")
-    fecha_hasta = request.args.get("fecha_hasta")
+# ----------- AGREGACIONES POR PERIODO (sum / count en Firestore) -----------
 
-    # Usamos el helper que ya tenemos
-    desde_iso, hasta_iso = calcular_rango_fechas(periodo, fecha_desde, fecha_hasta)
 
-    # 2) Cargar todas las transacciones y filtrar por rango
-    docs = (
+def _totales_vacios():
+    return {"ingresos": 0.0, "gastos": 0.0, "cantidad": 0,
+            "ingresos_por_categoria": {}, "gastos_por_categoria": {}}
+
+
+def _agregar(consulta):
+    """(suma de valor, cantidad) de una consulta, calculadas en Firestore."""
+    resultado = consulta.sum("valor", alias="suma").count(alias="cantidad").get()
+    lector().contar(1)
+    valores = {r.alias: r.value for r in resultado[0]}
+    return float(valores.get("suma") or 0), int(valores.get("cantidad") or 0)
+
+
+def _totales_con_agregaciones(desde_iso, hasta_iso):
+    """
+    Totales del rango con agregaciones de Firestore, en dos rondas paralelas:
+
+    1. Cinco agregaciones para los totales y para saber si se puede confiar
+       en ellas: cuántas filas hay en el rango, la suma y cantidad de tipo
+       "ingreso" y de tipo "gasto", y cuántas tienen el signo al revés
+       (ingresos negativos o gastos positivos). Lo que guardan el
+       formulario y la importación siempre pasa. Si alguna fila del rango
+       no (tipos de antes, mayúsculas, signos cambiados), se recorren las
+       transacciones del rango con _totales_desde_transacciones(), que las
+       cuenta como siempre: lo que no es gasto es ingreso, y con abs(valor).
+       También se recorren si son menos filas que agregaciones de detalle.
+    2. Una suma por cada categoría conocida de cada tipo con movimientos
+       (hasta 19), para el detalle. Las categorías que no están en las
+       listas entran en los totales pero no en el detalle.
+
+    Cada agregación cobra una lectura por cada 1000 filas.
+    """
+    base = (
         db.collection("transacciones")
-        .order_by("fecha")
-        .order_by("id_transaccion")
-        .stream()
+        .where("fecha", ">=", desde_iso)
+        .where("fecha", "<=", hasta_iso)
     )
+    ingresos_q = base.where("tipo", "==", "ingreso")
+    gastos_q = base.where("tipo", "==", "gasto")
+    primera = en_paralelo(*[lambda c=c: _agregar(c) for c in (
+        base,
+        ingresos_q,
+        gastos_q,
+        ingresos_q.where("valor", "<", 0),
+        gastos_q.where("valor", ">", 0),
+    )])
+    (_, cantidad), (ingresos, n_ingresos), (gastos, n_gastos) = primera[:3]
+    volteados = primera[3][1] + primera[4][1]
+
+    detalle = []
+    if n_ingresos:
+        detalle += [("ingresos", ingresos_q, c) for c in CATEGORIAS_INGRESO]
+    if n_gastos:
+        detalle += [("gastos", gastos_q, c) for c in CATEGORIAS_GASTO]
+    normalizadas = n_ingresos + n_gastos == cantidad and not volteados
+    if not normalizadas or cantidad <= len(detalle):
+        return _totales_desde_transacciones(desde_iso, hasta_iso)
+
+    resultados = en_paralelo(*[
+        lambda q=q, c=c: _agregar(q.where("categoria", "==", c)) for _, q, c in detalle
+    ])
+
+    totales = _totales_vacios()
+    totales["ingresos"] = ingresos
+    totales["gastos"] = abs(gastos)
+    totales["cantidad"] = cantidad
+    for (campo, _, categoria), (suma, n) in zip(detalle, resultados):
+        if n:
+            totales[f"{campo}_por_categoria"][categoria] = abs(suma)
+    return totales
+
+
+def _totales_agrupados(desde_iso, hasta_iso):
+    """
+    Con la base SQLite: un solo GROUP BY tipo, categoría del rango en vez de
+    una agregación por categoría. Suma abs(valor) y cuenta como ingreso todo
+    lo que no es gasto, como _totales_desde_transacciones(), así que no
+    necesita que las filas estén normalizadas.
+    """
+    filas = db.agrupar(
+        "transacciones", ("tipo", "categoria"), "valor",
+        [("fecha", ">=", desde_iso), ("fecha", "<=", hasta_iso)], absoluto=True,
+    )
+    lector().contar(1)
 
-    ingresos_por_cat = {}
-    gastos_por_cat = {}
-    total_ingresos = 0.0
-    total_gastos = 0.0
-
+    totales = _totales_vacios()
+    for tipo, categoria, suma, cantidad in filas:
+        if (tipo or "").lower() == "gasto":
+            campo, conocidas = "gastos", CATEGORIAS_GASTO
+        else:
+            campo, conocidas = "ingresos", CATEGORIAS_INGRESO
+        totales[campo] += suma
+        totales["cantidad"] += cantidad
+        if categoria in conocidas and cantidad:
+            por_cat = totales[f"{campo}_por_categoria"]
+            por_cat[categoria] = por_cat.get(categoria, 0.0) + suma
+    return totales
+
+
+def _totales_desde_resumenes(desde_iso, hasta_iso):
+    """Suma los resumen_dias del rango (una lectura por día con movimientos)."""
+    totales = _totales_vacios()
+    docs = lector().recorrer(
+        db.collection("resumen_dias")
+        .where("fecha", ">=", desde_iso)
+        .where("fecha", "<=", hasta_iso)
+    )
     for d in docs:
         data = d.to_dict()
-        fecha = data.get("fecha")
-        if not fecha:
-            continue
+        _sumar_delta(totales, {
+            "ingresos": float(data.get("ingresos", 0)),
+            "gastos": float(data.get("gastos", 0)),
+            "cantidad": int(data.get("cantidad", 0)),
+            "ingresos_por_categoria": data.get("ingresos_por_categoria") or {},
+            "gastos_por_categoria": data.get("gastos_por_categoria") or {},
+        })
+    return totales
 
-        if fecha < desde_iso or fecha > hasta_iso:
-            continue
 
+def _totales_desde_transacciones(desde_iso, hasta_iso):
+    """Último recurso: recorre las transacciones del rango."""
+    totales = _totales_vacios()
+    for data in consultar_transacciones("todos", desde_iso, hasta_iso, []):
         tipo_t = (data.get("tipo", "") or "").lower()
-        categoria = data.get("categoria", "Sin categoría")
         valor = float(data.get("valor", 0))
+        _sumar_delta(totales, _delta_transaccion(tipo_t, data.get("categoria"), valor))
+    return totales
 
-        if tipo_t == "gasto":
-            valor_abs = abs(valor)
-            gastos_por_cat[categoria] = gastos_por_cat.get(categoria, 0) + valor_abs
-            total_gastos += valor_abs
-        else:
-            # ingreso (valor guardado ya es positivo)
-            valor_abs = abs(valor)
-            ingresos_por_cat[categoria] = ingresos_por_cat.get(categoria, 0) + valor_abs
-            total_ingresos += valor_abs
+
+def totales_periodo(desde_iso, hasta_iso):
+    """
+    Totales de [desde_iso, hasta_iso] con la forma de los resúmenes:
+    ingresos, gastos, cantidad, ingresos_por_categoria y gastos_por_categoria.
+
+    Se calculan con agregaciones sum/count de Firestore, que cobran una
+    lectura por cada 1000 transacciones en vez de una por transacción. Si el
+    servidor no las soporta se usan los resumen_dias y, si aún no se han
+    construido, las transacciones del rango. Queda en caché hasta la
+    siguiente escritura. Con la instantánea columnar o el libro local
+    activos no se lee Firestore; con la base SQLite es un solo GROUP BY.
+    """
+    columnas = instantanea_al_dia()
+    if columnas is not None:
+        try:
+            return columnas.totales_periodo(desde_iso, hasta_iso)
+        except ValueError:
+            pass
+    libro = libro_al_dia()
+    if libro is not None:
+        return libro.totales(desde_iso, hasta_iso)
+
+    def cargar():
+        if hasattr(db, "agrupar"):
+            return _totales_agrupados(desde_iso, hasta_iso)
+        try:
+            return _totales_con_agregaciones(desde_iso, hasta_iso)
+        except Exception as e:
+            print("Agregaciones no disponibles, se usan los resúmenes:", e)
+
+        if leer_resumen_meses():
+            return _totales_desde_resumenes(desde_iso, hasta_iso)
+        return _totales_desde_transacciones(desde_iso, hasta_iso)
+
+    return cache_lecturas.obtener(("transacciones", "totales", desde_iso, hasta_iso), cargar)
+
+
+@app.route("/reporte-general", methods=["GET"])
+@login_requerido
+@con_etag
+def reporte_general():
+    # 1) Parámetros del filtro
+    periodo = request.args.get("periodo", "este_mes")
+    fecha_desde = request.args.get("fecha_desde")
+    fecha_hasta = request.args.get("fecha_hasta")
+
+    # Usamos el helper que ya tenemos
+    desde_iso, hasta_iso = calcular_rango_fechas(periodo, fecha_desde, fecha_hasta)
+
+    # 2) Totales del rango (agregaciones en Firestore o resúmenes)
+    totales = totales_periodo(desde_iso, hasta_iso)
+    ingresos_por_cat = totales["ingresos_por_categoria"]
+    gastos_por_cat = totales["gastos_por_categoria"]
+    total_ingresos = totales["ingresos"]
+    total_gastos = totales["gastos"]
 
     # 3) Agrupar ingresos como en tu Excel
     sueldo_deiner = ingresos_por_cat.get("Sueldo Deiner", 0)
@@ -1110,6 +4700,202 @@ def reporte_general():
         formatear_cop=formatear_cop,
     )
 
+# ----------- EXPORTACIÓN (CSV / XLSX) -----------
+
+# Documentos por consulta al exportar: cada consulta es corta y la memoria
+# no crece con el tamaño del historial.
+PAGINA_EXPORTACION = 1000
+
+COLUMNAS_EXPORTACION = [
+    "id_transaccion", "fecha", "descripcion", "valor", "tipo", "cuenta",
+    "categoria", "saldo_en_cuenta", "saldo_final",
+]
+
+
+def filtros_exportacion(args):
+    """
+    (tipo, desde_iso, hasta_iso, categorias) con los mismos parámetros que
+    /analisis. Sin periodo ni fechas se exporta todo el historial.
+    """
+    periodo = args.get("periodo")
+    if periodo:
+        desde_iso, hasta_iso = calcular_rango_fechas(
+            periodo, args.get("fecha_desde"), args.get("fecha_hasta")
+        )
+    else:
+        desde_iso, hasta_iso = args.get("fecha_desde") or None, args.get("fecha_hasta") or None
+    return args.get("tipo", "todos"), desde_iso, hasta_iso, args.getlist("categorias")
+
+
+def filas_exportacion(tipo, desde_iso, hasta_iso, categorias):
+    """Filas (listas) para exportar, con el valor firmado como en /analisis."""
+    transacciones = filtrar_transacciones(
+        consultar_transacciones(tipo, desde_iso, hasta_iso, categorias, PAGINA_EXPORTACION),
+        tipo, desde_iso, hasta_iso, categorias,
+    )
+    for t in transacciones:
+        yield [
+            t.get("id_transaccion"), t.get("fecha"), t.get("descripcion", ""),
+            t["valor_mostrado"], t.get("tipo", ""), t.get("cuenta", ""),
+            t.get("categoria", ""), t.get("saldo_en_cuenta"), t.get("saldo_final"),
+        ]
+
+
+class _Tubo:
+    """Archivo de solo escritura que guarda lo escrito hasta que se vacía."""
+
+    def __init__(self, vacio=b""):
+        self._vacio = vacio
+        self._partes = []
+
+    def write(self, datos):
+        self._partes.append(datos)
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = self._vacio.join(self._partes)
+        self._partes = []
+        return datos
+
+
+def generar_csv(filas, filas_por_envio=500):
+    """CSV en UTF-8 con BOM (Excel lo abre con tildes); se envía por tramos."""
+    tubo = _Tubo("")
+    escritor = csv.writer(tubo)
+    escritor.writerow(COLUMNAS_EXPORTACION)
+    yield ("\ufeff" + tubo.vaciar()).encode("utf-8")
+
+    for i, fila in enumerate(filas, start=1):
+        escritor.writerow(fila)
+        if i % filas_por_envio == 0:
+            yield tubo.vaciar().encode("utf-8")
+    yield tubo.vaciar().encode("utf-8")
+
+
+_XLSX_ESTATICOS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Transacciones" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+# Caracteres de control que no se permiten en XML
+_NO_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _celda_xlsx(valor):
+    if valor is None:
+        return "<c/>"
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return f"<c><v>{valor!r}</v></c>"
+    texto = _NO_XML.sub("", str(valor))
+    texto = texto.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def generar_xlsx(filas, filas_por_envio=500):
+    """
+    XLSX escrito a mano en streaming: el zip se arma sobre un _Tubo sin
+    seek (zipfile usa descriptores de datos) y la hoja lleva las celdas
+    como inlineStr, así no hace falta tabla de strings compartidos.
+    """
+    tubo = _Tubo()
+    with zipfile.ZipFile(tubo, "w", compression=zipfile.ZIP_DEFLATED) as archivo:
+        for nombre, contenido in _XLSX_ESTATICOS.items():
+            archivo.writestr(nombre, contenido)
+
+        with archivo.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as hoja:
+            hoja.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetData><row>' + "".join(_celda_xlsx(c) for c in COLUMNAS_EXPORTACION) + "</row>"
+            ).encode("utf-8"))
+            yield tubo.vaciar()
+
+            pendientes = []
+            for fila in filas:
+                pendientes.append("<row>" + "".join(_celda_xlsx(c) for c in fila) + "</row>")
+                if len(pendientes) == filas_por_envio:
+                    hoja.write("".join(pendientes).encode("utf-8"))
+                    pendientes = []
+                    yield tubo.vaciar()
+            hoja.write(("".join(pendientes) + "</sheetData></worksheet>").encode("utf-8"))
+    yield tubo.vaciar()
+
+
+FORMATOS_EXPORTACION = {
+    "csv": (generar_csv, "text/csv; charset=utf-8"),
+    "xlsx": (generar_xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+
+@app.route("/exportar.<formato>")
+@login_requerido
+def exportar(formato):
+    if formato not in FORMATOS_EXPORTACION:
+        return "Formato no soportado", 404
+
+    generar, mimetype = FORMATOS_EXPORTACION[formato]
+    tipo, desde_iso, hasta_iso, categorias = filtros_exportacion(request.args)
+    nombre = "transacciones"
+    if tipo in ("ingreso", "gasto"):
+        nombre = f"{tipo}s"
+    if desde_iso or hasta_iso:
+        nombre += f"_{desde_iso or 'inicio'}_{hasta_iso or 'hoy'}"
+
+    # Con el contexto de la request, así las lecturas del cuerpo se cuentan
+    # en ella (la medición se cierra cuando termina de enviarse)
+    g.cuerpo_pendiente = True
+    return Response(
+        stream_with_context(generar(filas_exportacion(tipo, desde_iso, hasta_iso, categorias))),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{formato}"'},
+    )
+
+
+@app.route("/estadisticas/cache")
+@login_requerido
+def estadisticas_cache():
+    """Aciertos / fallos de la caché de lecturas y la de fragmentos de ESTE worker."""
+    return dict(cache_lecturas.estadisticas(), fragmentos=fragmentos_html.estadisticas())
+
+
+@app.route("/estadisticas/libro")
+@login_requerido
+def estadisticas_libro():
+    """Estado de la escucha en vivo de ESTE worker: carga inicial y retraso de los avisos."""
+    if escucha_libro is None:
+        return {"activa": False}
+    return dict(escucha_libro.estadisticas(), activa=True)
+
+
 @app.context_processor
 def inject_helpers():
     return dict(formatear_cop=formatear_cop)
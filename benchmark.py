@@ -0,0 +1,107 @@
+"""
+Benchmarks de la app usando la base de datos en memoria (firestore_memoria),
+o la base SQLite (firestore_sqlite) con FINANZAS_DB=sqlite.
+
+Uso:
+    python benchmark.py dashboard --transacciones 20000
+    python benchmark.py resumenes --transacciones 20000
+    python benchmark.py cache --transacciones 20000
+    python benchmark.py ids --transacciones 20000
+    python benchmark.py insertar --transacciones 20000
+    python benchmark.py latencia-post --latencia 20 --repeticiones 50
+    python benchmark.py latencia-tablero --latencia 20 --repeticiones 50
+    python benchmark.py importar --transacciones 50000
+    python benchmark.py exportar --transacciones 100000
+    python benchmark.py historicos --transacciones 100000
+    python benchmark.py analisis --transacciones 100000
+    python benchmark.py reportes --transacciones 100000
+    python benchmark.py condicional --transacciones 100000
+    python benchmark.py fragmentos --transacciones 100000
+    python benchmark.py moneda --transacciones 100000 --repeticiones 200
+    python benchmark.py instantanea --transacciones 100000   (requiere numpy)
+    python benchmark.py sincronizacion --transacciones 100000
+    python benchmark.py escucha --transacciones 100000 --repeticiones 50
+    python benchmark.py saldos --transacciones 100000 --repeticiones 200
+    python benchmark.py reencadenar --transacciones 100000
+    python benchmark.py suite --tamanos 1000,100000,1000000 --muestras 5 --salida bench.json
+    python benchmark.py suite --tamanos 1000,100000 --comparar bench.json
+    python benchmark.py backends --tamanos 100000 --muestras 3
+
+Cada escenario imprime documentos leídos, escrituras, viajes de red y tiempo.
+"""
+
+import argparse
+
+from benchmarks import (
+    analisis,
+    backends,
+    cache,
+    condicional,
+    dashboard,
+    escucha,
+    exportar,
+    fragmentos,
+    historicos,
+    ids,
+    importar,
+    insertar,
+    instantanea,
+    latencia_post,
+    latencia_tablero,
+    moneda,
+    reencadenar,
+    reportes,
+    resumenes,
+    saldos,
+    sincronizacion,
+    suite,
+)
+
+
+ESCENARIOS = {
+    "analisis": analisis.escenario_analisis,
+    "backends": backends.escenario_backends,
+    "cache": cache.escenario_cache,
+    "condicional": condicional.escenario_condicional,
+    "dashboard": dashboard.escenario_dashboard,
+    "escucha": escucha.escenario_escucha,
+    "exportar": exportar.escenario_exportar,
+    "fragmentos": fragmentos.escenario_fragmentos,
+    "historicos": historicos.escenario_historicos,
+    "ids": ids.escenario_ids,
+    "importar": importar.escenario_importar,
+    "insertar": insertar.escenario_insertar,
+    "instantanea": instantanea.escenario_instantanea,
+    "latencia-post": latencia_post.escenario_latencia_post,
+    "latencia-tablero": latencia_tablero.escenario_latencia_tablero,
+    "moneda": moneda.escenario_moneda,
+    "reencadenar": reencadenar.escenario_reencadenar,
+    "reportes": reportes.escenario_reportes,
+    "resumenes": resumenes.escenario_resumenes,
+    "saldos": saldos.escenario_saldos,
+    "sincronizacion": sincronizacion.escenario_sincronizacion,
+    "suite": suite.escenario_suite,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de Finanzas Deiner")
+    parser.add_argument("escenario", choices=sorted(ESCENARIOS))
+    parser.add_argument("--transacciones", type=int, default=10_000)
+    parser.add_argument("--latencia", type=float, default=20.0,
+                        help="ms por viaje de red simulado")
+    parser.add_argument("--repeticiones", type=int, default=50)
+    parser.add_argument("--tamanos", default="1000,100000,1000000",
+                        help="suite: tamaños de historial, separados por comas")
+    parser.add_argument("--muestras", type=int, default=5,
+                        help="suite: llamadas medidas en frío y en caliente")
+    parser.add_argument("--salida", help="suite: archivo JSON donde guardar el resultado")
+    parser.add_argument("--comparar", help="suite: JSON de una corrida anterior")
+    parser.add_argument("--solo", help="suite/backends: medir solo los nombres que contengan "
+                                       "alguna de estas partes, separadas por comas")
+    args = parser.parse_args()
+    ESCENARIOS[args.escenario](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Escenarios de benchmark.py, uno por módulo."""
@@ -0,0 +1,18 @@
+"""Escenario `analisis` de benchmark.py."""
+
+from benchmarks.comun import cliente_logueado, medir, preparar_db
+
+
+def escenario_analisis(args):
+    """GET /analisis: lecturas según la ventana elegida, no según el historial."""
+    rutas = [
+        "/analisis?periodo=este_mes",
+        "/analisis?periodo=este_mes&periodo_comp=mes_anterior",
+        "/analisis?tipo=gasto&periodo=este_anio&categorias=Transporte+y+movilidad",
+    ]
+    for cantidad in (args.transacciones // 10, args.transacciones):
+        db = preparar_db(cantidad)
+        cliente = cliente_logueado()
+        print(f"/analisis con {cantidad} transacciones (antes: {cantidad} lecturas por periodo)")
+        for ruta in rutas:
+            print(f"  {ruta}: {medir(db, lambda: cliente.get(ruta))}")
@@ -0,0 +1,45 @@
+"""Escenario `backends` de benchmark.py."""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.comun import RAIZ
+
+
+# Lo que compara `backends`: los reportes y las rutas que más leen
+SOLO_BACKENDS = "/resumen-,/reporte-general,/analisis,/ingresos,/gastos,/historicos,/saldos"
+
+
+def escenario_backends(args):
+    """
+    La suite (solo reportes) con la base en memoria y con SQLite sobre los
+    mismos historiales sintéticos, cada una en su propio proceso, lado a lado.
+    """
+    resultados = {}
+    with tempfile.TemporaryDirectory() as carpeta:
+        for base in ("memoria", "sqlite"):
+            salida = os.path.join(carpeta, f"{base}.json")
+            comando = [
+                sys.executable, os.path.join(RAIZ, "benchmark.py"), "suite",
+                "--tamanos", args.tamanos, "--muestras", str(args.muestras),
+                "--solo", args.solo or SOLO_BACKENDS, "--salida", salida,
+            ]
+            entorno = dict(os.environ, FINANZAS_DB=base, FINANZAS_SQLITE=os.path.join(carpeta, "bench.sqlite3"))
+            print(f"Corriendo la suite con FINANZAS_DB={base}...")
+            subprocess.run(comando, env=entorno, check=True, stdout=subprocess.DEVNULL)
+            with open(salida, encoding="utf-8") as f:
+                resultados[base] = json.load(f)["resultados"]
+
+    for tamano, memoria in resultados["memoria"].items():
+        sqlite = resultados["sqlite"][tamano]
+        print(f"Memoria vs SQLite con {tamano} transacciones (p50 en frío / en caliente, ms)")
+        print(f"  {'':<52} {'lect. mem':>9} {'lect. sql':>9} {'frío mem':>9} {'frío sql':>9} "
+              f"{'cal. mem':>9} {'cal. sql':>9}")
+        for nombre, m in memoria.items():
+            q = sqlite[nombre]
+            print(f"  {nombre[:52]:<52} {m['lecturas']:>9} {q['lecturas']:>9} "
+                  f"{m['frio_p50_ms']:>9.1f} {q['frio_p50_ms']:>9.1f} "
+                  f"{m['caliente_p50_ms']:>9.1f} {q['caliente_p50_ms']:>9.1f}")
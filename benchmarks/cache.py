@@ -0,0 +1,25 @@
+"""Escenario `cache` de benchmark.py."""
+
+from benchmarks.comun import cliente_logueado, finanzas, medir, preparar_db
+
+
+def escenario_cache(args):
+    db = preparar_db(args.transacciones)
+    finanzas.reconstruir_resumenes()
+    cliente = cliente_logueado()
+    rutas = ["/", "/cuentas", "/transacciones"]
+
+    def recorrer():
+        for _ in range(10):
+            for r in rutas:
+                cliente.get(r)
+
+    finanzas.cache_lecturas.ttl = 0  # todo vence al instante = sin caché
+    sin_cache = medir(db, recorrer)
+    finanzas.cache_lecturas.ttl = 30
+    con_cache = medir(db, recorrer)
+
+    print(f"10 vueltas por {rutas} con {args.transacciones} transacciones")
+    print(f"  sin caché: {sin_cache}")
+    print(f"  con caché: {con_cache}")
+    print(f"  {finanzas.cache_lecturas.estadisticas()}")
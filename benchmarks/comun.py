@@ -0,0 +1,128 @@
+"""
+Lo que comparten los escenarios: el historial sintético, la base preparada,
+el cliente con sesión y las mediciones.
+"""
+
+import os
+import random
+import time
+from datetime import date, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("FINANZAS_DB", "memoria")
+os.environ.setdefault("FINANZAS_SQLITE", ":memory:")
+
+import app as finanzas  # noqa: E402
+
+
+CUENTAS = ["Bancolombia", "Nequi", "Daviplata", "Efectivo", "Ahorros"]
+
+
+def generar_libro(cantidad, dias=3 * 365, semilla=42, hasta=None):
+    """
+    Genera `cantidad` transacciones encadenadas (id_transaccion, saldo_en_cuenta,
+    saldo_inicial, saldo_final) repartidas en los últimos `dias` días, con las
+    categorías reales de la app. Devuelve (cuentas, transacciones).
+    """
+    rnd = random.Random(semilla)
+    hasta = hasta or date.today()
+    desde = hasta - timedelta(days=dias - 1)
+
+    saldos_cuenta = {c: float(rnd.randint(1, 20) * 1_000_000) for c in CUENTAS}
+    saldo_global = sum(saldos_cuenta.values())
+    saldos_iniciales = dict(saldos_cuenta)
+
+    fechas = sorted(
+        (desde + timedelta(days=rnd.randrange(dias))).isoformat()
+        for _ in range(cantidad)
+    )
+
+    transacciones = []
+    for i, fecha in enumerate(fechas, start=1):
+        cuenta = rnd.choice(CUENTAS)
+        if rnd.random() < 0.3:
+            tipo = "ingreso"
+            categoria = rnd.choice(finanzas.CATEGORIAS_INGRESO)
+            valor = float(rnd.randint(50, 5_000) * 1_000)
+        else:
+            tipo = "gasto"
+            categoria = rnd.choice(finanzas.CATEGORIAS_GASTO)
+            valor = -float(rnd.randint(5, 800) * 1_000)
+
+        saldo_inicial = saldo_global
+        saldo_global += valor
+        saldos_cuenta[cuenta] += valor
+
+        transacciones.append({
+            "id_transaccion": i,
+            "fecha": fecha,
+            "descripcion": f"Movimiento {i}",
+            "valor": valor,
+            "tipo": tipo,
+            "cuenta": cuenta,
+            "categoria": categoria,
+            "saldo_en_cuenta": saldos_cuenta[cuenta],
+            "saldo_inicial": saldo_inicial,
+            "saldo_final": saldo_global,
+        })
+
+    cuentas = [
+        {"nombre": c, "saldo_inicial": saldos_cuenta[c], "saldo_apertura": saldos_iniciales[c]}
+        for c in CUENTAS
+    ]
+    return cuentas, transacciones
+
+
+def vaciar_cache():
+    """Deja las cachés de lecturas y de fragmentos vacías, como en un worker recién arrancado."""
+    cache = finanzas.cache_lecturas
+    cache.invalidar(*{clave[0] for clave in list(cache._datos)})
+    finanzas.fragmentos_html.vaciar()
+
+
+def preparar_db(cantidad):
+    db = finanzas.db
+    db.vaciar()
+    cuentas, transacciones = generar_libro(cantidad)
+    db.cargar("cuentas", cuentas)
+    db.cargar("transacciones", transacciones)
+    db.cargar("config", [])
+    db.collection("config").document("transacciones").set({"contador": cantidad})
+    # Con otro libro, nada de lo guardado (ni los fragmentos de HTML) sirve
+    vaciar_cache()
+    db.contadores.reiniciar()
+    return db
+
+
+def cliente_logueado():
+    cliente = finanzas.app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion["logged"] = True
+    return cliente
+
+
+def medir(db, funcion):
+    db.contadores.reiniciar()
+    inicio = time.perf_counter()
+    funcion()
+    ms = (time.perf_counter() - inicio) * 1000
+    return dict(db.contadores.como_dict(), ms=round(ms, 1))
+
+
+def formulario_transaccion(rnd, fecha=None):
+    tipo = rnd.choice(["gasto", "ingreso"])
+    categorias = finanzas.CATEGORIAS_GASTO if tipo == "gasto" else finanzas.CATEGORIAS_INGRESO
+    return {
+        "fecha_trabajo": fecha or date.today().isoformat(),
+        "descripcion": "Benchmark",
+        "valor": str(rnd.randint(1, 900) * 1000),
+        "tipo": tipo,
+        "cuenta": rnd.choice(CUENTAS),
+        "categoria": rnd.choice(categorias),
+    }
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
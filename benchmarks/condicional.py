@@ -0,0 +1,26 @@
+"""Escenario `condicional` de benchmark.py."""
+
+from benchmarks.comun import cliente_logueado, finanzas, medir, preparar_db, vaciar_cache
+
+
+def escenario_condicional(args):
+    """Reportes completos frente a un GET condicional con el ETag de la respuesta anterior."""
+    db = preparar_db(args.transacciones)
+    finanzas.reconstruir_resumenes()
+    cliente = cliente_logueado()
+    rutas = [
+        "/resumen-diario",
+        "/resumen-mensual",
+        "/analisis?periodo=este_anio",
+        "/reporte-general?periodo=este_anio",
+    ]
+
+    print(f"GET condicional (If-None-Match) con {args.transacciones} transacciones")
+    for ruta in rutas:
+        vaciar_cache()
+        completo = medir(db, lambda: cliente.get(ruta))
+        etag = cliente.get(ruta).headers["ETag"]
+        condicional = medir(db, lambda: cliente.get(ruta, headers={"If-None-Match": etag}))
+        print(f"  {ruta}")
+        print(f"    completo:    {completo}")
+        print(f"    condicional: {condicional}")
@@ -0,0 +1,44 @@
+"""Escenario `dashboard` de benchmark.py."""
+
+from datetime import date, timedelta
+
+from benchmarks.comun import cliente_logueado, finanzas, medir, preparar_db
+
+
+def consultas_home_anterior(db):
+    """Las consultas que hacía home() antes del motor de una sola pasada."""
+    from firestore_memoria import DESCENDING
+
+    hoy = date.today()
+    trans = db.collection("transacciones")
+    list(trans.order_by("id_transaccion", direction=DESCENDING).limit(1).stream())
+    list(db.collection("cuentas").stream())
+    list(trans.where("fecha", "==", hoy.isoformat()).stream())
+    list(trans.stream())  # resumen del mes
+    list(trans.order_by("fecha").order_by("id_transaccion").stream())  # calcular_resumen_diario
+    list(trans.stream())  # gastos por categoría
+    list(trans.order_by("id_transaccion", direction=DESCENDING).limit(5).stream())
+    list(db.collection("cuentas").stream())
+    list(
+        trans.where("fecha", ">=", (hoy - timedelta(days=30)).isoformat())
+        .order_by("fecha")
+        .order_by("id_transaccion")
+        .stream()
+    )
+
+
+def escenario_dashboard(args):
+    db = preparar_db(args.transacciones)
+    cliente = cliente_logueado()
+
+    antes = medir(db, lambda: consultas_home_anterior(db))
+    despues = medir(db, lambda: cliente.get("/?refrescar=1"))
+    # El tablero lo guardan las escrituras; aquí se guarda a mano
+    with finanzas.app.test_request_context():
+        finanzas.rehacer_tablero()
+    guardado = medir(db, lambda: cliente.get("/"))
+
+    print(f"GET /  con {args.transacciones} transacciones")
+    print(f"  antes:    {antes}")
+    print(f"  después:  {despues}")
+    print(f"  guardado: {guardado}")
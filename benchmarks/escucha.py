@@ -0,0 +1,39 @@
+"""Escenario `escucha` de benchmark.py."""
+
+import time
+from datetime import date
+
+from benchmarks.comun import cliente_logueado, finanzas, medir, preparar_db
+
+
+def escenario_escucha(args):
+    """Libro en vivo (on_snapshot): carga inicial, lecturas por ruta y retraso de los avisos."""
+    db = preparar_db(args.transacciones)
+    finanzas.reconstruir_resumenes()
+    cliente = cliente_logueado()
+    rutas = ["/", "/analisis?periodo=anio_anterior", "/reporte-general", "/resumen-diario"]
+
+    finanzas.libro_local = finanzas.LibroLocal()
+    finanzas.escucha_libro = finanzas.EscuchaLibro(finanzas.libro_local)
+    try:
+        carga = medir(db, lambda: cliente.get("/listo") and finanzas.escucha_libro.listo.wait(60))
+        rutas_medidas = {r: medir(db, lambda r=r: cliente.get(r)) for r in rutas}
+
+        hoy = date.today().isoformat()
+        for i in range(args.repeticiones):
+            finanzas.registrar_transaccion(
+                hoy, f"bench {i}", -1000.0, "gasto", "Efectivo", "Salud y bienestar")
+            time.sleep(0.01)
+        time.sleep(0.1)
+        estadisticas = finanzas.escucha_libro.estadisticas()
+    finally:
+        finanzas.escucha_libro.detener()
+        finanzas.escucha_libro = None
+        finanzas.libro_local = None
+
+    print(f"Escucha en vivo con {args.transacciones} transacciones")
+    print(f"  carga inicial: {carga} (listo en {estadisticas['carga_inicial_s']} s)")
+    for r in rutas:
+        print(f"  {r}: {rutas_medidas[r]}")
+    print(f"  retraso escritura → aviso en {args.repeticiones} escrituras: "
+          f"{estadisticas['retraso_ms']}")
@@ -0,0 +1,38 @@
+"""Escenario `exportar` de benchmark.py."""
+
+import time
+import tracemalloc
+
+from benchmarks.comun import cliente_logueado, preparar_db
+
+
+def escenario_exportar(args):
+    """Primer byte, tiempo total y pico de memoria de /exportar.csv y .xlsx."""
+    db = preparar_db(args.transacciones)
+    cliente = cliente_logueado()
+
+    def descargar(formato):
+        inicio = time.perf_counter()
+        respuesta = cliente.get(f"/exportar.{formato}", buffered=False)
+        partes = iter(respuesta.response)
+        tamano = len(next(partes))
+        primer_byte = (time.perf_counter() - inicio) * 1000
+        for parte in partes:
+            tamano += len(parte)
+        respuesta.close()
+        return primer_byte, time.perf_counter() - inicio, tamano
+
+    print(f"Exportar todo el historial ({args.transacciones} transacciones)")
+    for formato in ("csv", "xlsx"):
+        db.contadores.reiniciar()
+        primer_byte, segundos, tamano = descargar(formato)
+        contadores = db.contadores.como_dict()
+
+        # La memoria se mide aparte: tracemalloc hace todo más lento
+        tracemalloc.start()
+        descargar(formato)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f"  {formato:>4}: primer byte {primer_byte:.0f} ms, total {segundos:.1f} s, "
+              f"{tamano / 1e6:.1f} MB, pico de memoria {pico / 1e6:.1f} MB, {contadores}")
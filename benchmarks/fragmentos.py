@@ -0,0 +1,31 @@
+"""Escenario `fragmentos` de benchmark.py."""
+
+from benchmarks.comun import cliente_logueado, finanzas, medir, preparar_db
+
+
+def escenario_fragmentos(args):
+    """Vistas repetidas de las tablas grandes con y sin la caché de fragmentos HTML."""
+    db = preparar_db(args.transacciones)
+    finanzas.reconstruir_resumenes()
+    cliente = cliente_logueado()
+    rutas = [
+        "/analisis?periodo=este_anio&periodo_comp=anio_anterior",
+        "/ingresos?por_pagina=200",
+        "/gastos?por_pagina=200",
+    ]
+    fragmentos = finanzas.fragmentos_html
+    tope = fragmentos.max_bytes
+
+    print(f"Tablas grandes con {args.transacciones} transacciones, segunda vista")
+    for ruta in rutas:
+        fragmentos.vaciar()
+        fragmentos.max_bytes = 0  # nada cabe = sin caché de fragmentos
+        cliente.get(ruta)
+        sin_cache = medir(db, lambda: cliente.get(ruta))
+        fragmentos.max_bytes = tope
+        cliente.get(ruta)
+        con_cache = medir(db, lambda: cliente.get(ruta))
+        print(f"  {ruta}")
+        print(f"    sin fragmentos: {sin_cache}")
+        print(f"    con fragmentos: {con_cache}")
+    print(f"  {fragmentos.estadisticas()}")
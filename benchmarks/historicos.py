@@ -0,0 +1,19 @@
+"""Escenario `historicos` de benchmark.py."""
+
+from benchmarks.comun import cliente_logueado, finanzas, medir, preparar_db
+
+
+def escenario_historicos(args):
+    """GET /ingresos y /gastos (una página) según el tamaño del historial."""
+    for cantidad in (args.transacciones // 10, args.transacciones):
+        db = preparar_db(cantidad)
+        finanzas.reconstruir_resumenes()
+        cliente = cliente_logueado()
+        cliente.get("/gastos")  # calienta la caché de resumen_meses
+        finanzas.fragmentos_html.vaciar()  # pero se mide la página sin fragmentos guardados
+
+        print(f"Vistas históricas con {cantidad} transacciones")
+        for ruta in ("/ingresos", "/gastos"):
+            respuesta = {}
+            datos = medir(db, lambda: respuesta.setdefault("r", cliente.get(ruta)))
+            print(f"  {ruta}: {datos}, {len(respuesta['r'].data) / 1e3:.0f} KB")
@@ -0,0 +1,52 @@
+"""Escenario `ids` de benchmark.py."""
+
+import time
+from datetime import date
+
+from benchmarks.comun import CUENTAS, finanzas, preparar_db
+
+
+def escenario_ids(args):
+    """
+    Prueba de estrés de id_transaccion: varios hilos dando de alta a la vez
+    (cada alta toma su id en su transacción) mientras otros reservan bloques
+    de ids como las importaciones, contra el mismo contador. Falla si sale
+    algún id repetido.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    db = preparar_db(0)
+    db.collection("cuentas").add({"nombre": CUENTAS[0], "saldo_inicial": 0})
+    db.latencia = 0.001  # que las transacciones tarden algo y se crucen
+    pedidos_por_hilo = max(args.transacciones // 400, 1)
+    hoy = date.today().isoformat()
+
+    def altas(_):
+        return [
+            finanzas.registrar_transaccion(
+                hoy, "Benchmark", 1000.0, "ingreso", CUENTAS[0], "Otros ingresos"
+            )["id_transaccion"]
+            for _ in range(pedidos_por_hilo)
+        ]
+
+    def importacion(_):
+        ids = []
+        for _ in range(pedidos_por_hilo):
+            primero, ultimo = finanzas.reservar_bloque_ids(db.transaction(), 100)
+            ids.extend(range(primero, ultimo + 1))
+        return ids
+
+    ids = []
+    db.contadores.reiniciar()
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        for lote in pool.map(lambda f: f(None), [altas] * 10 + [importacion] * 2):
+            ids.extend(lote)
+    ms = (time.perf_counter() - inicio) * 1000
+    db.latencia = 0.0
+
+    repetidos = len(ids) - len(set(ids))
+    print(f"10 hilos de altas y 2 de bloques de 100, {pedidos_por_hilo} pedidos cada uno")
+    print(f"  {len(ids)} ids, {repetidos} repetidos, {db.contadores.como_dict()}, ms={ms:.0f}")
+    if repetidos:
+        raise SystemExit("ERROR: se entregaron ids repetidos")
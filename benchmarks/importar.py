@@ -0,0 +1,45 @@
+"""Escenario `importar` de benchmark.py."""
+
+import csv
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.comun import finanzas, generar_libro, preparar_db
+
+
+def escenario_importar(args):
+    """Importa un CSV de `--transacciones` filas sobre un historial de 10k."""
+    db = preparar_db(10_000)
+    finanzas.reconstruir_resumenes()
+    _, filas = generar_libro(args.transacciones, dias=365, semilla=7)
+
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", newline="", delete=False) as f:
+        escritor = csv.writer(f, delimiter=";")
+        escritor.writerow(["fecha", "descripcion", "valor", "tipo", "cuenta", "categoria"])
+        for t in filas:
+            escritor.writerow([
+                t["fecha"], t["descripcion"], f"{abs(t['valor']):.2f}".replace(".", ","),
+                t["tipo"], t["cuenta"], t["categoria"],
+            ])
+        escritor.writerow(["2024-13-01", "Fecha mala", "1000", "gasto", "Nequi", "Abastecimiento y alimentacion"])
+        ruta = f.name
+
+    try:
+        db.contadores.reiniciar()
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        with open(ruta, encoding="utf-8-sig", newline="") as f:
+            resultado = finanzas.importar_transacciones(finanzas.leer_csv(f))
+        segundos = time.perf_counter() - inicio
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        os.remove(ruta)
+
+    print(f"Importar CSV de {args.transacciones} filas")
+    print(f"  importadas={resultado['importadas']} rechazadas={resultado['rechazadas']} "
+          f"{db.contadores.como_dict()}")
+    print(f"  {segundos:.1f} s, {args.transacciones / segundos:.0f} filas/s, "
+          f"pico de memoria {pico / 1e6:.1f} MB")
@@ -0,0 +1,33 @@
+"""Escenario `insertar` de benchmark.py."""
+
+import random
+
+from benchmarks.comun import (
+    cliente_logueado,
+    CUENTAS,
+    finanzas,
+    formulario_transaccion,
+    medir,
+    preparar_db,
+)
+
+
+def escenario_insertar(args):
+    """Lecturas de un POST /transacciones según el tamaño del historial."""
+    rnd = random.Random(1)
+    for cantidad in (args.transacciones // 10, args.transacciones):
+        db = preparar_db(cantidad)
+        finanzas.reconstruir_resumenes()
+        cliente = cliente_logueado()
+
+        # La primera inserción por cuenta migra su saldo al documento de la cuenta
+        primeras = [
+            medir(db, lambda: cliente.post("/transacciones", data=formulario_transaccion(rnd)))
+            for _ in range(len(CUENTAS) * 3)
+        ]
+        siguiente = medir(
+            db, lambda: cliente.post("/transacciones", data=formulario_transaccion(rnd))
+        )
+        print(f"POST /transacciones con {cantidad} transacciones")
+        print(f"  primera: {primeras[0]}")
+        print(f"  estable: {siguiente}")
@@ -0,0 +1,48 @@
+"""Escenario `instantanea` de benchmark.py."""
+
+import tempfile
+
+from benchmarks.comun import cliente_logueado, finanzas, medir, preparar_db, vaciar_cache
+
+
+def escenario_instantanea(args):
+    """Reportes con y sin la instantánea columnar (numpy)."""
+    import shutil
+    import instantanea
+
+    if not instantanea.DISPONIBLE:
+        raise SystemExit("Este escenario necesita numpy")
+
+    db = preparar_db(args.transacciones)
+    finanzas.reconstruir_resumenes()
+    cliente = cliente_logueado()
+    rutas = [
+        "/analisis?periodo=anio_anterior&periodo_comp=este_anio",
+        "/reporte-general?periodo=anio_anterior",
+        "/resumen-mensual",
+    ]
+
+    sin = {r: medir(db, lambda r=r: cliente.get(r)) for r in rutas}
+
+    directorio = tempfile.mkdtemp(prefix="instantanea-")
+    try:
+        finanzas.instantanea = instantanea.InstantaneaColumnar(directorio)
+        carga = medir(db, finanzas.instantanea_al_dia)
+        # Se reabre desde disco, como un worker que arranca
+        finanzas.instantanea = instantanea.InstantaneaColumnar(directorio)
+        vaciar_cache()
+        con = {r: medir(db, lambda r=r: cliente.get(r)) for r in rutas}
+        vaciar_cache()
+        solo_calculo = medir(db, lambda: finanzas.instantanea_al_dia().filtrar_y_resumir(
+            "todos", *finanzas.calcular_rango_fechas("anio_anterior"), []))
+    finally:
+        finanzas.instantanea = None
+        shutil.rmtree(directorio)
+
+    print(f"Instantánea columnar con {args.transacciones} transacciones")
+    print(f"  carga inicial: {carga}")
+    for r in rutas:
+        print(f"  {r}")
+        print(f"    Firestore:   {sin[r]}")
+        print(f"    instantánea: {con[r]}")
+    print(f"  filtrar_y_resumir de un año (sync + cálculo): {solo_calculo}")
@@ -0,0 +1,42 @@
+"""Escenario `latencia-post` de benchmark.py."""
+
+import random
+import time
+
+from benchmarks.comun import (
+    cliente_logueado,
+    CUENTAS,
+    finanzas,
+    formulario_transaccion,
+    percentil,
+    preparar_db,
+)
+
+
+def escenario_latencia_post(args):
+    """
+    p50 / p99 de POST /transacciones con `--latencia` ms por viaje de red
+    simulado, para ver cuántos viajes en serie hace cada inserción.
+    """
+    db = preparar_db(args.transacciones)
+    finanzas.reconstruir_resumenes()
+    cliente = cliente_logueado()
+    rnd = random.Random(2)
+
+    # Calentar: migra el saldo de cada cuenta
+    for _ in range(len(CUENTAS) * 3):
+        cliente.post("/transacciones", data=formulario_transaccion(rnd))
+
+    db.latencia = args.latencia / 1000
+    tiempos = []
+    db.contadores.reiniciar()
+    for _ in range(args.repeticiones):
+        inicio = time.perf_counter()
+        cliente.post("/transacciones", data=formulario_transaccion(rnd))
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    db.latencia = 0.0
+
+    viajes = db.contadores.viajes / args.repeticiones
+    print(f"POST /transacciones x{args.repeticiones}, {args.latencia} ms por viaje")
+    print(f"  p50={percentil(tiempos, 50):.1f} ms  p99={percentil(tiempos, 99):.1f} ms  "
+          f"viajes por POST={viajes:.1f}")
@@ -0,0 +1,38 @@
+"""Escenario `latencia-tablero` de benchmark.py."""
+
+import time
+
+from benchmarks.comun import cliente_logueado, finanzas, percentil, preparar_db
+
+
+def escenario_latencia_tablero(args):
+    """
+    p50 / p99 de GET /?refrescar=1 (sin caché ni tablero guardado) con
+    `--latencia` ms por viaje de red simulado. Compara con la suma de lo
+    que tardó cada consulta (Server-Timing): si salen a la vez, el tablero
+    tarda lo que la más lenta.
+    """
+    db = preparar_db(args.transacciones)
+    finanzas.reconstruir_resumenes()
+    cliente = cliente_logueado()
+
+    db.latencia = args.latencia / 1000
+    tiempos, sumas = [], []
+    db.contadores.reiniciar()
+    for _ in range(args.repeticiones):
+        finanzas.cache_lecturas.invalidar("cuentas", "transacciones", "resumen_meses")
+        inicio = time.perf_counter()
+        respuesta = cliente.get("/?refrescar=1")
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        sumas.append(sum(
+            float(parte.split("dur=")[1])
+            for parte in respuesta.headers.get("Server-Timing", "").split(",")
+            if "dur=" in parte
+        ))
+    db.latencia = 0.0
+
+    print(f"GET /?refrescar=1 x{args.repeticiones} sin caché, {args.latencia} ms por viaje")
+    print(f"  p50={percentil(tiempos, 50):.1f} ms  p99={percentil(tiempos, 99):.1f} ms  "
+          f"suma de consultas p50={percentil(sumas, 50):.1f} ms  "
+          f"viajes por GET={db.contadores.viajes / args.repeticiones:.1f}")
+    print(f"  Server-Timing: {respuesta.headers.get('Server-Timing')}")
@@ -0,0 +1,72 @@
+"""Escenario `moneda` de benchmark.py."""
+
+import random
+import sys
+import time
+from decimal import Decimal
+
+from benchmarks.comun import finanzas, generar_libro
+
+
+def cop_babel(valor):
+    """formatear_cop() como era antes: una llamada a Babel por valor."""
+    from babel.numbers import format_currency
+
+    if valor is None:
+        valor = 0
+    try:
+        return format_currency(valor, 'COP', locale='es_CO')
+    except Exception:
+        return f"${valor:,.0f}"
+
+
+def valores_moneda(rnd, cantidad):
+    """
+    Montos al azar para comparar formateadores: todas las magnitudes, con
+    y sin decimales, medios centavos (redondeo), enteros, Decimal, ceros
+    con signo y los casos raros (NaN, infinitos, None, textos).
+    """
+    valores = [0, -0.0, None, float("nan"), float("inf"), -float("inf"), "1234", True, 10**30, 1e300]
+    for _ in range(cantidad):
+        valor = rnd.uniform(-1, 1) * 10 ** rnd.randint(-8, 27)
+        forma = rnd.randrange(5)
+        if forma == 1:
+            valor = round(valor, 3)
+        elif forma == 2:
+            valor = int(valor)
+        elif forma == 3:
+            valor = rnd.randint(-10**6, 10**6) / 1000 + 0.005
+        elif forma == 4:
+            valor = Decimal(str(round(valor, rnd.randint(0, 4))))
+        valores.append(valor)
+    return valores
+
+
+def escenario_moneda(args):
+    """
+    formatear_cop() frente a Babel: primero que den exactamente lo mismo
+    para `--repeticiones` x 1000 montos al azar, después cuánto tarda cada
+    uno con montos como los de una página de /gastos.
+    """
+    rnd = random.Random(args.repeticiones)
+    distintos = [
+        (v, finanzas.formatear_cop(v), cop_babel(v))
+        for v in valores_moneda(rnd, args.repeticiones * 1000)
+        if finanzas.formatear_cop(v) != cop_babel(v)
+    ]
+    print(f"formatear_cop vs Babel con {args.repeticiones * 1000} montos al azar: "
+          f"{len(distintos)} distintos")
+    for valor, rapido, babel in distintos[:10]:
+        print(f"  {valor!r}: {rapido!r} != {babel!r}")
+
+    _, transacciones = generar_libro(args.transacciones)
+    montos = [abs(t["valor"]) for t in transacciones]
+    print(f"Formatear {len(montos)} montos")
+    for nombre, funcion in (("Babel", cop_babel), ("formatear_cop", finanzas.formatear_cop)):
+        inicio = time.perf_counter()
+        for monto in montos:
+            funcion(monto)
+        segundos = time.perf_counter() - inicio
+        print(f"  {nombre:<14} {segundos * 1000:.1f} ms  ({segundos / len(montos) * 1e6:.2f} µs por monto)")
+    if distintos:
+        sys.exit(1)
@@ -0,0 +1,44 @@
+"""Escenario `reencadenar` de benchmark.py."""
+
+import random
+from datetime import date, timedelta
+
+from benchmarks.comun import (
+    cliente_logueado,
+    finanzas,
+    formulario_transaccion,
+    medir,
+    preparar_db,
+)
+
+
+def escenario_reencadenar(args):
+    """POST /transacciones con fecha de hoy y en la mitad del historial (re-encadenado)."""
+    db = preparar_db(args.transacciones)
+    finanzas.reconstruir_resumenes()
+    cliente = cliente_logueado()
+    rnd = random.Random(11)
+    mitad = (date.today() - timedelta(days=3 * 365 // 2)).isoformat()
+
+    def esperar_segundo_plano():
+        finanzas.hilo_reencadenar.submit(lambda: None).result()
+
+    hoy = medir(db, lambda: cliente.post("/transacciones", data=formulario_transaccion(rnd)))
+    atrasada = medir(db, lambda: cliente.post(
+        "/transacciones", data=formulario_transaccion(rnd, mitad)))
+    resto = medir(db, esperar_segundo_plano)
+
+    docs = sorted(
+        (d.to_dict() for d in db.collection("transacciones").stream()),
+        key=lambda t: (t["fecha"], t["id_transaccion"]),
+    )
+    descuadres = sum(
+        1 for a, b in zip(docs, docs[1:]) if abs(a["saldo_final"] - b["saldo_inicial"]) > 1e-6
+    )
+
+    print(f"Alta con fecha atrasada ({mitad}) en {args.transacciones} transacciones")
+    print(f"  POST con fecha de hoy:   {hoy}")
+    print(f"  POST atrasado (request, {finanzas.VENTANAS_SINCRONAS} ventanas de "
+          f"{finanzas.VENTANA_REENCADENAR}): {atrasada}")
+    print(f"  resto en segundo plano:  {resto}")
+    print(f"  saldos descuadrados después: {descuadres}")
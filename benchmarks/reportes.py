@@ -0,0 +1,15 @@
+"""Escenario `reportes` de benchmark.py."""
+
+from benchmarks.comun import cliente_logueado, medir, preparar_db
+
+
+def escenario_reportes(args):
+    """GET /reporte-general: agregaciones sum/count frente a recorrer el historial."""
+    rutas = ["/reporte-general?periodo=este_mes", "/reporte-general?periodo=este_anio"]
+    for cantidad in (args.transacciones // 10, args.transacciones):
+        db = preparar_db(cantidad)
+        cliente = cliente_logueado()
+        print(f"/reporte-general con {cantidad} transacciones (antes: {cantidad} lecturas)")
+        for ruta in rutas:
+            print(f"  {ruta}: {medir(db, lambda: cliente.get(ruta))}")
+            print(f"    en caché: {medir(db, lambda: cliente.get(ruta))}")
@@ -0,0 +1,19 @@
+"""Escenario `resumenes` de benchmark.py."""
+
+from benchmarks.comun import cliente_logueado, finanzas, medir, preparar_db
+
+
+def escenario_resumenes(args):
+    db = preparar_db(args.transacciones)
+    cliente = cliente_logueado()
+    rutas = ["/?refrescar=1", "/resumen-diario", "/resumen-mensual"]
+
+    antes = {r: medir(db, lambda r=r: cliente.get(r)) for r in rutas}
+    finanzas.reconstruir_resumenes()
+    despues = {r: medir(db, lambda r=r: cliente.get(r)) for r in rutas}
+
+    print(f"Resúmenes con {args.transacciones} transacciones")
+    for r in rutas:
+        print(f"  {r}")
+        print(f"    sin resúmenes: {antes[r]}")
+        print(f"    con resúmenes: {despues[r]}")
@@ -0,0 +1,60 @@
+"""Escenario `saldos` de benchmark.py."""
+
+import random
+from datetime import date, timedelta
+
+from benchmarks.comun import cliente_logueado, finanzas, medir, preparar_db
+
+
+def escenario_saldos(args):
+    """Saldo al cierre de un día y series históricas: recorrer el historial frente al índice."""
+    db = preparar_db(args.transacciones)
+    cliente = cliente_logueado()
+    rnd = random.Random(7)
+    hoy = date.today()
+    fechas = [(hoy - timedelta(days=rnd.randrange(3 * 365))).isoformat()
+              for _ in range(args.repeticiones)]
+
+    def por_recorrido():
+        for fecha in fechas[:5]:
+            saldo = None
+            for data in finanzas.transacciones_en_orden(hasta_iso=fecha):
+                saldo = data.get("saldo_final")
+
+    recorrido = medir(db, por_recorrido)
+
+    libro = finanzas.LibroLocal()
+    carga = medir(db, lambda: libro.sincronizar(finanzas.leer_cambios))
+    indice = libro.saldos()
+    consultas = medir(db, lambda: [indice.saldo_al(f) for f in fechas])
+
+    # Altas con fechas viejas, de a una como llegan por la escucha en vivo
+    def atrasadas():
+        for i, fecha in enumerate(fechas, start=1):
+            libro.aplicar({args.transacciones + i: {
+                "id_transaccion": args.transacciones + i, "fecha": fecha, "valor": -1000.0,
+                "tipo": "gasto", "cuenta": "Efectivo", "categoria": "Salud y bienestar",
+            }})
+
+    altas = medir(db, atrasadas)
+
+    finanzas.libro_local = libro
+    try:
+        rutas = {
+            r: medir(db, lambda r=r: cliente.get(r))
+            for r in (
+                "/saldos/historico?desde=2000-01-01&paso=mes",
+                f"/saldos/historico?desde={(hoy - timedelta(days=3 * 365)).isoformat()}",
+                "/saldos/historico?paso=semana&cuenta=Nequi&desde=2020-01-01",
+            )
+        }
+    finally:
+        finanzas.libro_local = None
+
+    print(f"Saldos por día con {args.transacciones} transacciones")
+    print(f"  saldo al cierre de 5 fechas recorriendo el historial: {recorrido}")
+    print(f"  carga del libro con el índice: {carga}")
+    print(f"  saldo al cierre de {len(fechas)} fechas con el índice: {consultas}")
+    print(f"  {len(fechas)} altas con fecha atrasada (libro + índice): {altas}")
+    for r, m in rutas.items():
+        print(f"  {r}: {m}")
@@ -0,0 +1,46 @@
+"""Escenario `sincronizacion` de benchmark.py."""
+
+from datetime import date
+
+from benchmarks.comun import cliente_logueado, finanzas, medir, preparar_db
+
+
+def escenario_sincronizacion(args):
+    """Lecturas por request con el libro local: carga inicial, régimen estable y tras escribir."""
+    db = preparar_db(args.transacciones)
+    finanzas.reconstruir_resumenes()
+    cliente = cliente_logueado()
+    rutas = [
+        "/analisis?periodo=anio_anterior&periodo_comp=este_anio",
+        "/reporte-general?periodo=anio_anterior",
+        "/resumen-diario",
+        "/exportar.csv?periodo=este_anio",
+    ]
+
+    sin = {r: medir(db, lambda r=r: cliente.get(r).data) for r in rutas}
+
+    finanzas.libro_local = finanzas.LibroLocal()
+    try:
+        carga = medir(db, finanzas.libro_al_dia)
+        estable = {}
+        for r in rutas:
+            # Sin caché, como una request que llega cuando ya venció el TTL
+            finanzas.cache_lecturas.invalidar("transacciones")
+            finanzas.fragmentos_html.vaciar()
+            estable[r] = medir(db, lambda r=r: cliente.get(r).data)
+
+        hoy = date.today().isoformat()
+        for i in range(args.repeticiones):
+            finanzas.registrar_transaccion(
+                hoy, f"bench {i}", -1000.0, "gasto", "Efectivo", "Salud y bienestar")
+        tras_escribir = medir(db, finanzas.libro_al_dia)
+    finally:
+        finanzas.libro_local = None
+
+    print(f"Libro local con {args.transacciones} transacciones")
+    print(f"  carga inicial: {carga}")
+    for r in rutas:
+        print(f"  {r}")
+        print(f"    Firestore:   {sin[r]}")
+        print(f"    libro local: {estable[r]}")
+    print(f"  sincronizar tras {args.repeticiones} escrituras: {tras_escribir}")
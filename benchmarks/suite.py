@@ -0,0 +1,223 @@
+"""Escenario `suite` de benchmark.py."""
+
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.comun import (
+    cliente_logueado,
+    CUENTAS,
+    finanzas,
+    formulario_transaccion,
+    percentil,
+    preparar_db,
+    vaciar_cache,
+)
+
+
+# Rutas GET que mide la suite
+RUTAS_SUITE = [
+    "/",
+    "/?refrescar=1",
+    "/cuentas",
+    "/transacciones",
+    "/historicos",
+    "/saldos/historico?paso=mes",
+    "/ingresos",
+    "/gastos",
+    "/resumen-diario",
+    "/resumen-mensual",
+    "/analisis?periodo=este_mes",
+    "/analisis?tipo=gasto&periodo=este_anio&categorias=Transporte+y+movilidad",
+    "/reporte-general?periodo=este_mes",
+    "/reporte-general?periodo=este_anio",
+    "/exportar.csv",
+]
+
+
+# La base en memoria recorre toda la colección en cada página de la
+# exportación (cuadrático): con historiales más grandes se omite
+EXPORTAR_SUITE_HASTA = 100_000
+
+
+PERIODOS = [
+    "ultimos_7_dias", "ultimos_30_dias", "este_mes", "mes_anterior", "este_anio", "anio_anterior",
+]
+
+
+def mediciones_suite(cliente, rnd, cantidad):
+    """(nombre, función) de cada cosa que mide la suite."""
+    def get(ruta):
+        def pedir():
+            respuesta = cliente.get(ruta)
+            b"".join(respuesta.response)  # consume las respuestas en streaming
+            assert respuesta.status_code == 200, (ruta, respuesta.status_code)
+        return pedir
+
+    def post():
+        respuesta = cliente.post("/transacciones", data=formulario_transaccion(rnd))
+        assert respuesta.status_code == 302, respuesta.status_code
+
+    def en_request(funcion):
+        def llamar():
+            with finanzas.app.test_request_context("/"):
+                funcion()
+        return llamar
+
+    with finanzas.app.test_request_context("/"):
+        transacciones = list(finanzas.transacciones_en_orden())
+
+    def filtrar(tipo, periodo, categorias):
+        def llamar():
+            desde, hasta = finanzas.calcular_rango_fechas(periodo)
+            finanzas.filtrar_y_resumir(transacciones, tipo, desde, hasta, categorias)
+        return llamar
+
+    def rangos():
+        for _ in range(1000):
+            for periodo in PERIODOS:
+                finanzas.calcular_rango_fechas(periodo)
+
+    mediciones = [
+        (f"GET {ruta}", get(ruta))
+        for ruta in RUTAS_SUITE
+        if not (ruta.startswith("/exportar") and cantidad > EXPORTAR_SUITE_HASTA)
+    ]
+    mediciones += [
+        ("POST /transacciones", post),
+        ("calcular_resumen_diario", en_request(finanzas.calcular_resumen_diario)),
+        ("filtrar_y_resumir todos/este_anio", filtrar("todos", "este_anio", [])),
+        ("filtrar_y_resumir gasto/30 dias", filtrar("gasto", "ultimos_30_dias", ["Transporte y movilidad"])),
+        ("calcular_rango_fechas x6000", rangos),
+    ]
+    return mediciones
+
+
+def medir_suite(db, funcion, muestras):
+    """
+    Lecturas y escrituras de una llamada en frío (caché vacía), p50/p99 en
+    frío y en caliente, y el pico de memoria de una llamada en frío (aparte,
+    porque tracemalloc hace todo más lento).
+    """
+    frio = []
+    contadores = None
+    for _ in range(muestras):
+        vaciar_cache()
+        db.contadores.reiniciar()
+        inicio = time.perf_counter()
+        funcion()
+        frio.append((time.perf_counter() - inicio) * 1000)
+        if contadores is None:
+            contadores = db.contadores.como_dict()
+
+    caliente = []
+    for _ in range(muestras):
+        inicio = time.perf_counter()
+        funcion()
+        caliente.append((time.perf_counter() - inicio) * 1000)
+
+    vaciar_cache()
+    tracemalloc.start()
+    funcion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "lecturas": contadores["lecturas"],
+        "escrituras": contadores["escrituras"],
+        "viajes": contadores["viajes"],
+        "frio_p50_ms": round(percentil(frio, 50), 2),
+        "frio_p99_ms": round(percentil(frio, 99), 2),
+        "caliente_p50_ms": round(percentil(caliente, 50), 2),
+        "pico_mb": round(pico / 1e6, 2),
+    }
+
+
+def comparar_suite(anterior, actual, umbral=0.2):
+    """
+    Regresiones frente a una corrida anterior: más lecturas, o p50 en frío
+    más de `umbral` (y más de 1 ms) por encima. Devuelve cuántas hay.
+    """
+    regresiones = 0
+    for tamano, resultados in actual["resultados"].items():
+        previos = anterior.get("resultados", {}).get(tamano, {})
+        for nombre, datos in resultados.items():
+            previo = previos.get(nombre)
+            if previo is None:
+                continue
+            motivos = []
+            if datos["lecturas"] > previo["lecturas"]:
+                motivos.append(f"lecturas {previo['lecturas']} -> {datos['lecturas']}")
+            antes, ahora = previo["frio_p50_ms"], datos["frio_p50_ms"]
+            if ahora > antes * (1 + umbral) and ahora - antes > 1:
+                motivos.append(f"p50 {antes:.1f} -> {ahora:.1f} ms")
+            if motivos:
+                regresiones += 1
+                print(f"  REGRESIÓN [{tamano}] {nombre}: {', '.join(motivos)}")
+    return regresiones
+
+
+def escenario_suite(args):
+    """
+    Todas las rutas, el POST y los cálculos principales con historiales
+    sintéticos de cada tamaño de `--tamanos`. Con --salida guarda el
+    resultado en JSON; con --comparar lo contrasta con una corrida anterior
+    y termina con error si algo empeoró.
+    """
+    tamanos = [int(t) for t in args.tamanos.split(",")]
+    solo = [parte for parte in (args.solo or "").split(",") if parte]
+    # La base en memoria recorre todo el historial en cada consulta; con 1M
+    # (y tracemalloc) pasa del límite pensado para Firestore
+    finanzas.LIMITE_CONSULTAS = 600
+    resultado = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "base": os.environ["FINANZAS_DB"],
+        "muestras": args.muestras,
+        "resultados": {},
+    }
+
+    for cantidad in tamanos:
+        db = preparar_db(cantidad)
+        finanzas.reconstruir_resumenes()
+        cliente = cliente_logueado()
+        rnd = random.Random(cantidad)
+        resultados = resultado["resultados"][str(cantidad)] = {}
+
+        # Calentar: migra el saldo de cada cuenta y deja guardado el tablero
+        # de GET / (lo rehace la primera alta)
+        for _ in range(len(CUENTAS) * 3):
+            cliente.post("/transacciones", data=formulario_transaccion(rnd))
+        cliente.get("/")
+
+        print(f"Suite con {cantidad} transacciones")
+        print(f"  {'':<52} {'lecturas':>9} {'escrit.':>8} {'frío p50':>9} {'p99':>9} "
+              f"{'caliente':>9} {'pico MB':>8}")
+        if cantidad > EXPORTAR_SUITE_HASTA:
+            print(f"  (sin /exportar.csv: más de {EXPORTAR_SUITE_HASTA} transacciones)")
+        for nombre, funcion in mediciones_suite(cliente, rnd, cantidad):
+            if solo and not any(parte in nombre for parte in solo):
+                continue
+            datos = resultados[nombre] = medir_suite(db, funcion, args.muestras)
+            print(f"  {nombre[:52]:<52} {datos['lecturas']:>9} {datos['escrituras']:>8} "
+                  f"{datos['frio_p50_ms']:>9.1f} {datos['frio_p99_ms']:>9.1f} "
+                  f"{datos['caliente_p50_ms']:>9.1f} {datos['pico_mb']:>8.1f}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"Resultado guardado en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+        print(f"Comparación con {args.comparar} ({anterior.get('fecha')})")
+        regresiones = comparar_suite(anterior, resultado)
+        if regresiones:
+            sys.exit(1)
+        print("  sin regresiones")
@@ -0,0 +1,591 @@
+"""
+Cliente de Firestore EN MEMORIA, compatible con la parte de la API que usa
+app.py (collection / document / where / order_by / limit / stream / get /
+set / update / add / delete, sum / count, get_all, batch, transaction y
+on_snapshot).
+
+Sirve para correr la app sin credenciales (FINANZAS_DB=memoria) y para los
+benchmarks: cuenta cuántos documentos se leen y se escriben, y cuántos
+viajes de red haría el cliente real.
+"""
+
+import copy
+import heapq
+import queue
+import random
+import string
+import threading
+import time
+from datetime import datetime, timezone
+
+
+DESCENDING = "DESCENDING"
+ASCENDING = "ASCENDING"
+
+
+def _nuevo_id():
+    letras = string.ascii_letters + string.digits
+    return "".join(random.choice(letras) for _ in range(20))
+
+
+def _copiar(datos):
+    """Copia un documento; solo los mapas / listas anidados se copian a fondo."""
+    if datos is None:
+        return None
+    return {
+        k: copy.deepcopy(v) if isinstance(v, (dict, list)) else v
+        for k, v in datos.items()
+    }
+
+
+class Contadores:
+    """Lecturas / escrituras / viajes acumulados por el cliente."""
+
+    def __init__(self):
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.lecturas = 0
+        self.escrituras = 0
+        self.viajes = 0
+        self.transacciones = 0
+        self.conflictos = 0
+
+    def como_dict(self):
+        return {
+            "lecturas": self.lecturas,
+            "escrituras": self.escrituras,
+            "viajes": self.viajes,
+            "transacciones": self.transacciones,
+            "conflictos": self.conflictos,
+        }
+
+
+class DocumentoMemoria:
+    """Equivalente a DocumentSnapshot."""
+
+    def __init__(self, referencia, datos, update_time=None):
+        self.reference = referencia
+        self.id = referencia.id
+        self._datos = datos
+        self.update_time = update_time
+
+    @property
+    def exists(self):
+        return self._datos is not None
+
+    def to_dict(self):
+        if self._datos is None:
+            return None
+        return _copiar(self._datos)
+
+    def get(self, campo):
+        if self._datos is None:
+            return None
+        return self._datos.get(campo)
+
+
+def _aplicar_valor(destino, partes, valor):
+    """Aplica un valor (o un Increment / DELETE_FIELD) sobre la ruta `partes`."""
+    for p in partes[:-1]:
+        destino = destino.setdefault(p, {})
+    clave = partes[-1]
+
+    if type(valor).__name__ == "Increment":
+        destino[clave] = (destino.get(clave) or 0) + valor.value
+    elif type(valor).__name__ == "Sentinel" and "DELETE" in repr(valor):
+        destino.pop(clave, None)
+    else:
+        destino[clave] = copy.deepcopy(valor)
+
+
+def _fusionar(destino, datos):
+    for clave, valor in datos.items():
+        if isinstance(valor, dict):
+            if not isinstance(destino.get(clave), dict):
+                destino[clave] = {}
+            _fusionar(destino[clave], valor)
+        else:
+            _aplicar_valor(destino, [clave], valor)
+
+
+class ReferenciaDocumento:
+    def __init__(self, cliente, coleccion, id_doc):
+        self._cliente = cliente
+        self._coleccion = coleccion
+        self.id = id_doc
+
+    @property
+    def path(self):
+        return f"{self._coleccion}/{self.id}"
+
+    def _tabla(self):
+        return self._cliente._datos.setdefault(self._coleccion, {})
+
+    def get(self, transaction=None):
+        self._cliente._viaje()
+        with self._cliente._lock:
+            datos = self._tabla().get(self.id)
+            datos = _copiar(datos)
+        self._cliente.contadores.lecturas += 1
+        return DocumentoMemoria(self, datos)
+
+    def _set(self, datos, merge=False):
+        with self._cliente._lock:
+            tabla = self._tabla()
+            existia = self.id in tabla
+            if merge and existia:
+                _fusionar(tabla[self.id], datos)
+            else:
+                nuevo = {}
+                _fusionar(nuevo, datos)
+                tabla[self.id] = nuevo
+            self._cliente._avisar(self._coleccion, self.id, MODIFIED if existia else ADDED)
+        self._cliente.contadores.escrituras += 1
+
+    def _update(self, datos):
+        with self._cliente._lock:
+            tabla = self._tabla()
+            if self.id not in tabla:
+                raise KeyError(f"No existe el documento {self.path}")
+            for ruta, valor in datos.items():
+                _aplicar_valor(tabla[self.id], ruta.split("."), valor)
+            self._cliente._avisar(self._coleccion, self.id, MODIFIED)
+        self._cliente.contadores.escrituras += 1
+
+    def _delete(self):
+        with self._cliente._lock:
+            anterior = self._tabla().pop(self.id, None)
+            if anterior is not None:
+                self._cliente._avisar(self._coleccion, self.id, REMOVED, anterior)
+        self._cliente.contadores.escrituras += 1
+
+    def set(self, datos, merge=False):
+        self._cliente._viaje()
+        self._set(datos, merge=merge)
+
+    def update(self, datos):
+        self._cliente._viaje()
+        self._update(datos)
+
+    def delete(self):
+        self._cliente._viaje()
+        self._delete()
+
+
+class ConsultaMemoria:
+    def __init__(self, cliente, coleccion, filtros=(), orden=(), limite=None,
+                 despues_de=None):
+        self._cliente = cliente
+        self._coleccion = coleccion
+        self._filtros = tuple(filtros)
+        self._orden = tuple(orden)
+        self._limite = limite
+        self._despues_de = despues_de
+
+    def _copia(self, **cambios):
+        datos = dict(
+            filtros=self._filtros,
+            orden=self._orden,
+            limite=self._limite,
+            despues_de=self._despues_de,
+        )
+        datos.update(cambios)
+        return ConsultaMemoria(self._cliente, self._coleccion, **datos)
+
+    def where(self, campo, op, valor):
+        return self._copia(filtros=self._filtros + ((campo, op, valor),))
+
+    def order_by(self, campo, direction=ASCENDING):
+        return self._copia(orden=self._orden + ((campo, direction),))
+
+    def limit(self, n):
+        return self._copia(limite=n)
+
+    def start_after(self, valores):
+        if isinstance(valores, DocumentoMemoria):
+            valores = valores.to_dict()
+        return self._copia(despues_de=valores)
+
+    def _cumple(self, datos):
+        for campo, op, valor in self._filtros:
+            if campo not in datos:
+                return False
+            actual = datos[campo]
+            if op == "==" and not actual == valor:
+                return False
+            if op == "!=" and not actual != valor:
+                return False
+            if op == "<" and not actual < valor:
+                return False
+            if op == "<=" and not actual <= valor:
+                return False
+            if op == ">" and not actual > valor:
+                return False
+            if op == ">=" and not actual >= valor:
+                return False
+            if op == "in" and actual not in valor:
+                return False
+        return True
+
+    def _resultados(self):
+        with self._cliente._lock:
+            tabla = self._cliente._datos.get(self._coleccion, {})
+            filas = [
+                (id_doc, datos)
+                for id_doc, datos in tabla.items()
+                if self._cumple(datos)
+                and all(c in datos for c, _ in self._orden)
+            ]
+            filas = self._ordenar_y_cortar(filas)
+            # Solo se copia lo que devuelve la consulta
+            return [(id_doc, _copiar(datos)) for id_doc, datos in filas]
+
+    def _ordenar_y_cortar(self, filas):
+        campos = [c for c, _ in self._orden]
+        direcciones = {d for _, d in self._orden}
+
+        if self._despues_de is not None and len(direcciones) == 1:
+            cursor = tuple(self._despues_de.get(c) for c in campos)
+            if DESCENDING in direcciones:
+                filas = [f for f in filas if tuple(f[1][c] for c in campos) < cursor]
+            else:
+                filas = [f for f in filas if tuple(f[1][c] for c in campos) > cursor]
+        elif self._despues_de is not None:
+            cursor = tuple(self._despues_de.get(c) for c in campos)
+            restantes = []
+            for fila in filas:
+                clave = tuple(fila[1][c] for c in campos)
+                posterior = False
+                for (campo, direccion), a, b in zip(self._orden, clave, cursor):
+                    if a == b:
+                        continue
+                    posterior = a < b if direccion == DESCENDING else a > b
+                    break
+                if posterior:
+                    restantes.append(fila)
+            filas = restantes
+
+        if self._limite is not None and len(direcciones) <= 1:
+            # Con una sola dirección basta con los `limite` primeros
+            clave = lambda f: tuple(f[1][c] for c in campos) + (f[0],)  # noqa: E731
+            if DESCENDING in direcciones:
+                return heapq.nlargest(self._limite, filas, key=clave)
+            return heapq.nsmallest(self._limite, filas, key=clave)
+
+        # Orden estable de derecha a izquierda para respetar ASC/DESC por campo
+        filas.sort(key=lambda f: f[0])
+        for campo, direccion in reversed(self._orden):
+            filas.sort(key=lambda f: f[1][campo], reverse=direccion == DESCENDING)
+
+        if self._limite is not None:
+            filas = filas[: self._limite]
+        return filas
+
+    def stream(self, transaction=None):
+        self._cliente._viaje()
+        resultados = self._resultados()
+        if not resultados:
+            # Firestore cobra una lectura por consulta aunque no devuelva nada
+            self._cliente.contadores.lecturas += 1
+        for id_doc, datos in resultados:
+            self._cliente.contadores.lecturas += 1
+            ref = ReferenciaDocumento(self._cliente, self._coleccion, id_doc)
+            yield DocumentoMemoria(ref, datos)
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+    def sum(self, campo, alias=None):
+        return ConsultaAgregacion(self).sum(campo, alias)
+
+    def count(self, alias=None):
+        return ConsultaAgregacion(self).count(alias)
+
+
+class ResultadoAgregacion:
+    """Equivalente a AggregationResult."""
+
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class ConsultaAgregacion:
+    """
+    Equivalente a AggregationQuery (sum / count). Se cobra como Firestore:
+    una lectura por cada 1000 entradas de índice recorridas (mínimo una).
+    """
+
+    def __init__(self, consulta):
+        self._consulta = consulta
+        self._agregaciones = []
+
+    def sum(self, campo, alias=None):
+        self._agregaciones.append(("sum", campo, alias or f"field_{len(self._agregaciones) + 1}"))
+        return self
+
+    def count(self, alias=None):
+        self._agregaciones.append(("count", None, alias or f"field_{len(self._agregaciones) + 1}"))
+        return self
+
+    def get(self, transaction=None):
+        cliente = self._consulta._cliente
+        cliente._viaje()
+        filas = self._consulta._resultados()
+        cliente.contadores.lecturas += max(1, -(-len(filas) // 1000))
+
+        resultados = []
+        for tipo, campo, alias in self._agregaciones:
+            if tipo == "count":
+                valor = len(filas)
+            else:
+                valor = sum(
+                    datos[campo] for _, datos in filas
+                    if isinstance(datos.get(campo), (int, float))
+                )
+            resultados.append(ResultadoAgregacion(alias, valor))
+        return [resultados]
+
+
+class ColeccionMemoria(ConsultaMemoria):
+    def __init__(self, cliente, nombre):
+        super().__init__(cliente, nombre)
+        self.id = nombre
+
+    def document(self, id_doc=None):
+        return ReferenciaDocumento(self._cliente, self._coleccion, id_doc or _nuevo_id())
+
+    def on_snapshot(self, callback):
+        return EscuchaMemoria(self._cliente, self._coleccion, callback)
+
+    def add(self, datos):
+        ref = self.document()
+        ref.set(datos)
+        return None, ref
+
+
+class TipoCambio:
+    """Equivalente a ChangeType (solo se usa .name)."""
+
+    def __init__(self, name):
+        self.name = name
+
+
+ADDED = TipoCambio("ADDED")
+MODIFIED = TipoCambio("MODIFIED")
+REMOVED = TipoCambio("REMOVED")
+
+
+class CambioDocumento:
+    """Equivalente a DocumentChange."""
+
+    def __init__(self, tipo, documento):
+        self.type = tipo
+        self.document = documento
+
+
+class _Documentos:
+    """La colección completa de un aviso; los DocumentSnapshot se arman al recorrerla."""
+
+    def __init__(self, cliente, coleccion, vista):
+        self._cliente = cliente
+        self._coleccion = coleccion
+        self._vista = vista
+
+    def __len__(self):
+        return len(self._vista)
+
+    def __iter__(self):
+        # Como en stream(): en orden de id de documento
+        for id_doc, (datos, momento) in sorted(self._vista.items(), key=lambda par: par[0]):
+            ref = ReferenciaDocumento(self._cliente, self._coleccion, id_doc)
+            yield DocumentoMemoria(ref, datos, momento)
+
+
+class EscuchaMemoria:
+    """
+    Equivalente a Watch: llama a callback(docs, cambios, read_time) desde un
+    hilo propio, primero con toda la colección (todo ADDED) y después con
+    lo que haya cambiado desde el aviso anterior. Como en Firestore, cada
+    documento entregado cuenta como una lectura.
+    """
+
+    def __init__(self, cliente, coleccion, callback):
+        self._cliente = cliente
+        self._coleccion = coleccion
+        self._callback = callback
+        self._cola = queue.Queue()
+        self._vista = {}  # id_doc -> datos, lo que ya se entregó
+        with cliente._lock:
+            tabla = cliente._datos.get(coleccion, {})
+            self._cola.put([
+                (ADDED, id_doc, _copiar(datos), cliente._tiempos.get((coleccion, id_doc)))
+                for id_doc, datos in tabla.items()
+            ])
+            cliente._escuchas.setdefault(coleccion, []).append(self)
+        self._hilo = threading.Thread(target=self._correr, daemon=True)
+        self._hilo.start()
+
+    def _correr(self):
+        while True:
+            lote = self._cola.get()
+            if lote is None:
+                return
+            # Lo que ya esté en cola sale en el mismo aviso
+            while True:
+                try:
+                    siguiente = self._cola.get_nowait()
+                except queue.Empty:
+                    break
+                if siguiente is None:
+                    return
+                lote += siguiente
+            self._entregar(lote)
+
+    def _entregar(self, lote):
+        cambios = []
+        for tipo, id_doc, datos, momento in lote:
+            ref = ReferenciaDocumento(self._cliente, self._coleccion, id_doc)
+            if tipo is REMOVED:
+                self._vista.pop(id_doc, None)
+            else:
+                self._vista[id_doc] = (datos, momento)
+            cambios.append(CambioDocumento(tipo, DocumentoMemoria(ref, datos, momento)))
+        self._cliente.contadores.lecturas += max(1, len(cambios))
+
+        docs = _Documentos(self._cliente, self._coleccion, dict(self._vista))
+        try:
+            self._callback(docs, cambios, datetime.now(timezone.utc))
+        except Exception as e:  # como en Firestore, un error no detiene la escucha
+            print("Error en on_snapshot:", e)
+
+    def unsubscribe(self):
+        with self._cliente._lock:
+            escuchas = self._cliente._escuchas.get(self._coleccion, [])
+            if self in escuchas:
+                escuchas.remove(self)
+        self._cola.put(None)
+
+
+class LoteMemoria:
+    """Equivalente a WriteBatch: acumula escrituras y las aplica en un commit."""
+
+    def __init__(self, cliente):
+        self._cliente = cliente
+        self._operaciones = []
+
+    def __len__(self):
+        return len(self._operaciones)
+
+    def set(self, ref, datos, merge=False):
+        self._operaciones.append(lambda: ref._set(datos, merge=merge))
+
+    def update(self, ref, datos):
+        self._operaciones.append(lambda: ref._update(datos))
+
+    def delete(self, ref):
+        self._operaciones.append(ref._delete)
+
+    def commit(self):
+        self._cliente._viaje()
+        with self._cliente._lock:
+            for operacion in self._operaciones:
+                operacion()
+        self._operaciones = []
+
+
+class TransaccionMemoria(LoteMemoria):
+    """Equivalente a Transaction: lecturas directas, escrituras al commit."""
+
+
+def transactional(funcion):
+    """
+    Equivalente a firestore.transactional. Las transacciones se serializan
+    con un candado por cliente; si otra está en curso se cuenta un conflicto
+    (en Firestore sería un reintento por contención).
+    """
+    def envoltura(transaccion, *args, **kwargs):
+        cliente = transaccion._cliente
+        if not cliente._candado_tx.acquire(blocking=False):
+            cliente.contadores.conflictos += 1
+            cliente._candado_tx.acquire()
+        try:
+            cliente.contadores.transacciones += 1
+            resultado = funcion(transaccion, *args, **kwargs)
+            transaccion.commit()
+            return resultado
+        finally:
+            cliente._candado_tx.release()
+
+    return envoltura
+
+
+class ClienteMemoria:
+    """
+    Sustituto de firestore.client() que guarda todo en diccionarios.
+
+    latencia: segundos que se duerme en cada viaje de red simulado, para
+    que los benchmarks reflejen el costo de hacer muchas llamadas seguidas.
+    """
+
+    def __init__(self, latencia=0.0):
+        self._datos = {}
+        self._tiempos = {}  # (colección, id) -> última escritura
+        self._escuchas = {}  # colección -> [EscuchaMemoria]
+        self._lock = threading.RLock()
+        self._candado_tx = threading.Lock()
+        self.latencia = latencia
+        self.contadores = Contadores()
+
+    def _viaje(self):
+        self.contadores.viajes += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def collection(self, nombre):
+        return ColeccionMemoria(self, nombre)
+
+    def _avisar(self, coleccion, id_doc, tipo, datos=None):
+        """Anota la hora de la escritura y se la pasa a las escuchas (con el candado tomado)."""
+        momento = datetime.now(timezone.utc)
+        self._tiempos[(coleccion, id_doc)] = momento
+        escuchas = self._escuchas.get(coleccion)
+        if not escuchas:
+            return
+        if datos is None:
+            datos = self._datos[coleccion][id_doc]
+        for escucha in escuchas:
+            escucha._cola.put([(tipo, id_doc, _copiar(datos), momento)])
+
+    def get_all(self, referencias, transaction=None):
+        """Lee varios documentos en un solo viaje."""
+        referencias = list(referencias)
+        self._viaje()
+        for ref in referencias:
+            with self._lock:
+                datos = _copiar(ref._tabla().get(ref.id))
+            self.contadores.lecturas += 1
+            yield DocumentoMemoria(ref, datos)
+
+    def batch(self):
+        return LoteMemoria(self)
+
+    def transaction(self):
+        return TransaccionMemoria(self)
+
+    def cargar(self, coleccion, documentos):
+        """Carga masiva sin contar escrituras (para preparar benchmarks)."""
+        with self._lock:
+            tabla = self._datos.setdefault(coleccion, {})
+            for doc in documentos:
+                id_doc = _nuevo_id()
+                tabla[id_doc] = _copiar(doc)
+                if self._escuchas.get(coleccion):
+                    self._avisar(coleccion, id_doc, ADDED)
+
+    def vaciar(self):
+        """Borra todas las colecciones."""
+        with self._lock:
+            self._datos.clear()
+            self._tiempos.clear()
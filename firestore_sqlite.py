@@ -0,0 +1,513 @@
+"""
+Cliente de Firestore sobre SQLite, compatible con la misma parte de la API
+que firestore_memoria (collection / document / where / order_by / limit /
+start_after / stream / get / set / update / add / delete, sum / count,
+get_all, batch y transaction). No tiene on_snapshot: con FINANZAS_DB=sqlite
+la escucha en vivo (FINANZAS_LIBRO_LOCAL=vivo) no está disponible.
+
+Cada colección es una tabla (id, datos en JSON). Los campos por los que se
+filtra y ordena son columnas generadas con índices, así las consultas de
+la app se resuelven con el índice como en Firestore:
+
+    transacciones: (fecha, id_transaccion), (cuenta, id_transaccion),
+                   (tipo, fecha), (id_transaccion), (actualizado_en)
+
+Además de la API de Firestore tiene agrupar(), que hace un GROUP BY en
+SQL (lo usan los reportes en vez de una agregación por categoría).
+
+Las transacciones (transactional) son transacciones de SQLite abiertas con
+BEGIN IMMEDIATE: el cuerpo lee dentro de ellas con el candado de escritura
+del archivo ya tomado, así dos procesos (p. ej. dos workers de gunicorn)
+sobre el mismo archivo no leen el mismo contador o saldo a la vez.
+
+Sirve para correr la app sin credenciales y comparar contra Firestore con
+los mismos datos (FINANZAS_DB=sqlite, FINANZAS_SQLITE=ruta del archivo).
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+from firestore_memoria import (
+    ASCENDING,
+    DESCENDING,
+    Contadores,
+    DocumentoMemoria,
+    LoteMemoria,
+    ResultadoAgregacion,
+    _aplicar_valor,
+    _fusionar,
+    _nuevo_id,
+)
+
+__all__ = ["ClienteSQLite", "transactional", "ASCENDING", "DESCENDING"]
+
+
+# Columnas generadas e índices por colección; los demás campos se leen
+# del JSON con json_extract (sin índice)
+COLUMNAS = {
+    "transacciones": ("fecha", "id_transaccion", "cuenta", "tipo", "categoria", "actualizado_en"),
+    "cuentas": ("nombre",),
+    "saldos_diarios": ("fecha",),
+    "resumen_dias": ("fecha",),
+    "resumen_meses": ("mes",),
+}
+INDICES = {
+    "transacciones": (
+        ("fecha", "id_transaccion"),
+        ("cuenta", "id_transaccion"),
+        ("tipo", "fecha"),
+        ("id_transaccion",),
+        ("actualizado_en",),
+    ),
+    "cuentas": (("nombre",),),
+    "saldos_diarios": (("fecha",),),
+    "resumen_dias": (("fecha",),),
+    "resumen_meses": (("mes",),),
+}
+
+_OPERADORES = {"==": "=", "!=": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+
+
+def _tabla_sql(coleccion):
+    return '"' + coleccion.replace('"', '""') + '"'
+
+
+def _campo_sql(coleccion, campo):
+    """La columna generada del campo o, si no la tiene, su json_extract."""
+    if campo in COLUMNAS.get(coleccion, ()):
+        return '"' + campo + '"'
+    return "json_extract(datos, '$.\"" + campo.replace("'", "''").replace('"', '') + "\"')"
+
+
+def _valor_sql(valor):
+    """Los mapas y listas se comparan como su JSON; lo demás tal cual."""
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor, ensure_ascii=False, separators=(",", ":"))
+    return valor
+
+
+class ReferenciaSQLite:
+    def __init__(self, cliente, coleccion, id_doc):
+        self._cliente = cliente
+        self._coleccion = coleccion
+        self.id = id_doc
+
+    @property
+    def path(self):
+        return f"{self._coleccion}/{self.id}"
+
+    def _leer(self):
+        fila = self._cliente._uno(
+            f"SELECT datos FROM {self._cliente._tabla(self._coleccion)} WHERE id = ?", (self.id,)
+        )
+        return json.loads(fila[0]) if fila else None
+
+    def _guardar(self, datos):
+        self._cliente._ejecutar(
+            f"INSERT OR REPLACE INTO {self._cliente._tabla(self._coleccion)} (id, datos) VALUES (?, ?)",
+            (self.id, json.dumps(datos, ensure_ascii=False)),
+        )
+        self._cliente.contadores.escrituras += 1
+
+    def get(self, transaction=None):
+        self._cliente._viaje()
+        with self._cliente._lock:
+            datos = self._leer()
+        self._cliente.contadores.lecturas += 1
+        return DocumentoMemoria(self, datos)
+
+    def _set(self, datos, merge=False):
+        with self._cliente._lock:
+            actual = self._leer() if merge else None
+            nuevo = actual if actual is not None else {}
+            _fusionar(nuevo, datos)
+            self._guardar(nuevo)
+
+    def _update(self, datos):
+        with self._cliente._lock:
+            actual = self._leer()
+            if actual is None:
+                raise KeyError(f"No existe el documento {self.path}")
+            for ruta, valor in datos.items():
+                _aplicar_valor(actual, ruta.split("."), valor)
+            self._guardar(actual)
+
+    def _delete(self):
+        with self._cliente._lock:
+            self._cliente._ejecutar(
+                f"DELETE FROM {self._cliente._tabla(self._coleccion)} WHERE id = ?", (self.id,)
+            )
+        self._cliente.contadores.escrituras += 1
+
+    def set(self, datos, merge=False):
+        self._cliente._viaje()
+        with self._cliente._lock, self._cliente._conexion:
+            self._set(datos, merge=merge)
+
+    def update(self, datos):
+        self._cliente._viaje()
+        with self._cliente._lock, self._cliente._conexion:
+            self._update(datos)
+
+    def delete(self):
+        self._cliente._viaje()
+        with self._cliente._lock, self._cliente._conexion:
+            self._delete()
+
+
+class ConsultaSQLite:
+    def __init__(self, cliente, coleccion, filtros=(), orden=(), limite=None, despues_de=None):
+        self._cliente = cliente
+        self._coleccion = coleccion
+        self._filtros = tuple(filtros)
+        self._orden = tuple(orden)
+        self._limite = limite
+        self._despues_de = despues_de
+
+    def _copia(self, **cambios):
+        datos = dict(
+            filtros=self._filtros,
+            orden=self._orden,
+            limite=self._limite,
+            despues_de=self._despues_de,
+        )
+        datos.update(cambios)
+        return ConsultaSQLite(self._cliente, self._coleccion, **datos)
+
+    def where(self, campo, op, valor):
+        if op != "in" and op not in _OPERADORES:
+            raise ValueError(f"Operador no soportado: {op}")
+        return self._copia(filtros=self._filtros + ((campo, op, valor),))
+
+    def order_by(self, campo, direction=ASCENDING):
+        return self._copia(orden=self._orden + ((campo, direction),))
+
+    def limit(self, n):
+        return self._copia(limite=n)
+
+    def start_after(self, valores):
+        if isinstance(valores, DocumentoMemoria):
+            valores = valores.to_dict()
+        return self._copia(despues_de=valores)
+
+    def _condiciones(self):
+        """WHERE (texto, parámetros): filtros, campos de orden presentes y cursor."""
+        partes, parametros = [], []
+        for campo, op, valor in self._filtros:
+            columna = _campo_sql(self._coleccion, campo)
+            if op == "in":
+                valores = list(valor)
+                if not valores:
+                    partes.append("0")
+                    continue
+                partes.append(f"{columna} IN ({', '.join('?' * len(valores))})")
+                parametros += [_valor_sql(v) for v in valores]
+            else:
+                partes.append(f"{columna} {_OPERADORES[op]} ?")
+                parametros.append(_valor_sql(valor))
+
+        # Como en Firestore, no aparecen los documentos sin los campos de orden
+        for campo, _ in self._orden:
+            partes.append(f"{_campo_sql(self._coleccion, campo)} IS NOT NULL")
+
+        if self._despues_de is not None and self._orden:
+            # (a, b) después de (x, y): a > x  OR  (a = x AND b > y), según la dirección
+            alternativas = []
+            for i, (campo, direccion) in enumerate(self._orden):
+                iguales = [
+                    f"{_campo_sql(self._coleccion, c)} = ?" for c, _ in self._orden[:i]
+                ]
+                signo = "<" if direccion == DESCENDING else ">"
+                condicion = iguales + [f"{_campo_sql(self._coleccion, campo)} {signo} ?"]
+                alternativas.append("(" + " AND ".join(condicion) + ")")
+                parametros += [_valor_sql(self._despues_de.get(c)) for c, _ in self._orden[: i + 1]]
+            partes.append("(" + " OR ".join(alternativas) + ")")
+
+        return (" WHERE " + " AND ".join(partes)) if partes else "", parametros
+
+    def _sql(self, columnas="id, datos"):
+        donde, parametros = self._condiciones()
+        sql = f"SELECT {columnas} FROM {self._cliente._tabla(self._coleccion)}{donde}"
+        if self._orden:
+            orden = [
+                f"{_campo_sql(self._coleccion, c)} {'DESC' if d == DESCENDING else 'ASC'}"
+                for c, d in self._orden
+            ]
+            # Desempate por id de documento, en la dirección del último campo
+            orden.append(f"id {'DESC' if self._orden[-1][1] == DESCENDING else 'ASC'}")
+            sql += " ORDER BY " + ", ".join(orden)
+        else:
+            sql += " ORDER BY id"
+        if self._limite is not None:
+            sql += f" LIMIT {int(self._limite)}"
+        return sql, parametros
+
+    def stream(self, transaction=None):
+        self._cliente._viaje()
+        sql, parametros = self._sql()
+        with self._cliente._lock:
+            filas = self._cliente._todos(sql, parametros)
+        if not filas:
+            # Firestore cobra una lectura por consulta aunque no devuelva nada
+            self._cliente.contadores.lecturas += 1
+        for id_doc, datos in filas:
+            self._cliente.contadores.lecturas += 1
+            ref = ReferenciaSQLite(self._cliente, self._coleccion, id_doc)
+            yield DocumentoMemoria(ref, json.loads(datos))
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+    def sum(self, campo, alias=None):
+        return AgregacionSQLite(self).sum(campo, alias)
+
+    def count(self, alias=None):
+        return AgregacionSQLite(self).count(alias)
+
+
+class AgregacionSQLite:
+    """sum / count en SQL; se cobra como Firestore (una lectura por cada 1000 filas)."""
+
+    def __init__(self, consulta):
+        self._consulta = consulta
+        self._agregaciones = []
+
+    def sum(self, campo, alias=None):
+        self._agregaciones.append(("sum", campo, alias or f"field_{len(self._agregaciones) + 1}"))
+        return self
+
+    def count(self, alias=None):
+        self._agregaciones.append(("count", None, alias or f"field_{len(self._agregaciones) + 1}"))
+        return self
+
+    def get(self, transaction=None):
+        consulta = self._consulta
+        cliente = consulta._cliente
+        cliente._viaje()
+        if consulta._limite is None:
+            donde, parametros = consulta._condiciones()
+            origen = f"{cliente._tabla(consulta._coleccion)}{donde}"
+            coleccion = consulta._coleccion
+        else:
+            # Con límite se agrega sobre la consulta ya cortada
+            interna, parametros = consulta._sql()
+            origen = f"({interna})"
+            coleccion = None  # la subconsulta solo tiene id y datos
+        columnas = ["COUNT(*)"] + [
+            f"TOTAL({_campo_sql(coleccion, campo)})" if tipo == "sum" else "COUNT(*)"
+            for tipo, campo, _ in self._agregaciones
+        ]
+        sql = f"SELECT {', '.join(columnas)} FROM {origen}"
+        with cliente._lock:
+            fila = cliente._uno(sql, parametros)
+        cliente.contadores.lecturas += max(1, -(-fila[0] // 1000))
+        return [[
+            ResultadoAgregacion(alias, fila[i + 1])
+            for i, (_, _, alias) in enumerate(self._agregaciones)
+        ]]
+
+
+class ColeccionSQLite(ConsultaSQLite):
+    def __init__(self, cliente, nombre):
+        super().__init__(cliente, nombre)
+        self.id = nombre
+
+    def document(self, id_doc=None):
+        return ReferenciaSQLite(self._cliente, self._coleccion, id_doc or _nuevo_id())
+
+    def on_snapshot(self, callback):
+        raise NotImplementedError("La base SQLite no tiene escuchas (on_snapshot)")
+
+    def add(self, datos):
+        ref = self.document()
+        ref.set(datos)
+        return None, ref
+
+
+class LoteSQLite(LoteMemoria):
+    """WriteBatch: las escrituras se aplican en una sola transacción de SQLite."""
+
+    def commit(self):
+        self._cliente._viaje()
+        with self._cliente._lock, self._cliente._conexion:
+            for operacion in self._operaciones:
+                operacion()
+        self._operaciones = []
+
+
+class TransaccionSQLite(LoteSQLite):
+    """
+    Equivalente a Transaction: las lecturas van directo a la conexión (dentro
+    de la transacción de SQLite que abrió transactional) y las escrituras se
+    guardan hasta aplicar().
+    """
+
+    def aplicar(self):
+        """Aplica las escrituras sin confirmar: el COMMIT lo hace transactional."""
+        self._cliente._viaje()
+        for operacion in self._operaciones:
+            operacion()
+        self._operaciones = []
+
+
+def transactional(funcion):
+    """
+    Equivalente a firestore.transactional. El cuerpo corre dentro de una
+    transacción BEGIN IMMEDIATE: otro proceso sobre el mismo archivo espera
+    a que termine (hasta el timeout de la conexión) en vez de leer los
+    mismos documentos. Dentro del proceso se serializa con el candado de la
+    conexión; si otra está en curso se cuenta un conflicto. Si el cuerpo
+    falla se hace ROLLBACK y no se aplica nada.
+    """
+    def envoltura(transaccion, *args, **kwargs):
+        cliente = transaccion._cliente
+        if not cliente._lock.acquire(blocking=False):
+            cliente.contadores.conflictos += 1
+            cliente._lock.acquire()
+        try:
+            cliente.contadores.transacciones += 1
+            cliente._ejecutar("BEGIN IMMEDIATE")
+            try:
+                resultado = funcion(transaccion, *args, **kwargs)
+                transaccion.aplicar()
+            except BaseException:
+                cliente._ejecutar("ROLLBACK")
+                raise
+            cliente._ejecutar("COMMIT")
+            return resultado
+        finally:
+            cliente._lock.release()
+
+    return envoltura
+
+
+class ClienteSQLite:
+    """
+    Sustituto de firestore.client() sobre un archivo SQLite (o ":memory:").
+
+    latencia: segundos que se duerme en cada viaje de red simulado, como en
+    ClienteMemoria.
+    """
+
+    def __init__(self, ruta=":memory:", latencia=0.0):
+        # Un solo objeto de conexión para todos los hilos, protegido por _lock;
+        # `with self._conexion` confirma (o deshace) cada escritura. El timeout
+        # es lo que espera si otro proceso tiene el archivo bloqueado
+        self._conexion = sqlite3.connect(ruta, timeout=30, check_same_thread=False)
+        if ruta != ":memory:":
+            self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.RLock()
+        self._tablas = set()
+        self.latencia = latencia
+        self.contadores = Contadores()
+
+    def _viaje(self):
+        self.contadores.viajes += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def _tabla(self, coleccion):
+        """Nombre SQL de la tabla de la colección, creándola (con sus índices) la primera vez."""
+        if coleccion not in self._tablas:
+            with self._lock:
+                tabla = _tabla_sql(coleccion)
+                columnas = "".join(
+                    f", \"{c}\" GENERATED ALWAYS AS (json_extract(datos, '$.{c}')) VIRTUAL"
+                    for c in COLUMNAS.get(coleccion, ())
+                )
+                self._conexion.execute(
+                    # WITHOUT ROWID: los índices terminan en el id del documento, así
+                    # también sirven para el desempate por id de ORDER BY
+                    f"CREATE TABLE IF NOT EXISTS {tabla} "
+                    f"(id TEXT PRIMARY KEY, datos TEXT NOT NULL{columnas}) WITHOUT ROWID"
+                )
+                for campos in INDICES.get(coleccion, ()):
+                    nombre = _tabla_sql(f"{coleccion}_{'_'.join(campos)}")
+                    lista = ", ".join(f'"{c}"' for c in campos)
+                    self._conexion.execute(f"CREATE INDEX IF NOT EXISTS {nombre} ON {tabla} ({lista})")
+                self._tablas.add(coleccion)
+        return _tabla_sql(coleccion)
+
+    def _ejecutar(self, sql, parametros=()):
+        return self._conexion.execute(sql, parametros)
+
+    def _uno(self, sql, parametros=()):
+        return self._conexion.execute(sql, parametros).fetchone()
+
+    def _todos(self, sql, parametros=()):
+        return self._conexion.execute(sql, parametros).fetchall()
+
+    def collection(self, nombre):
+        return ColeccionSQLite(self, nombre)
+
+    def get_all(self, referencias, transaction=None):
+        """Lee varios documentos en un solo viaje (una consulta IN por colección)."""
+        referencias = list(referencias)
+        self._viaje()
+        por_coleccion = {}
+        for ref in referencias:
+            por_coleccion.setdefault(ref._coleccion, set()).add(ref.id)
+        leidos = {}
+        with self._lock:
+            for coleccion, ids in por_coleccion.items():
+                ids = list(ids)
+                for i in range(0, len(ids), 500):
+                    parte = ids[i:i + 500]
+                    for id_doc, datos in self._todos(
+                        f"SELECT id, datos FROM {self._tabla(coleccion)} "
+                        f"WHERE id IN ({', '.join('?' * len(parte))})",
+                        parte,
+                    ):
+                        leidos[(coleccion, id_doc)] = datos
+        for ref in referencias:
+            self.contadores.lecturas += 1
+            datos = leidos.get((ref._coleccion, ref.id))
+            yield DocumentoMemoria(ref, json.loads(datos) if datos is not None else None)
+
+    def agrupar(self, coleccion, por, sumar, filtros=(), absoluto=False):
+        """
+        GROUP BY en SQL: [(valores de `por`..., suma de `sumar`, cantidad)]
+        de los documentos que cumplen `filtros` ((campo, op, valor), como
+        en where). Con absoluto=True suma el valor absoluto de cada fila.
+        Se cobra una lectura por cada 1000 filas agrupadas.
+        """
+        consulta = ConsultaSQLite(self, coleccion, filtros)
+        self._viaje()
+        donde, parametros = consulta._condiciones()
+        columnas = [_campo_sql(coleccion, c) for c in por]
+        suma = _campo_sql(coleccion, sumar)
+        if absoluto:
+            suma = f"ABS({suma})"
+        sql = (
+            f"SELECT {', '.join(columnas)}, TOTAL({suma}), COUNT(*) "
+            f"FROM {self._tabla(coleccion)}{donde} GROUP BY {', '.join(columnas)}"
+        )
+        with self._lock:
+            filas = self._todos(sql, parametros)
+        self.contadores.lecturas += max(1, -(-sum(f[-1] for f in filas) // 1000))
+        return [tuple(f) for f in filas]
+
+    def batch(self):
+        return LoteSQLite(self)
+
+    def transaction(self):
+        return TransaccionSQLite(self)
+
+    def cargar(self, coleccion, documentos):
+        """Carga masiva sin contar escrituras (para preparar benchmarks)."""
+        tabla = self._tabla(coleccion)
+        with self._lock, self._conexion:
+            self._conexion.executemany(
+                f"INSERT INTO {tabla} (id, datos) VALUES (?, ?)",
+                ((_nuevo_id(), json.dumps(doc, ensure_ascii=False)) for doc in documentos),
+            )
+
+    def vaciar(self):
+        """Borra todas las colecciones."""
+        with self._lock, self._conexion:
+            for (nombre,) in self._todos("SELECT name FROM sqlite_master WHERE type = 'table'"):
+                self._conexion.execute(f"DROP TABLE {_tabla_sql(nombre)}")
+            self._tablas.clear()
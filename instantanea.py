@@ -0,0 +1,469 @@
+"""
+Instantánea columnar de `transacciones` para los reportes (opcional).
+
+Cada campo se guarda como una columna binaria en un directorio
+(FINANZAS_INSTANTANEA, p. ej. ".instantanea"): fecha como días desde
+1970-01-01, valor y saldos como float64, y tipo / categoría / cuenta como
+códigos de diccionario. Al arrancar se abren con memory-map, y para ponerse
+al día se usa leer_cambios() de la app: cada transacción nueva o editada se
+busca por id_transaccion y se reescribe en su fila o, si no tiene, se agrega
+al final de los archivos; las que quedan sin fecha, como no vigentes. Los ids no
+llegan en orden (cada worker tiene su bloque), así que las filas tampoco lo
+están: las consultas ordenan por (fecha, id).
+
+Con ella filtrar_y_resumir(), los totales por categoría y el resumen
+mensual se calculan con operaciones vectorizadas de numpy, sin leer
+Firestore. Si numpy no está instalado DISPONIBLE es False y la app sigue
+como antes.
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import date
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: un solo proceso, sin candado de archivo
+    fcntl = None
+
+
+DISPONIBLE = np is not None
+
+VERSION = 3
+EPOCA = date(1970, 1, 1).toordinal()
+
+# Columnas de ancho fijo: nombre -> dtype (little endian)
+COLUMNAS = {
+    "id": "<i8",
+    "fecha": "<i4",
+    "valor": "<f8",
+    "saldo_inicial": "<f8",
+    "saldo_final": "<f8",
+    "tipo": "<i2",
+    "categoria": "<i2",
+    "cuenta": "<i2",
+    "descripcion_inicio": "<i8",  # dónde empieza cada descripción en descripcion.bin
+    "descripcion_fin": "<i8",
+    "vigente": "u1",  # 0 = ya no vigente (editada sin fecha válida)
+}
+DICCIONARIOS = ("tipo", "categoria", "cuenta")
+
+# Documentos que se procesan por vez al sincronizar
+BLOQUE_SINCRONIZACION = 10_000
+
+
+def _dia(fecha_iso):
+    """'2024-05-01' → días desde 1970-01-01 (ValueError si no es una fecha)."""
+    return date.fromisoformat(fecha_iso).toordinal() - EPOCA
+
+
+def _tiene_fecha(data):
+    """Sin fecha válida una transacción no entra en ningún reporte."""
+    try:
+        _dia(data.get("fecha") or "")
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def _meta_vacia():
+    return {
+        "version": VERSION,
+        "filas": 0,
+        "bytes_descripcion": 0,
+        "marca": 0,
+        "diccionarios": {c: [] for c in DICCIONARIOS},
+    }
+
+
+@contextmanager
+def _candado_archivo(ruta):
+    """Candado entre procesos (varios workers de gunicorn comparten el directorio)."""
+    if fcntl is None:
+        yield
+        return
+    with open(ruta, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class InstantaneaColumnar:
+    """
+    Columnas de las transacciones abiertas con memory-map.
+
+    Los archivos solo crecen; meta.json dice cuántas filas son válidas,
+    así que un proceso que se cae a mitad de una escritura no deja la
+    instantánea corrupta (lo que sobre se pisa en la siguiente).
+    Una edición reescribe la fila en el lugar y agrega la descripción nueva
+    al final de descripcion.bin; reconstruir() recupera ese espacio.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+        self._lock = threading.Lock()
+        self._abrir()
+
+    # ----- archivos -----
+
+    def _ruta(self, nombre):
+        return os.path.join(self.directorio, nombre)
+
+    def _leer_meta(self):
+        try:
+            with open(self._ruta("meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            meta = None
+        if not meta or meta.get("version") != VERSION:
+            meta = _meta_vacia()
+        return meta
+
+    def _escribir_meta(self, meta):
+        temporal = self._ruta("meta.json.tmp")
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(temporal, self._ruta("meta.json"))
+
+    def _mapear(self, archivo, dtype, n):
+        if n == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self._ruta(archivo), dtype=dtype, mode="r", shape=(n,))
+
+    def _abrir(self):
+        meta = self._leer_meta()
+        columnas = {
+            nombre: self._mapear(f"{nombre}.bin", dtype, meta["filas"])
+            for nombre, dtype in COLUMNAS.items()
+        }
+        columnas["descripcion"] = self._mapear("descripcion.bin", "u1", meta["bytes_descripcion"])
+        # Se cambia de una sola vez: los lectores toman (meta, columnas) juntos
+        self._estado = (meta, columnas)
+
+    def _anexar(self, archivo, desde_byte, datos):
+        modo = "r+b" if os.path.exists(self._ruta(archivo)) else "wb"
+        with open(self._ruta(archivo), modo) as f:
+            f.seek(desde_byte)
+            f.truncate()
+            f.write(datos)
+
+    # ----- sincronización -----
+
+    @property
+    def filas(self):
+        return self._estado[0]["filas"]
+
+    def sincronizar(self, leer_cambios):
+        """Aplica leer_cambios(marca) (ver la app). Devuelve cuántas filas hay."""
+        with self._lock, _candado_archivo(self._ruta("candado")):
+            # Otro proceso pudo haber avanzado mientras tanto
+            meta = self._leer_meta()
+            self._aplicar(meta, leer_cambios)
+            self._escribir_meta(meta)
+            self._abrir()
+            return meta["filas"]
+
+    def reconstruir(self, leer_cambios):
+        """Borra la instantánea y la vuelve a cargar completa."""
+        with self._lock, _candado_archivo(self._ruta("candado")):
+            meta = _meta_vacia()
+            self._aplicar(meta, leer_cambios)
+            self._escribir_meta(meta)
+            self._abrir()
+            return meta["filas"]
+
+    def _aplicar(self, meta, leer_cambios):
+        cambiadas, marca = leer_cambios(meta["marca"])
+        if meta["marca"]:
+            if cambiadas:
+                self._actualizar(meta, cambiadas)
+        else:
+            # Carga inicial: todo va al final, por bloques
+            while True:
+                bloque = list(islice(cambiadas, BLOQUE_SINCRONIZACION))
+                if not bloque:
+                    break
+                self._agregar(meta, bloque)
+        meta["marca"] = marca
+
+    def _codificar(self, meta, documentos):
+        """
+        Arreglos por columna de los documentos (todos con fecha válida).
+        Sus descripciones se agregan a descripcion.bin.
+        """
+        codigos = {
+            c: {v: i for i, v in enumerate(meta["diccionarios"][c])} for c in DICCIONARIOS
+        }
+
+        def codigo(columna, valor):
+            tabla = codigos[columna]
+            if valor not in tabla:
+                tabla[valor] = len(tabla)
+                meta["diccionarios"][columna].append(valor)
+            return tabla[valor]
+
+        valores = {nombre: [] for nombre in COLUMNAS}
+        texto = bytearray()
+        fin = meta["bytes_descripcion"]
+
+        for data in documentos:
+            descripcion = str(data.get("descripcion", "")).encode("utf-8")
+            texto += descripcion
+            valores["descripcion_inicio"].append(fin)
+            fin += len(descripcion)
+            valores["descripcion_fin"].append(fin)
+
+            valores["id"].append(data.get("id_transaccion") or 0)
+            valores["fecha"].append(_dia(data["fecha"]))
+            valores["valor"].append(float(data.get("valor", 0)))
+            valores["saldo_inicial"].append(float(data.get("saldo_inicial") or 0))
+            valores["saldo_final"].append(float(data.get("saldo_final") or 0))
+            valores["tipo"].append(codigo("tipo", data.get("tipo", "")))
+            valores["categoria"].append(codigo("categoria", data.get("categoria", "")))
+            valores["cuenta"].append(codigo("cuenta", data.get("cuenta", "")))
+            valores["vigente"].append(1)
+
+        self._anexar("descripcion.bin", meta["bytes_descripcion"], bytes(texto))
+        meta["bytes_descripcion"] = fin
+        return {
+            nombre: np.asarray(valores[nombre], dtype=dtype) for nombre, dtype in COLUMNAS.items()
+        }
+
+    def _agregar(self, meta, documentos):
+        arreglos = self._codificar(meta, [d for d in documentos if _tiene_fecha(d)])
+
+        for nombre, arreglo in arreglos.items():
+            self._anexar(f"{nombre}.bin", meta["filas"] * arreglo.itemsize, arreglo.tobytes())
+        meta["filas"] += len(arreglos["id"])
+
+    def _buscador(self, meta):
+        """
+        Función que da, para una lista de id_transaccion, (filas, encontradas).
+        Las filas no están en orden de id, así que se busca sobre un argsort.
+        """
+        ids = np.asarray(self._mapear("id.bin", COLUMNAS["id"], meta["filas"]))
+        orden = np.argsort(ids, kind="stable")
+        ordenados = ids[orden]
+
+        def filas_de(documentos_ids):
+            buscados = np.asarray(documentos_ids, dtype=np.int64)
+            if len(ordenados) == 0:
+                return np.zeros(len(buscados), dtype=np.int64), np.zeros(len(buscados), dtype=bool)
+            posiciones = np.minimum(np.searchsorted(ordenados, buscados), len(ordenados) - 1)
+            return orden[posiciones], ordenados[posiciones] == buscados
+
+        return filas_de
+
+    def _actualizar(self, meta, cambiadas):
+        """
+        Reescribe en su fila las transacciones nuevas o editadas que ya
+        tienen una y agrega al final las que no; las que quedaron sin fecha
+        válida se marcan como no vigentes.
+        """
+        por_id = {d.get("id_transaccion") or 0: d for d in cambiadas}
+        filas_de = self._buscador(meta)
+
+        con_fecha = [d for d in por_id.values() if _tiene_fecha(d)]
+        posiciones, encontradas = filas_de([d.get("id_transaccion") or 0 for d in con_fecha])
+        editadas = [d for d, e in zip(con_fecha, encontradas.tolist()) if e]
+        nuevas = [d for d, e in zip(con_fecha, encontradas.tolist()) if not e]
+        posiciones = posiciones[encontradas]
+
+        quitar = [i for i, d in por_id.items() if not _tiene_fecha(d)]
+        posiciones_quitar, encontradas_quitar = filas_de(quitar)
+        posiciones_quitar = posiciones_quitar[encontradas_quitar]
+
+        if len(posiciones) or len(posiciones_quitar):
+            arreglos = self._codificar(meta, editadas)
+            for nombre, dtype in COLUMNAS.items():
+                if not len(posiciones) and nombre != "vigente":
+                    continue
+                columna = np.memmap(
+                    self._ruta(f"{nombre}.bin"), dtype=dtype, mode="r+", shape=(meta["filas"],)
+                )
+                columna[posiciones] = arreglos[nombre]
+                if nombre == "vigente":
+                    columna[posiciones_quitar] = 0
+                columna.flush()
+                del columna
+        if nuevas:
+            self._agregar(meta, nuevas)
+
+    # ----- consultas -----
+
+    def _codigos(self, meta, columna, condicion):
+        return np.array(
+            [i for i, v in enumerate(meta["diccionarios"][columna]) if condicion(v)],
+            dtype=np.int16,
+        )
+
+    def _es_gasto(self, meta):
+        """Arreglo por código de tipo: True si es 'gasto' (sin importar mayúsculas)."""
+        return np.array(
+            [(v or "").lower() == "gasto" for v in meta["diccionarios"]["tipo"]], dtype=bool
+        )
+
+    def _rango(self, columnas, desde_iso, hasta_iso):
+        fecha = columnas["fecha"]
+        mascara = columnas["vigente"].astype(bool)
+        if desde_iso and desde_iso > "0000-01-01":
+            mascara &= fecha >= _dia(desde_iso)
+        if hasta_iso and hasta_iso < "9999-12-31":
+            mascara &= fecha <= _dia(hasta_iso)
+        return mascara
+
+    def _filas(self, meta, columnas, indices, valor_mostrado):
+        """Las filas de `indices` como dicts, con los campos que usan las plantillas."""
+        dic = meta["diccionarios"]
+        fechas = np.datetime_as_string(columnas["fecha"][indices].astype("datetime64[D]"))
+        inicios = columnas["descripcion_inicio"]
+        fines = columnas["descripcion_fin"]
+        texto = columnas["descripcion"]
+
+        filas = []
+        for j, i in enumerate(indices.tolist()):
+            filas.append({
+                "id_transaccion": int(columnas["id"][i]),
+                "fecha": str(fechas[j]),
+                "descripcion": bytes(texto[int(inicios[i]):int(fines[i])]).decode("utf-8"),
+                "valor": float(columnas["valor"][i]),
+                "tipo": dic["tipo"][columnas["tipo"][i]],
+                "cuenta": dic["cuenta"][columnas["cuenta"][i]],
+                "categoria": dic["categoria"][columnas["categoria"][i]],
+                "saldo_inicial": float(columnas["saldo_inicial"][i]),
+                "saldo_final": float(columnas["saldo_final"][i]),
+                "valor_mostrado": float(valor_mostrado[j]),
+            })
+        return filas
+
+    def filtrar_y_resumir(self, tipo, desde_iso, hasta_iso, categorias_sel):
+        """Lo mismo que filtrar_y_resumir() de la app, con máscaras de numpy."""
+        meta, columnas = self._estado
+        mascara = self._rango(columnas, desde_iso, hasta_iso)
+
+        if tipo != "todos":
+            mascara &= np.isin(columnas["tipo"], self._codigos(
+                meta, "tipo", lambda v: (v or "").lower() == tipo))
+        if categorias_sel:
+            seleccion = set(categorias_sel)
+            mascara &= np.isin(columnas["categoria"], self._codigos(
+                meta, "categoria", lambda v: v in seleccion))
+
+        indices = np.flatnonzero(mascara)
+        indices = indices[np.lexsort((columnas["id"][indices], columnas["fecha"][indices]))]
+
+        valor = np.asarray(columnas["valor"][indices])
+        gasto = self._es_gasto(meta)[columnas["tipo"][indices]]
+        monto = np.abs(valor)
+
+        total_ingresos = float(valor[~gasto & (valor > 0)].sum())
+        total_gastos = float(monto[gasto].sum())
+        filas = self._filas(meta, columnas, indices, np.where(gasto, -monto, monto))
+
+        return filas, {
+            "total_ingresos": total_ingresos,
+            "total_gastos": total_gastos,
+            "diferencia": total_ingresos - total_gastos,
+            "cantidad": len(filas),
+            "desde": desde_iso or "0000-01-01",
+            "hasta": hasta_iso or "9999-12-31",
+        }
+
+    def _por_categoria(self, meta, categorias, montos, grupos=None, n_grupos=1):
+        """
+        Suma `montos` por categoría (y por grupo, p. ej. mes). Devuelve una
+        lista de n_grupos dicts {categoria: total} con la llave de los
+        resúmenes (categoría vacía → "Sin categoría").
+        """
+        nombres = meta["diccionarios"]["categoria"]
+        n_cat = max(len(nombres), 1)
+        claves = categorias.astype(np.int64)
+        if grupos is not None:
+            claves = grupos * n_cat + claves
+        sumas = np.bincount(claves, weights=montos, minlength=n_grupos * n_cat).reshape(n_grupos, n_cat)
+        cantidades = np.bincount(claves, minlength=n_grupos * n_cat).reshape(n_grupos, n_cat)
+
+        resultado = []
+        for g in range(n_grupos):
+            por_cat = {}
+            for c in np.flatnonzero(cantidades[g]).tolist():
+                nombre = nombres[c] or "Sin categoría"
+                por_cat[nombre] = por_cat.get(nombre, 0.0) + float(sumas[g, c])
+            resultado.append(por_cat)
+        return resultado
+
+    def totales_periodo(self, desde_iso, hasta_iso):
+        """Totales del rango con la forma de los resúmenes (ver totales_periodo() de la app)."""
+        meta, columnas = self._estado
+        mascara = self._rango(columnas, desde_iso, hasta_iso)
+        gasto = self._es_gasto(meta)[columnas["tipo"]]
+        monto = np.abs(columnas["valor"])
+
+        totales = {"cantidad": int(mascara.sum())}
+        for campo, seleccion in (("ingresos", mascara & ~gasto), ("gastos", mascara & gasto)):
+            totales[campo] = float(monto[seleccion].sum())
+            totales[f"{campo}_por_categoria"] = self._por_categoria(
+                meta, columnas["categoria"][seleccion], monto[seleccion]
+            )[0]
+        return totales
+
+    def resumen_mensual(self):
+        """
+        Filas por mes como _agrupar_por_mes(): ingresos, gastos, diferencia,
+        cantidad, saldo_inicial / saldo_final (encadenados desde el
+        saldo_inicial de la primera transacción) y montos por categoría.
+        """
+        meta, columnas = self._estado
+        vigentes = np.flatnonzero(columnas["vigente"])
+        n = len(vigentes)
+        if n == 0:
+            return []
+
+        orden = vigentes[np.lexsort((columnas["id"][vigentes], columnas["fecha"][vigentes]))]
+        fecha = columnas["fecha"][orden]
+        monto = np.abs(columnas["valor"][orden])
+        gasto = self._es_gasto(meta)[columnas["tipo"][orden]]
+        categorias = columnas["categoria"][orden]
+        firmado = np.where(gasto, -monto, monto)
+
+        saldo_despues = float(columnas["saldo_inicial"][orden[0]]) + np.cumsum(firmado)
+        saldo_antes = np.concatenate(([columnas["saldo_inicial"][orden[0]]], saldo_despues[:-1]))
+
+        meses = fecha.astype("datetime64[D]").astype("datetime64[M]")
+        meses_unicos, inicio = np.unique(meses, return_index=True)
+        grupo = np.searchsorted(meses_unicos, meses)
+        fin = np.concatenate((inicio[1:], [n])) - 1
+
+        ingresos = np.bincount(grupo, weights=np.where(gasto, 0.0, monto), minlength=len(inicio))
+        gastos = np.bincount(grupo, weights=np.where(gasto, monto, 0.0), minlength=len(inicio))
+        cantidad = np.bincount(grupo, minlength=len(inicio))
+        ingresos_cat = self._por_categoria(
+            meta, categorias[~gasto], monto[~gasto], grupo[~gasto], len(inicio))
+        gastos_cat = self._por_categoria(
+            meta, categorias[gasto], monto[gasto], grupo[gasto], len(inicio))
+
+        filas = []
+        for g, mes in enumerate(np.datetime_as_string(meses_unicos).tolist()):
+            filas.append({
+                "mes": mes,
+                "ingresos": float(ingresos[g]),
+                "gastos": float(gastos[g]),
+                "diferencia": float(ingresos[g] - gastos[g]),
+                "saldo_inicial": float(saldo_antes[inicio[g]]),
+                "saldo_final": float(saldo_despues[fin[g]]),
+                "cantidad": int(cantidad[g]),
+                "ingresos_por_categoria": ingresos_cat[g],
+                "gastos_por_categoria": gastos_cat[g],
+            })
+        return filas
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+# Las pruebas corren contra el Firestore en memoria (firestore_memoria.py)
+os.environ.setdefault("FINANZAS_DB", "memoria")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as finanzas  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """Base en memoria vacía, con las cachés del proceso limpias."""
+    db = finanzas.db
+    db.vaciar()
+    finanzas.cache_lecturas.invalidar(
+        "cuentas", "transacciones", "saldos_diarios", "resumen_meses", "version_libro"
+    )
+    finanzas.fragmentos_html.vaciar()
+    return db
+
+
+@pytest.fixture
+def cliente(db):
+    cliente = finanzas.app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion["logged"] = True
+    return cliente
@@ -0,0 +1,29 @@
+import app as finanzas
+
+
+def test_tope_en_bytes_cuenta_lo_que_hay_dentro_y_expulsa_lo_mas_viejo():
+    grande = ("x" * 4000, {"resumen": ["y" * 4000]})
+    assert finanzas._tamano(grande) > 8000
+
+    cache = finanzas.CacheLectura(ttl=None, max_bytes=20_000, copiar=False)
+    cache.poner("a", grande)
+    cache.poner("b", grande)
+    assert cache.obtener("a") is grande  # "a" pasa a ser la más reciente
+    cache.poner("c", grande)
+    assert cache.obtener("b") is None
+    assert cache.obtener("a") is grande and cache.obtener("c") is grande
+    assert cache.bytes <= cache.max_bytes
+
+    cache.poner("enorme", "z" * 30_000)  # más que el tope: no se guarda
+    assert cache.obtener("enorme") is None
+    assert cache.obtener("a") is grande
+
+    cache.vaciar()
+    assert cache.bytes == 0 and cache.obtener("c") is None
+
+
+def test_lecturas_devuelven_copias():
+    cache = finanzas.CacheLectura()
+    assert cache.obtener(("cuentas",), lambda: [{"nombre": "Efectivo"}]) == [{"nombre": "Efectivo"}]
+    cache.obtener(("cuentas",), lambda: None)[0]["nombre"] = "otra"
+    assert cache.obtener(("cuentas",), lambda: None) == [{"nombre": "Efectivo"}]
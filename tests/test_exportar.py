@@ -0,0 +1,41 @@
+from datetime import date
+
+import app as finanzas
+
+
+def _lecturas_exportar():
+    """Suma de lecturas que /metrics tiene anotadas para la ruta exportar."""
+    for linea in finanzas.metrica_lecturas.exportar():
+        if linea.startswith('finanzas_peticion_lecturas_sum{ruta="exportar"}'):
+            return float(linea.split()[-1])
+    return 0.0
+
+
+def test_exportar_no_manda_lecturas_en_cero(db, cliente):
+    db.collection("cuentas").add({"nombre": "Efectivo", "saldo_inicial": 0})
+    for valor in (10.0, 20.0, 30.0):
+        finanzas.registrar_transaccion(
+            date.today().isoformat(), "prueba", valor, "ingreso", "Efectivo", "Salario"
+        )
+    antes = _lecturas_exportar()
+
+    respuesta = cliente.get("/exportar.csv")
+    cuerpo = respuesta.get_data()
+    respuesta.close()
+
+    assert respuesta.status_code == 200
+    assert cuerpo.count(b"\n") == 4
+    # El cuerpo se lee después de las cabeceras: no se manda un 0 falso...
+    assert "X-Lecturas-Firestore" not in respuesta.headers
+    # ...y lo que leyó queda en /metrics al terminar de enviarlo
+    assert _lecturas_exportar() - antes >= 3
+
+    assert "X-Lecturas-Firestore" in cliente.get("/resumen-mensual").headers
+
+
+def test_metrics_pide_sesion(db, cliente):
+    assert cliente.get("/metrics").status_code == 200
+    anonimo = finanzas.app.test_client()
+    respuesta = anonimo.get("/metrics")
+    assert respuesta.status_code == 302
+    assert "/login" in respuesta.headers["Location"]
@@ -0,0 +1,39 @@
+import re
+
+import pytest
+
+import app as finanzas
+
+
+def _ingresos(db, cantidad):
+    db.cargar("transacciones", [
+        {"id_transaccion": i, "fecha": "2024-03-%02d" % (1 + i % 28), "descripcion": f"fila {i}",
+         "valor": 10.0 * i, "tipo": "ingreso", "cuenta": "Efectivo", "categoria": "Salario"}
+        for i in range(1, cantidad + 1)
+    ])
+
+
+def test_paginas_siguen_el_cursor(db, cliente):
+    _ingresos(db, 30)
+    primera = cliente.get("/ingresos?por_pagina=25").get_data(as_text=True)
+    assert primera.count("fila ") == 25
+    enlace = re.search(r'href="(/ingresos\?antes=[^"]+)"', primera).group(1)
+
+    respuesta = cliente.get(enlace.replace("&amp;", "&"))
+    assert respuesta.status_code == 200
+    assert respuesta.get_data(as_text=True).count("fila ") == 5
+
+
+@pytest.mark.parametrize("cursor", ["2024-03-01_None", "basura", "2024-13-01_5", "_7"])
+def test_cursor_invalido_es_400(db, cliente, cursor):
+    for parametro in ("despues", "antes"):
+        respuesta = cliente.get(f"/gastos?{parametro}={cursor}")
+        assert respuesta.status_code == 400
+
+
+def test_fila_sin_id_no_da_cursor():
+    assert finanzas._cursor({"fecha": "2024-03-01", "id_transaccion": None}) is None
+    assert finanzas._cursor({"id_transaccion": 4}) is None
+    assert finanzas._leer_cursor(finanzas._cursor({"fecha": "2024-03-01", "id_transaccion": 4})) == {
+        "fecha": "2024-03-01", "id_transaccion": 4,
+    }
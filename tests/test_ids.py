@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import app as finanzas
+
+
+def test_altas_y_bloques_concurrentes_no_repiten_ids(db):
+    # 8 hilos dando de alta (cada alta toma su id en su transacción) y 2
+    # reservando bloques como las importaciones, contra el mismo contador
+    db.collection("cuentas").add({"nombre": "Efectivo", "saldo_inicial": 0})
+    hoy = date.today().isoformat()
+
+    def altas():
+        return [
+            finanzas.registrar_transaccion(
+                hoy, "prueba", 1000.0, "ingreso", "Efectivo", "Salario"
+            )["id_transaccion"]
+            for _ in range(10)
+        ]
+
+    def bloques():
+        ids = []
+        for cantidad in (1, 7, 100):
+            primero, ultimo = finanzas.reservar_bloque_ids(db.transaction(), cantidad)
+            assert ultimo - primero + 1 == cantidad
+            ids.extend(range(primero, ultimo + 1))
+        return ids
+
+    db.latencia = 0.0005  # que las transacciones tarden algo y se crucen
+    try:
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            lotes = list(pool.map(lambda f: f(), [altas] * 8 + [bloques] * 2))
+    finally:
+        db.latencia = 0.0
+
+    ids = [i for lote in lotes for i in lote]
+    assert len(ids) == 8 * 10 + 2 * 108
+    assert len(set(ids)) == len(ids)
+    assert db.collection("config").document("transacciones").get().get("contador") == max(ids)
+
+
+def test_el_mayor_id_es_el_alta_mas_reciente(db):
+    # Con varios hilos a la vez, ordenar por id da el orden en que se
+    # confirmaron las altas: el saldo de la cuenta crece con el id
+    db.collection("cuentas").add({"nombre": "Efectivo", "saldo_inicial": 0})
+    hoy = date.today().isoformat()
+
+    def altas():
+        for _ in range(10):
+            finanzas.registrar_transaccion(hoy, "prueba", 1000.0, "ingreso", "Efectivo", "Salario")
+
+    db.latencia = 0.0005
+    try:
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            list(pool.map(lambda f: f(), [altas] * 6))
+    finally:
+        db.latencia = 0.0
+
+    trans = sorted(
+        (d.to_dict() for d in db.collection("transacciones").stream()),
+        key=lambda t: t["id_transaccion"],
+    )
+    assert [t["saldo_en_cuenta"] for t in trans] == [1000.0 * i for i in range(1, 61)]
+    assert finanzas.leer_ultimas_transacciones(1)[0] == trans[-1]
@@ -0,0 +1,57 @@
+import random
+from decimal import Decimal
+
+import pytest
+from babel.numbers import format_currency
+
+import app as finanzas
+
+
+def _babel(valor):
+    """formatear_cop() de antes: Babel, y si no puede (más de 28 dígitos), el formato simple."""
+    if valor is None:
+        valor = 0
+    try:
+        return format_currency(valor, "COP", locale="es_CO")
+    except Exception:
+        return f"${valor:,.0f}"
+
+
+def _montos(rnd, cantidad):
+    """Montos al azar: todas las magnitudes, con signo, medios centavos, int, float y Decimal."""
+    for _ in range(cantidad):
+        magnitud = 10 ** rnd.randint(-8, 27)
+        forma = rnd.randrange(6)
+        if forma == 0:
+            yield rnd.uniform(-1, 1) * magnitud
+        elif forma == 1:
+            yield round(rnd.uniform(-1, 1) * magnitud, rnd.randint(0, 4))
+        elif forma == 2:
+            yield rnd.randint(-(10 ** 30), 10 ** 30) // 10 ** rnd.randint(0, 30)
+        elif forma == 3:
+            yield rnd.randint(-10 ** 6, 10 ** 6) / 1000 + rnd.choice((0.005, -0.005))
+        elif forma == 4:
+            yield Decimal(rnd.randint(-10 ** 20, 10 ** 20)).scaleb(-rnd.randint(0, 6))
+        else:
+            yield Decimal(str(rnd.uniform(-1, 1) * magnitud))
+
+
+@pytest.mark.parametrize("semilla", range(5))
+def test_formatear_cop_igual_a_babel(semilla):
+    rnd = random.Random(semilla)
+    for valor in _montos(rnd, 2000):
+        assert finanzas.formatear_cop(valor) == _babel(valor), repr(valor)
+
+
+@pytest.mark.parametrize("valor", [
+    0, -0.0, 0.005, 0.015, -0.005, 1.005, 2.675, 1234.5, -1234.5, 10 ** 30, -(10 ** 30),
+    1e300, -1e-300, Decimal("0.125"), Decimal("-0.00"), Decimal("1E+25"), Decimal("123456789.995"),
+    float("nan"), float("inf"), -float("inf"), Decimal("NaN"),
+])
+def test_formatear_cop_casos_borde(valor):
+    assert finanzas.formatear_cop(valor) == _babel(valor)
+
+
+def test_formatear_cop_none_y_textos():
+    assert finanzas.formatear_cop(None) == _babel(None) == "$0,00"
+    assert finanzas.formatear_cop("1234") == _babel("1234")
@@ -0,0 +1,146 @@
+import threading
+from datetime import date, timedelta
+
+import app as finanzas
+
+
+def _postear(cliente, cantidad, valor=1000, fecha=None, cuenta="Efectivo"):
+    for i in range(cantidad):
+        r = cliente.post("/transacciones", data={
+            "fecha_trabajo": fecha or date.today().isoformat(),
+            "descripcion": f"prueba {i}",
+            "valor": str(valor),
+            "tipo": "ingreso",
+            "cuenta": cuenta,
+            "categoria": finanzas.CATEGORIAS_INGRESO[0],
+        })
+        assert r.status_code == 302
+
+
+def _en_hilos(funciones):
+    errores = []
+
+    def correr(funcion):
+        try:
+            funcion()
+        except Exception as e:  # pragma: no cover - se reporta abajo
+            errores.append(e)
+
+    trabajadores = [threading.Thread(target=correr, args=(f,)) for f in funciones]
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    assert not errores, errores
+
+
+def _clientes(hilos):
+    clientes = []
+    for _ in range(hilos):
+        c = finanzas.app.test_client()
+        with c.session_transaction() as sesion:
+            sesion["logged"] = True
+        clientes.append(c)
+    return clientes
+
+
+def test_altas_concurrentes_en_una_cuenta(db):
+    db.collection("cuentas").add({"nombre": "Efectivo", "saldo_inicial": 1000})
+    _en_hilos([lambda c=c: _postear(c, 10) for c in _clientes(4)])
+
+    cuenta = next(iter(db.collection("cuentas").stream())).to_dict()
+    trans = [d.to_dict() for d in db.collection("transacciones").stream()]
+    assert len(trans) == 40
+    assert cuenta["saldo_en_cuenta"] == 1000 + 40 * 1000
+    assert sorted(t["saldo_en_cuenta"] for t in trans) == [1000 + i * 1000 for i in range(1, 41)]
+
+
+def _cadena_sin_huecos(trans, apertura):
+    saldo = apertura
+    for t in sorted(trans, key=lambda t: (t["fecha"], t["id_transaccion"])):
+        assert t["saldo_inicial"] == saldo
+        saldo += t["valor"]
+        assert t["saldo_final"] == saldo
+    return saldo
+
+
+def test_altas_concurrentes_mantienen_la_cadena(db):
+    db.collection("cuentas").add({"nombre": "Efectivo", "saldo_inicial": 1000})
+    db.collection("cuentas").add({"nombre": "Nequi", "saldo_inicial": 0})
+    hoy = date.today()
+    fechas = [hoy.replace(day=1).isoformat(), hoy.isoformat()]
+    _en_hilos([
+        lambda c=c, i=i: _postear(c, 10, fecha=fechas[i % 2], cuenta=("Efectivo", "Nequi")[i // 2])
+        for i, c in enumerate(_clientes(4))
+    ])
+    # Las altas atrasadas dejan el resto del re-encadenado en segundo plano
+    finanzas.reencadenar()
+
+    trans = [d.to_dict() for d in db.collection("transacciones").stream()]
+    assert len(trans) == 40
+    assert _cadena_sin_huecos(trans, 1000) == 1000 + 40 * 1000
+
+    ultimo_por_fecha = {}
+    for t in sorted(trans, key=lambda t: (t["fecha"], t["id_transaccion"])):
+        ultimo_por_fecha[t["fecha"]] = t["saldo_final"]
+    for d in db.collection("saldos_diarios").stream():
+        assert d.to_dict()["saldo_final"] == ultimo_por_fecha[d.id]
+
+
+def test_alta_lee_la_transaccion_desde_un_solo_hilo(db, cliente, monkeypatch):
+    # El Transaction de Firestore no es seguro entre hilos: todas sus
+    # lecturas tienen que salir del hilo que corre la transacción
+    db.collection("cuentas").add({"nombre": "Efectivo", "saldo_inicial": 0})
+    hilos = []
+    lector = finanzas.LectorPeticion
+    recorrer, documentos = lector.recorrer, lector.documentos_en_transaccion
+
+    def recorrer_anotado(self, consulta, transaction=None):
+        if transaction is not None:
+            hilos.append(threading.get_ident())
+        return recorrer(self, consulta, transaction)
+
+    def documentos_anotado(self, transaction, referencias):
+        hilos.append(threading.get_ident())
+        return documentos(self, transaction, referencias)
+
+    monkeypatch.setattr(lector, "recorrer", recorrer_anotado)
+    monkeypatch.setattr(lector, "documentos_en_transaccion", documentos_anotado)
+    _postear(cliente, 1)
+    _postear(cliente, 1, fecha=date.today().replace(day=1).isoformat())
+
+    assert hilos and set(hilos) == {threading.get_ident()}
+
+
+def _resumenes(db):
+    campos = ("saldo_inicial", "saldo_final", "ingresos", "gastos", "cantidad")
+    return {
+        (nombre, d.id): tuple(d.to_dict().get(c, 0) for c in campos)
+        for nombre in ("resumen_dias", "resumen_meses")
+        for d in db.collection(nombre).stream()
+    }
+
+
+def test_alta_atrasada_deja_los_resumenes_siguientes_al_reencadenado(db, monkeypatch):
+    # Todo lo que va después lo corrige el re-encadenado de fondo
+    monkeypatch.setattr(finanzas, "VENTANAS_SINCRONAS", 0)
+    db.collection("cuentas").add({"nombre": "Efectivo", "saldo_inicial": 1000})
+    hoy = date.today()
+    for dias in range(90, -1, -3):
+        fecha = (hoy - timedelta(days=dias)).isoformat()
+        finanzas.registrar_transaccion(fecha, "x", 1000.0, "ingreso", "Efectivo", "Salario")
+    finanzas.hilo_reencadenar.submit(lambda: None).result()
+
+    lecturas = []
+    for dias in (80, 2):
+        fecha = (hoy - timedelta(days=dias)).isoformat()
+        with finanzas.app.test_request_context():
+            finanzas.registrar_transaccion(fecha, "atrasada", -500.0, "gasto", "Efectivo", "Salud y bienestar")
+            lecturas.append(finanzas.lector().lecturas)
+        finanzas.hilo_reencadenar.submit(lambda: None).result()
+    # Lo que lee la alta no depende de cuántos días quedan detrás
+    assert lecturas[0] == lecturas[1]
+
+    incrementales = _resumenes(db)
+    finanzas.reconstruir_resumenes()
+    assert incrementales == _resumenes(db)
@@ -0,0 +1,106 @@
+import random
+
+import pytest
+
+import app as finanzas
+from firestore_sqlite import ClienteSQLite
+
+DESDE, HASTA = "2024-03-01", "2024-03-31"
+
+
+def _reporte_general_original(filas, desde_iso, hasta_iso):
+    """El bucle de reporte_general() antes de las agregaciones."""
+    ingresos_por_cat = {}
+    gastos_por_cat = {}
+    total_ingresos = 0.0
+    total_gastos = 0.0
+    for data in filas:
+        fecha = data.get("fecha")
+        if not fecha or fecha < desde_iso or fecha > hasta_iso:
+            continue
+        tipo_t = (data.get("tipo", "") or "").lower()
+        categoria = data.get("categoria", "Sin categoría")
+        valor_abs = abs(float(data.get("valor", 0)))
+        if tipo_t == "gasto":
+            gastos_por_cat[categoria] = gastos_por_cat.get(categoria, 0) + valor_abs
+            total_gastos += valor_abs
+        else:
+            ingresos_por_cat[categoria] = ingresos_por_cat.get(categoria, 0) + valor_abs
+            total_ingresos += valor_abs
+    return total_ingresos, total_gastos, ingresos_por_cat, gastos_por_cat
+
+
+def _libro(rnd, cantidad, antiguas=False):
+    """Filas como las guarda la app; con `antiguas`, además tipos y signos de antes."""
+    filas = []
+    for i in range(1, cantidad + 1):
+        tipo = rnd.choice(["gasto", "ingreso"])
+        categorias = finanzas.CATEGORIAS_GASTO if tipo == "gasto" else finanzas.CATEGORIAS_INGRESO
+        valor = float(rnd.randint(1, 900) * 1000)
+        filas.append({
+            "id_transaccion": i,
+            "fecha": "2024-%02d-%02d" % (rnd.choice([2, 3, 3, 3, 4]), rnd.randint(1, 28)),
+            "tipo": tipo,
+            "categoria": rnd.choice(categorias + ["Sin lista"]),
+            "valor": -valor if tipo == "gasto" else valor,
+        })
+    if antiguas:
+        filas += [
+            {"id_transaccion": 901, "fecha": "2024-03-02", "tipo": "Ingreso",
+             "categoria": "Sueldo Deiner", "valor": 500.0},
+            {"id_transaccion": 902, "fecha": "2024-03-03", "tipo": "transferencia",
+             "categoria": "Otros ingresos", "valor": -70.0},
+            {"id_transaccion": 903, "fecha": "2024-03-04", "tipo": "ingreso",
+             "categoria": "Negocios", "valor": -30.0},
+            {"id_transaccion": 904, "fecha": "2024-03-05", "tipo": "gasto",
+             "categoria": "Salud y bienestar", "valor": 200.0},
+            {"id_transaccion": 905, "fecha": "2024-03-06", "tipo": "GASTO",
+             "categoria": "Transporte y movilidad", "valor": -25.0},
+        ]
+    return filas
+
+
+def _comprobar(totales, filas):
+    ingresos, gastos, ingresos_cat, gastos_cat = _reporte_general_original(filas, DESDE, HASTA)
+    assert totales["ingresos"] == pytest.approx(ingresos)
+    assert totales["gastos"] == pytest.approx(gastos)
+    assert totales["cantidad"] == sum(DESDE <= f["fecha"] <= HASTA for f in filas)
+    for cat in finanzas.CATEGORIAS_INGRESO:
+        assert totales["ingresos_por_categoria"].get(cat, 0) == pytest.approx(ingresos_cat.get(cat, 0))
+    for cat in finanzas.CATEGORIAS_GASTO:
+        assert totales["gastos_por_categoria"].get(cat, 0) == pytest.approx(gastos_cat.get(cat, 0))
+
+
+@pytest.mark.parametrize("antiguas", [False, True])
+def test_agregaciones_como_reporte_general_original(db, monkeypatch, antiguas):
+    filas = _libro(random.Random(7), 300, antiguas)
+    db.cargar("transacciones", filas)
+
+    recorridos = []
+    original = finanzas._totales_desde_transacciones
+    monkeypatch.setattr(
+        finanzas, "_totales_desde_transacciones",
+        lambda *a: recorridos.append(a) or original(*a),
+    )
+    with finanzas.app.test_request_context():
+        _comprobar(finanzas._totales_con_agregaciones(DESDE, HASTA), filas)
+    # Solo se recorren las filas si el rango tiene alguna sin normalizar
+    assert bool(recorridos) == antiguas
+
+
+def test_agregaciones_con_pocas_filas_las_recorren(db, monkeypatch):
+    filas = _libro(random.Random(8), 10)
+    db.cargar("transacciones", filas)
+    with finanzas.app.test_request_context():
+        _comprobar(finanzas._totales_con_agregaciones(DESDE, HASTA), filas)
+        assert finanzas.lector().lecturas < 5 + 19
+
+
+@pytest.mark.parametrize("antiguas", [False, True])
+def test_agrupados_como_reporte_general_original(db, monkeypatch, antiguas):
+    filas = _libro(random.Random(9), 300, antiguas)
+    sqlite = ClienteSQLite()
+    monkeypatch.setattr(finanzas, "db", sqlite)
+    sqlite.cargar("transacciones", filas)
+    with finanzas.app.test_request_context():
+        _comprobar(finanzas._totales_agrupados(DESDE, HASTA), filas)
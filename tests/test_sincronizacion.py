@@ -0,0 +1,84 @@
+from datetime import date
+
+import pytest
+
+import app as finanzas
+import instantanea
+
+
+HOY = date.today().isoformat()
+
+
+def _reservar_importacion(db):
+    """Una importación reserva su bloque de ids (1..100) y todavía no escribe."""
+    db.collection("cuentas").add({"nombre": "Efectivo", "saldo_inicial": 0})
+    return finanzas.reservar_bloque_ids(db.transaction(), 100)[0]
+
+
+def _alta(valor=10.0):
+    return finanzas.registrar_transaccion(HOY, "prueba", valor, "ingreso", "Efectivo", "Salario")
+
+
+def _fila_importada(db, id_transaccion, valor=10.0):
+    """La importación guarda ahora una fila del bloque, con un id menor que las altas."""
+    db.collection("transacciones").add({
+        "id_transaccion": id_transaccion, "fecha": HOY, "descripcion": "importada",
+        "valor": valor, "tipo": "ingreso", "cuenta": "Efectivo", "categoria": "Salario",
+        "actualizado_en": finanzas.marca_actual(),
+    })
+
+
+def test_libro_local_ve_ids_menores_guardados_despues(db):
+    primero = _reservar_importacion(db)
+    libro = finanzas.LibroLocal()
+
+    assert _alta()["id_transaccion"] == 101
+    assert libro.sincronizar(finanzas.leer_cambios) == 1
+
+    _fila_importada(db, primero)
+    assert libro.sincronizar(finanzas.leer_cambios) == 2
+    _fila_importada(db, primero + 1)
+    assert libro.sincronizar(finanzas.leer_cambios) == 3
+    assert sorted(t["id_transaccion"] for t in libro.en_orden()) == [1, 2, 101]
+
+
+@pytest.mark.skipif(not instantanea.DISPONIBLE, reason="la instantánea necesita numpy")
+def test_instantanea_ve_ids_menores_guardados_despues(db, tmp_path):
+    primero = _reservar_importacion(db)
+    columnar = instantanea.InstantaneaColumnar(str(tmp_path))
+
+    _alta(10.0)
+    _fila_importada(db, primero, 20.0)
+    assert columnar.sincronizar(finanzas.leer_cambios) == 2
+
+    _fila_importada(db, primero + 1, 30.0)
+    assert columnar.sincronizar(finanzas.leer_cambios) == 3
+    filas, totales = columnar.filtrar_y_resumir("todos", None, None, [])
+    assert [f["id_transaccion"] for f in filas] == [1, 2, 101]
+    assert totales["total_ingresos"] == 60.0
+
+    # Editar la de id menor, que quedó después en los archivos
+    doc = next(iter(db.collection("transacciones").where("id_transaccion", "==", 2).stream()))
+    doc.reference.update({"valor": 35.0, "actualizado_en": finanzas.marca_actual()})
+    assert columnar.sincronizar(finanzas.leer_cambios) == 3
+    assert columnar.filtrar_y_resumir("todos", None, None, [])[1]["total_ingresos"] == 65.0
+
+
+def test_marcar_transacciones_viejas_las_vuelve_a_sincronizar(db):
+    # Una transacción guardada antes de actualizado_en
+    db.collection("transacciones").add({
+        "id_transaccion": 1, "fecha": HOY, "descripcion": "vieja", "valor": 10.0,
+        "tipo": "ingreso", "cuenta": "Efectivo", "categoria": "Salario",
+    })
+    libro = finanzas.LibroLocal()
+    assert libro.sincronizar(finanzas.leer_cambios) == 1
+
+    assert finanzas.marcar_transacciones() == 1
+    assert finanzas.marcar_transacciones() == 0
+    doc = next(iter(db.collection("transacciones").stream()))
+    assert doc.to_dict()["actualizado_en"] > 0
+
+    # Una edición posterior llega con la sincronización incremental
+    doc.reference.update({"valor": 25.0, "actualizado_en": finanzas.marca_actual()})
+    assert libro.sincronizar(finanzas.leer_cambios) == 1
+    assert [t["valor"] for t in libro.en_orden()] == [25.0]
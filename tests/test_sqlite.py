@@ -0,0 +1,94 @@
+import os
+import random
+import subprocess
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+import app as finanzas
+from firestore_sqlite import ClienteSQLite, transactional
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Un proceso aparte (como un worker de gunicorn) dando altas sobre el archivo
+ALTAS = """
+import sys
+import app as finanzas
+for i in range(int(sys.argv[1])):
+    dia = "2024-03-%02d" % (1 + i % 20)
+    finanzas.registrar_transaccion(dia, "prueba", 1000.0, "ingreso", "Efectivo", "Salario")
+"""
+
+
+def test_altas_desde_dos_procesos_sobre_el_mismo_archivo(tmp_path):
+    ruta = str(tmp_path / "finanzas.sqlite3")
+    base = ClienteSQLite(ruta)
+    base.collection("cuentas").add({"nombre": "Efectivo", "saldo_inicial": 0})
+
+    entorno = dict(os.environ, FINANZAS_DB="sqlite", FINANZAS_SQLITE=ruta)
+    procesos = [
+        subprocess.Popen([sys.executable, "-c", ALTAS, "25"], cwd=RAIZ, env=entorno)
+        for _ in range(2)
+    ]
+    assert [p.wait(timeout=120) for p in procesos] == [0, 0]
+
+    filas = [d.to_dict() for d in base.collection("transacciones").stream()]
+    ids = sorted(t["id_transaccion"] for t in filas)
+    assert ids == list(range(1, 51))
+
+    cuenta = next(base.collection("cuentas").stream()).to_dict()
+    assert cuenta["saldo_inicial"] == 50 * 1000.0
+    # saldo_en_cuenta sigue el orden de los ids: ninguna alta partió del mismo saldo
+    assert [t["saldo_en_cuenta"] for t in sorted(filas, key=lambda t: t["id_transaccion"])] == [
+        1000.0 * i for i in ids
+    ]
+
+
+def test_transaccion_que_falla_no_escribe(tmp_path):
+    base = ClienteSQLite(str(tmp_path / "finanzas.sqlite3"))
+    ref = base.collection("config").document("prueba")
+
+    @transactional
+    def fallida(transaction):
+        transaction.set(ref, {"valor": 1})
+        raise RuntimeError("falla")
+
+    with pytest.raises(RuntimeError):
+        fallida(base.transaction())
+    assert not ref.get().exists
+    assert not base._conexion.in_transaction
+
+
+def test_resumenes_agrupados_como_desde_transacciones(db, monkeypatch):
+    rnd = random.Random(3)
+    sqlite = ClienteSQLite()
+    monkeypatch.setattr(finanzas, "db", sqlite)
+    saldo = 5000.0
+    filas = []
+    for i in range(1, 201):
+        tipo = rnd.choice(["gasto", "ingreso", "Ingreso"])
+        valor = float(rnd.randint(1, 900) * 100) * (-1 if tipo == "gasto" else 1)
+        fila = {
+            "id_transaccion": i,
+            "fecha": (date(2024, 1, 1) + timedelta(days=i // 3)).isoformat(),
+            "tipo": tipo,
+            "categoria": rnd.choice(["Salario", "Comida", None]),
+            "valor": valor,
+            "saldo_inicial": saldo,
+        }
+        saldo += abs(valor) if tipo.lower() != "gasto" else -abs(valor)
+        filas.append(fila)
+    rnd.shuffle(filas)
+    sqlite.cargar("transacciones", filas)
+
+    with finanzas.app.test_request_context():
+        esperado = finanzas._resumen_diario_desde_transacciones()
+        agrupado = finanzas._resumen_diario_agrupado()
+    assert len(agrupado) == len(esperado)
+    for fila, dia in zip(agrupado, esperado):
+        assert fila.keys() == dia.keys()
+        assert fila["fecha"] == dia["fecha"]
+        for campo in ("ingresos", "gastos", "diferencia", "saldo_inicial", "saldo_final",
+                      "cantidad", "ingresos_por_categoria", "gastos_por_categoria"):
+            assert fila[campo] == pytest.approx(dia[campo])
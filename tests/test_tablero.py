@@ -0,0 +1,77 @@
+from datetime import date, timedelta
+
+import app as finanzas
+
+
+def _registrar(valor):
+    return finanzas.registrar_transaccion(
+        date.today().isoformat(), "prueba", valor, "ingreso", "Efectivo", "Salario"
+    )
+
+
+def _guardado(db):
+    return db.collection("config").document("dashboard_snapshot").get().to_dict()
+
+
+def test_rehacer_no_pisa_un_alta_que_entra_mientras_se_calcula(db, monkeypatch):
+    db.collection("cuentas").add({"nombre": "Efectivo", "saldo_inicial": 0})
+    _registrar(10.0)
+    assert _guardado(db)["total_global"] == 10.0
+
+    calcular = finanzas.calcular_tablero
+    altas = []
+
+    def calcular_con_alta_en_medio(hoy_date):
+        datos = calcular(hoy_date)
+        if not altas:
+            altas.append(_registrar(5.0))  # otra request guarda mientras se calcula
+        return datos
+
+    monkeypatch.setattr(finanzas, "calcular_tablero", calcular_con_alta_en_medio)
+    assert finanzas.rehacer_tablero()["total_global"] == 15.0
+    assert _guardado(db)["total_global"] == 15.0
+
+
+def test_alta_suma_su_delta_al_tablero(db):
+    db.collection("cuentas").add({"nombre": "Efectivo", "saldo_inicial": 0})
+    _registrar(3.0)  # sin tablero de hoy: el alta lo rehace
+    _registrar(7.0)
+    guardado = _guardado(db)
+    assert guardado["total_global"] == 10.0
+    assert guardado["ingresos_hoy"] == 10.0
+
+
+def test_get_no_escribe_el_tablero(db, cliente):
+    db.collection("cuentas").add({"nombre": "Efectivo", "saldo_inicial": 0})
+    escrituras = db.contadores.escrituras
+    assert cliente.get("/").status_code == 200
+    assert cliente.get("/?refrescar=1").status_code == 200
+    assert db.contadores.escrituras == escrituras
+    assert not db.collection("config").document("dashboard_snapshot").get().exists
+
+
+def test_editar_cuenta_rehace_el_tablero_y_pide_sesion(db, cliente):
+    _, ref = db.collection("cuentas").add({"nombre": "Efectivo", "saldo_inicial": 0})
+    anonimo = finanzas.app.test_client()
+    assert anonimo.post(f"/cuentas/editar/{ref.id}", data={"saldo_inicial": "9"}).status_code == 302
+    assert anonimo.post(f"/cuentas/borrar/{ref.id}").status_code == 302
+    assert ref.get().to_dict()["saldo_inicial"] == 0
+
+    cliente.post(f"/cuentas/editar/{ref.id}", data={"saldo_inicial": "$1.500"})
+    assert _guardado(db)["cuentas_dashboard"] == [{"nombre": "Efectivo", "saldo": 1500.0}]
+
+
+def test_alta_atrasada_sin_tablero_lo_rehace_al_terminar_de_reencadenar(db):
+    db.collection("cuentas").add({"nombre": "Efectivo", "saldo_inicial": 0})
+    hoy = date.today()
+    _registrar(10.0)
+    db.collection("config").document("dashboard_snapshot").delete()
+    finanzas.registrar_transaccion(
+        (hoy - timedelta(days=3)).isoformat(), "atrasada", 4.0, "ingreso", "Efectivo", "Salario"
+    )
+    finanzas.hilo_reencadenar.submit(lambda: None).result()
+
+    guardado = _guardado(db)
+    finanzas.cache_lecturas.invalidar("transacciones", "cuentas", "resumen_meses", "saldos_diarios")
+    assert guardado["total_global"] == 14.0
+    assert guardado["valores_linea"] == finanzas.calcular_tablero(hoy)["valores_linea"]